@@ -0,0 +1,95 @@
+'''
+Synthetic content directories for the benchmarks.
+
+The posts look like a real blog's: bodies are Markdown with paragraphs,
+headings, lists, links and code, with sizes drawn from a log-normal
+distribution (a median of about 3 KiB, with the occasional long post), and
+tags follow a Zipf distribution, so a few tags are on most posts and most
+tags are on a few. The same ``count`` and ``seed`` always give the same
+posts.
+'''
+import datetime
+import os
+import random
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua enim ad '
+         'minim veniam quis nostrud exercitation ullamco laboris nisi aliquip '
+         'ex ea commodo consequat duis aute irure in reprehenderit voluptate '
+         'velit esse cillum fugiat nulla pariatur excepteur sint occaecat '
+         'cupidatat non proident sunt culpa qui officia deserunt mollit anim '
+         'id est laborum python static site webhook draft publish').split()
+
+# How many posts have 0, 1, 2, 3 and 4 tags.
+TAG_COUNT_WEIGHTS = (10, 30, 35, 18, 7)
+
+
+def make_corpus(content_dir, count, *, seed=0):
+    '''
+    Write ``count`` posts to ``content_dir``.
+    '''
+    rng = random.Random(seed)
+    tags = ['tag{}'.format(i) for i in range(max(20, count // 25))]
+    tag_weights = [1 / rank**1.1 for rank in range(1, len(tags)+1)]
+    start = datetime.datetime(2010, 8, 14)
+    os.makedirs(content_dir, exist_ok=True)
+    for i in range(count):
+        date = start + datetime.timedelta(hours=i*7, minutes=rng.randrange(60))
+        tag_count = rng.choices(range(len(TAG_COUNT_WEIGHTS)),
+                                TAG_COUNT_WEIGHTS)[0]
+        post_tags = sorted(set(rng.choices(tags, tag_weights, k=tag_count)))
+        headers = ['Title: {} {}'.format(_sentence(rng, 3, 8).rstrip('.'), i),
+                   'Date: {:%Y-%m-%d %H:%M}'.format(date),
+                   'Author: author{}@example.com'.format(rng.randrange(5))]
+        if post_tags:
+            headers.append('Tags: ' + ', '.join(post_tags))
+        path = os.path.join(content_dir, 'post-{}.md'.format(i))
+        with open(path, 'w') as f:
+            f.write('\n'.join(headers) + '\n\n' + make_body(rng))
+
+
+def ensure_corpus(root, count, *, seed=0):
+    '''
+    Return the path of a corpus of ``count`` posts under ``root``, making it
+    if it doesn't exist yet.
+    '''
+    content_dir = os.path.join(root, 'posts-{}-{}'.format(count, seed))
+    marker = os.path.join(content_dir, '.complete')
+    if not os.path.exists(marker):
+        make_corpus(content_dir, count, seed=seed)
+        open(marker, 'w').close()
+    return content_dir
+
+
+def make_body(rng):
+    '''
+    Return a Markdown body about as long as a typical post.
+    '''
+    size = min(64 * 1024, max(200, int(rng.lognormvariate(8, 0.8))))
+    blocks = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            block = '## ' + _sentence(rng, 2, 6).rstrip('.')
+        elif kind < 0.2:
+            block = '\n'.join('- ' + _sentence(rng, 3, 10)
+                              for _ in range(rng.randrange(2, 6)))
+        elif kind < 0.27:
+            block = '\n'.join('    ' + ' '.join(rng.choices(WORDS, k=6))
+                              for _ in range(rng.randrange(2, 8)))
+        else:
+            block = ' '.join(_sentence(rng, 6, 20)
+                             for _ in range(rng.randrange(2, 7)))
+            if rng.random() < 0.3:
+                block += ' See [{0}](http://example.com/{0}) for *more*.'.format(
+                    rng.choice(WORDS)
+                )
+        blocks.append(block)
+        length += len(block) + 2
+    return '\n\n'.join(blocks) + '\n'
+
+
+def _sentence(rng, shortest, longest):
+    words = rng.choices(WORDS, k=rng.randrange(shortest, longest+1))
+    return ' '.join(words).capitalize() + '.'
@@ -0,0 +1,79 @@
+'''
+Micro-benchmark for parsing post files.
+
+Writes ``--posts`` synthetic posts to a temporary directory and reports how
+many posts per second each way of reading them manages:
+
+- ``Post``: read the whole file and parse the headers and dates.
+- ``read_headers``: read only the header block and build a ``PostMeta``.
+- ``load_posts(lazy=True)``: the whole directory scan used by the index.
+
+Run it with ``python benchmarks/parse_posts.py``.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slipstream import config, core  # noqa: E402
+
+
+def make_corpus(content_dir, count, body_size):
+    body = ('All work and no play makes Jack a dull boy. ' * 20 + '\n\n')
+    body = (body * (body_size // len(body) + 1))[:body_size]
+    for i in range(count):
+        with open(os.path.join(content_dir, 'post-{}.md'.format(i)), 'w') as f:
+            f.write('Title: Post {0}\n'
+                    'Date: 2010-{1:02}-{2:02} {3:02}:{4:02}\n'
+                    'Author: fnord@example.com\n'
+                    'Tags: tag{5}, tag{6}\n'
+                    '\n{7}'.format(i, i % 12 + 1, i % 28 + 1, i % 24, i % 60,
+                                   i % 10, i % 7, body))
+
+
+def bench(name, func, count, repeat):
+    best = min(_time(func) for _ in range(repeat))
+    print('{:<24} {:>10.0f} posts/s'.format(name, count / best))
+
+
+def _time(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--body-size', type=int, default=8192,
+                        help='bytes of Markdown in each post')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    config.setdefault('DEFAULT_AUTHOR', 'fnord@example.com')
+
+    with tempfile.TemporaryDirectory() as content_dir:
+        make_corpus(content_dir, args.posts, args.body_size)
+        paths = [entry.path for entry in os.scandir(content_dir)]
+
+        def full():
+            for path in paths:
+                with open(path) as f:
+                    core.Post(f.read())
+
+        def headers():
+            for path in paths:
+                core.PostMeta.from_headers(core.read_headers(path), path=path)
+
+        def scan():
+            core.load_posts(content_dir=content_dir, lazy=True)
+
+        bench('Post', full, args.posts, args.repeat)
+        bench('read_headers', headers, args.posts, args.repeat)
+        bench('load_posts(lazy=True)', scan, args.posts, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''
+Throughput of the Markdown renderers.
+
+Renders the bodies of a synthetic corpus of posts (see ``corpus.py``) with
+every installed backend of ``slipstream.markdown``, and reports how many MB
+of Markdown each one renders per second, at best over ``--repeat`` runs.
+It also counts the posts where a backend's HTML isn't the same as the
+default's, as ``markdown.canonical`` compares them, and exits with an error
+if there are any.
+
+Run it from the top of the repository::
+
+    $ python benchmarks/renderers.py --size 1000
+    renderer          MB/s    posts   differ
+    commonmark        2.08     1000        0
+    cmark            71.95     1000        0
+    markdown-it       1.00     1000        0
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import corpus
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slipstream import markdown  # noqa: E402
+
+
+def read_bodies(content_dir):
+    bodies = []
+    for name in sorted(os.listdir(content_dir)):
+        if name.endswith('.md'):
+            with open(os.path.join(content_dir, name)) as f:
+                bodies.append(f.read().split('\n\n', 1)[-1])
+    return bodies
+
+
+def throughput(renderer, bodies, repeat):
+    '''
+    Return the MB of ``bodies`` that ``renderer`` renders per second, and
+    the HTML it rendered.
+    '''
+    size = sum(len(body.encode()) for body in bodies)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html = [renderer.render(body) for body in bodies]
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return size / best / 1e6, html
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--size', type=int, default=1000,
+                        help='how many posts to render')
+    parser.add_argument('--only', nargs='+', choices=list(markdown.BACKENDS),
+                        default=list(markdown.BACKENDS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--corpus-dir',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'slipstream-corpora'))
+    args = parser.parse_args()
+
+    bodies = read_bodies(corpus.ensure_corpus(args.corpus_dir, args.size))
+    expected = [markdown.canonical(markdown.get(markdown.DEFAULT).render(body))
+                for body in bodies]
+    print('{:<14} {:>7} {:>8} {:>8}'.format('renderer', 'MB/s', 'posts',
+                                            'differ'))
+    different = 0
+    for name in args.only:
+        try:
+            renderer = markdown.BACKENDS[name]()
+        except ImportError as e:
+            print('{:<14} {:>7}   ({})'.format(name, 'skipped', e))
+            continue
+        rate, html = throughput(renderer, bodies, args.repeat)
+        differ = sum(markdown.canonical(page) != canonical
+                     for page, canonical in zip(html, expected))
+        different += differ
+        print('{:<14} {:>7.2f} {:>8} {:>8}'.format(name, rate, len(bodies),
+                                                   differ))
+    return 1 if different else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+'''
+Benchmarks for the build pipeline.
+
+Each benchmark is timed against synthetic content directories (see
+``corpus.py``) of each of the ``--sizes``. The corpora are generated once
+into ``--corpus-dir`` and copied to a scratch directory for every size, so
+that publishing doesn't change them.
+
+Every benchmark runs with the settings that ``settings.load`` ships, with
+the caches in the scratch directory, so the post cache, the render store,
+compression and the search index are all on. ``--disable`` turns some of
+them off, to see what they cost or save.
+
+- ``load_posts``: parse every post, without the post cache.
+- ``load_posts_cached``: the same, with a warm ``POST_CACHE``.
+- ``load_index``: build the ``PostIndex`` from the post headers.
+- ``post_content``: render the Markdown of up to 500 posts, with a cold
+  render cache and no render store.
+- ``generate_index``: every page of the index, when nothing has changed.
+- ``generate_tag_page``: every page of the most used tag.
+- ``regenerate``: the whole site into an empty output directory.
+- ``publish``: post an edit to the webhook and publish it from the queue.
+- ``regenerate_from_render_store``: ``regenerate`` in a cold process, with
+  the pages already in a ``RENDER_STORE`` filled by another.
+
+Run it from the top of the repository, and save the results to compare
+them with another commit's::
+
+    $ python benchmarks/run.py --sizes 100 1000 --save
+    $ git checkout other-branch
+    $ python benchmarks/run.py --sizes 100 1000 \\
+        --compare benchmarks/results/<commit>.json
+    $ python benchmarks/run.py --sizes 1000 --disable post-cache search
+'''
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus
+
+os.environ.setdefault('SLIPSTREAM_API_KEY', 'benchmark')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slipstream import config, core, settings  # noqa: E402
+from slipstream import slipstream  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'results')
+
+BENCHMARKS = collections.OrderedDict()
+
+# What ``--disable`` sets for each feature.
+FEATURES = collections.OrderedDict([
+    ('post-cache', {'POST_CACHE': None}),
+    ('render-store', {'RENDER_STORE': None}),
+    ('compress', {'COMPRESS': []}),
+    ('search', {'SEARCH': False}),
+])
+
+
+def benchmark(func):
+    '''
+    Register ``func(site)`` as a benchmark. It does any setup and returns
+    the function to time, or ``None`` to skip this size.
+    '''
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+class Site:
+    def __init__(self, content_dir, output_dir, count):
+        self.content_dir = content_dir
+        self.output_dir = output_dir
+        self.count = count
+
+
+@benchmark
+def load_posts(site):
+    config['POST_CACHE'] = None
+    return lambda: core.load_posts(content_dir=site.content_dir)
+
+
+@benchmark
+def load_posts_cached(site):
+    config['POST_CACHE'] = os.path.join(site.output_dir, '.cache.sqlite')
+    core.load_posts(content_dir=site.content_dir)
+    return lambda: core.load_posts(content_dir=site.content_dir)
+
+
+@benchmark
+def load_index(site):
+    return lambda: core.load_index(site.content_dir)
+
+
+@benchmark
+def post_content(site):
+    config['POST_CACHE'] = None
+    config['RENDER_STORE'] = None
+    posts = core.load_posts(content_dir=site.content_dir)[:500]
+
+    def render():
+        core.markdown_cache.clear()
+        for post in posts:
+            post._rendered = None
+            post.content
+    return render
+
+
+@benchmark
+def generate_index(site):
+    index = core.load_index(site.content_dir)
+    core.generate_index(content_dir=site.content_dir,
+                        output_dir=site.output_dir, index=index)
+    return lambda: core.generate_index(content_dir=site.content_dir,
+                                       output_dir=site.output_dir,
+                                       index=index)
+
+
+@benchmark
+def generate_tag_page(site):
+    index = core.load_index(site.content_dir)
+    if not index.tags:
+        return None
+    tag = max(index.tags, key=lambda tag: len(index.tagged(tag)))
+    return lambda: core.generate_tag_page(tag=tag,
+                                          content_dir=site.content_dir,
+                                          output_dir=site.output_dir,
+                                          index=index)
+
+
+@benchmark
+def regenerate(site):
+    output_dir = os.path.join(site.output_dir, 'regenerate')
+
+    def build():
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+        core.regenerate(content_dir=site.content_dir, output_dir=output_dir)
+    return build
+
+
+@benchmark
+def publish(site):
+    core.regenerate(content_dir=site.content_dir, output_dir=site.output_dir)
+    client = slipstream.app.test_client()
+    queue = slipstream.get_publish_queue()
+    edits = iter(range(sys.maxsize))
+
+    def publish_edit():
+        payload = {'id': 1,
+                   'name': 'Benchmark post',
+                   'content': 'Edit number {}'.format(next(edits)),
+                   'user': {'email': 'author@example.com'},
+                   }
+        response = client.post('/' + slipstream.api_key(),
+                               data={'payload': json.dumps(payload)})
+        assert response.status_code == 202, response.status_code
+        assert queue.drain() == 1
+    return publish_edit
+
+
+@benchmark
+def regenerate_from_render_store(site):
+    if not config.get('RENDER_STORE'):
+        return None
+    output_dir = os.path.join(site.output_dir, 'from-render-store')
+    core.regenerate(content_dir=site.content_dir, output_dir=site.output_dir)
+
+    def build():
+        core.markdown_cache.clear()
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+        core.regenerate(content_dir=site.content_dir, output_dir=output_dir)
+    return build
+
+
+def run(name, site, repeat, *, workers, disable):
+    configure(site, workers=workers, disable=disable)
+    func = BENCHMARKS[name](site)
+    if func is None:
+        return None
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times)}
+
+
+def configure(site, *, workers, disable=()):
+    '''
+    Configure ``site`` with the default settings, or the ``SLIPSTREAM_*``
+    environment variables, with ``workers`` and without the ``FEATURES``
+    named in ``disable``.
+    '''
+    environ = dict(os.environ,
+                   SLIPSTREAM_CONTENT_DIR=site.content_dir,
+                   SLIPSTREAM_OUTPUT_DIR=site.output_dir,
+                   SLIPSTREAM_DEFAULT_AUTHOR='author@example.com',
+                   SLIPSTREAM_WORKERS=str(workers))
+    config.clear()
+    site_settings = settings.configure(environ)
+    for feature in disable:
+        config.update(FEATURES[feature])
+    slipstream.app.config.update(site_settings,
+                                 PUBLISH_QUEUE=':memory:',
+                                 PUBLISH_DELAY=0)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, path):
+    with open(path) as f:
+        baseline = json.load(f)
+    print('\nCompared to {} ({}):'.format(baseline['revision'], path))
+    print('{:<20} {:>7} {:>11} {:>11} {:>8}'.format('benchmark', 'posts',
+                                                  'before', 'after',
+                                                  'speedup'))
+    for name, sizes in results.items():
+        for size, result in sizes.items():
+            old = baseline['results'].get(name, {}).get(size)
+            if old is None or result is None:
+                continue
+            print('{:<20} {:>7} {:>10.4f}s {:>10.4f}s {:>7.2f}x'.format(
+                name, size, old['min'], result['min'],
+                old['min'] / result['min'],
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000],
+                        help='post counts, e.g. 100 1000 10000 50000')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--disable', nargs='+', choices=list(FEATURES),
+                        default=[], metavar='FEATURE',
+                        help='turn off some of: ' + ', '.join(FEATURES))
+    parser.add_argument('--corpus-dir',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'slipstream-corpora'))
+    parser.add_argument('--save', action='store_true',
+                        help='save the results in ' + RESULTS_DIR)
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='compare with saved results')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = collections.OrderedDict((name, {}) for name in args.only)
+    for size in args.sizes:
+        source = corpus.ensure_corpus(args.corpus_dir, size)
+        with tempfile.TemporaryDirectory() as scratch:
+            content_dir = os.path.join(scratch, 'content')
+            output_dir = os.path.join(scratch, 'output')
+            shutil.copytree(source, content_dir)
+            os.makedirs(output_dir)
+            site = Site(content_dir, output_dir, size)
+            for name in args.only:
+                result = run(name, site, args.repeat, workers=args.workers,
+                             disable=args.disable)
+                results[name][str(size)] = result
+                if result is None:
+                    print('{:<20} {:>7} {:>11}'.format(name, size, 'skipped'))
+                else:
+                    print('{:<20} {:>7} {:>10.4f}s {:>10.4f}s'.format(
+                        name, size, result['min'], result['median'],
+                    ))
+
+    revision = git_revision()
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, revision + '.json')
+        with open(path, 'w') as f:
+            json.dump({'revision': revision,
+                       'date': datetime.datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'workers': args.workers,
+                       'disabled': args.disable,
+                       'repeat': args.repeat,
+                       'results': results,
+                       }, f, indent=2)
+        print('Saved results to', path)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -42,7 +42,7 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'slipstream = slipstream.slipstream:run',
+            'slipstream = slipstream.cli:main',
             'slipstream-vortex = slipstream.vortex:run',
         ],
     },
@@ -51,6 +51,12 @@ setup(
     include_package_data=True,
     install_requires=['flask', 'flask-login', 'commonmark', 'tornado',
     ],
+    extras_require={
+        'watch': ['inotify_simple'],
+        'brotli': ['brotli'],
+        'cmark': ['cmarkgfm'],
+        'markdown-it': ['markdown-it-py'],
+    },
     license="GPLv3",
     zip_safe=False,
     keywords='draft flask blog publish static-site',
@@ -0,0 +1,221 @@
+'''
+Batch builds of the whole site, or of parts of it.
+
+``build`` renders the same pages as ``core.regenerate``, but can be limited
+to some of the ``PARTS`` of the site. With ``incremental``, it only renders
+what changed since the last full build. The manifest
+``output_dir/.slipstream_build.json`` records the file, size, modification
+time, date and tags of each post as of that build. When a post's file
+changes, its page is rendered again, along with the index and tag pages it
+moved in, the feeds and the shards of the search index that its terms are
+in. When a post's file is removed, its page is removed too. When the theme,
+the settings that affect the pages or ``core.cache_version()`` change,
+everything is rendered again.
+'''
+import collections
+import functools
+import json
+import logging
+import os
+from datetime import datetime
+
+from . import config
+from . import core
+from . import metrics
+from .cache import RenderStore
+
+logger = logging.getLogger(__name__)
+
+PARTS = ('post', 'index', 'tags', 'feeds', 'search')
+
+MANIFEST = '.slipstream_build.json'
+
+# The settings that change the pages, besides the theme.
+PAGE_SETTINGS = ('BLOG_NAME', 'COMPRESS', 'DEFAULT_AUTHOR', 'EXCERPTS',
+                 'FEED_SIZE', 'PAGE_SIZE', 'SEARCH', 'SITE_URL')
+
+# Just enough of a post to lay out the listings it was in.
+_Listed = collections.namedtuple('_Listed', 'slug publish_timestamp tags')
+
+
+class Manifest:
+    '''
+    The posts of a site as of a build: ``posts`` maps each slug to a dict
+    of the post's ``stamp`` (from ``stamp``), ``date`` and ``tags``.
+    ``fingerprint`` is ``fingerprint()`` at the time.
+    '''
+    def __init__(self, *, fingerprint, posts):
+        self.fingerprint = fingerprint
+        self.posts = posts
+
+    @classmethod
+    def of(cls, index, stamps, fingerprint):
+        '''
+        Return the manifest of the posts in ``index``, whose files have the
+        ``stamps`` mapped by slug.
+        '''
+        return cls(fingerprint=fingerprint, posts={
+            post.slug: {'stamp': stamps[post.slug],
+                        'date': list(post.publish_timestamp.timetuple()[:6])
+                                + [post.publish_timestamp.microsecond],
+                        'tags': list(post.tags),
+                        }
+            for post in index.posts
+        })
+
+    @classmethod
+    def load(cls, output_dir):
+        '''
+        Return the manifest saved in ``output_dir``, or ``None`` if there
+        isn't a readable one.
+        '''
+        try:
+            with open(os.path.join(output_dir, MANIFEST)) as f:
+                data = json.load(f)
+            return cls(fingerprint=data['fingerprint'], posts=data['posts'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.info('No build manifest in %r: %s', output_dir, e)
+            return None
+
+    def save(self, output_dir):
+        core.write_atomically(
+            os.path.join(output_dir, MANIFEST),
+            lambda f: json.dump({'fingerprint': self.fingerprint,
+                                 'posts': self.posts}, f),
+            phase='write',
+        )
+
+    def index(self):
+        '''
+        Return a ``PostIndex`` of the posts as they were listed.
+        '''
+        return core.PostIndex(_Listed(slug, datetime(*post['date']),
+                                      tuple(post['tags']))
+                              for slug, post in self.posts.items())
+
+
+def stamp(path):
+    '''
+    Return the ``[path, mtime_ns, size]`` of the file at ``path``.
+    '''
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+
+
+def fingerprint():
+    '''
+    Return a digest of everything besides the posts that the pages depend
+    on: the theme, the post template, ``PAGE_SETTINGS`` and
+    ``core.cache_version()``.
+    '''
+    return RenderStore.key(
+        core.cache_version(),
+        core.theme_fingerprint(),
+        str(core._template_name(config.get('POST_TEMPLATE'))),
+        repr([(name, config.get(name)) for name in PAGE_SETTINGS]),
+    )
+
+
+def build(*, content_dir, output_dir, workers=None, incremental=False,
+          only=PARTS):
+    '''
+    Render the ``only`` parts of the site from ``content_dir`` into
+    ``output_dir``, over ``workers`` processes (``config['WORKERS']`` by
+    default), and return a ``BuildReport``. If ``incremental``, only render
+    what changed since the last build of every part.
+    '''
+    if workers is None:
+        workers = config.get('WORKERS', 1)
+    os.makedirs(output_dir, exist_ok=True)
+
+    with metrics.build('build', output_dir=output_dir, only=','.join(only),
+                       incremental=incremental), \
+            core.compressing(), core.post_cache(content_dir), \
+            core.fixed_theme() as theme:
+        report = core.BuildReport()
+        current = fingerprint()
+        manifest = Manifest.load(output_dir) if incremental else None
+        if manifest is not None and manifest.fingerprint != current:
+            logger.info('The theme or settings changed, building everything')
+            manifest = None
+
+        with core.worker_pool(workers) as executor:
+            index = core.load_index(content_dir, executor=executor)
+            stamps = {post.slug: stamp(post.path) for post in index.posts}
+            if manifest is None:
+                touched = None
+                removed = set()
+                old_index = core.PostIndex()
+                posts = index.posts
+            else:
+                changed = {slug for slug, post_stamp in stamps.items()
+                           if manifest.posts.get(slug, {}).get('stamp')
+                           != post_stamp}
+                removed = set(manifest.posts) - set(stamps)
+                logger.info('%d posts changed and %d removed since the last'
+                            ' build', len(changed), len(removed))
+                touched = changed | removed
+                old_index = manifest.index()
+                posts = [index.get(slug) for slug in sorted(changed)]
+
+            if 'post' in only:
+                for post_report in core._map(
+                        executor,
+                        functools.partial(core._generate_post_page,
+                                          output_dir=output_dir,
+                                          theme=theme),
+                        posts):
+                    report += post_report
+                for slug in sorted(removed):
+                    core._remove_post_page(output_dir, slug)
+
+        if 'index' in only:
+            report += core.generate_index(
+                content_dir=content_dir, output_dir=output_dir, index=index,
+                pages=_pages(old_index.posts, index.posts, touched),
+            )
+
+        if 'tags' in only:
+            for tag in sorted(set(index.tags) | set(old_index.tags)):
+                pages = _pages(old_index.tagged(tag), index.tagged(tag),
+                               touched)
+                if pages == []:
+                    continue
+                report += core.generate_tag_page(tag=tag,
+                                                 content_dir=content_dir,
+                                                 output_dir=output_dir,
+                                                 index=index,
+                                                 pages=pages)
+
+        if 'feeds' in only and touched != set():
+            core.generate_rss(content_dir=content_dir, output_dir=output_dir,
+                              index=index)
+            core.generate_atom(content_dir=content_dir,
+                               output_dir=output_dir, index=index)
+
+        if 'search' in only and touched != set():
+            if touched is None:
+                core.generate_search_index(output_dir=output_dir, index=index)
+            else:
+                core.generate_search_index(
+                    output_dir=output_dir, index=index,
+                    posts=[post.load() for post in posts],
+                    removed=sorted(removed),
+                )
+
+        if set(only) == set(PARTS):
+            Manifest.of(index, stamps, current).save(output_dir)
+        core.prune_render_store()
+
+    return report
+
+
+def _pages(old_posts, new_posts, touched):
+    '''
+    Return the pages of a listing to render: all of them (``None``) if
+    ``touched`` is ``None``, or the pages that the ``touched`` slugs
+    changed.
+    '''
+    if touched is None:
+        return None
+    return core.changed_listing_pages(old_posts, new_posts, touched)
@@ -0,0 +1,321 @@
+'''
+A persistent cache of parsed posts.
+
+Every scan of ``CONTENT_DIR`` used to read, split and date-parse every post,
+even when nothing had changed on disk. The cache keeps the parsed headers,
+the body and the rendered HTML of each file in a small sqlite database,
+keyed by the file's name and checked against the ``mtime``/``size`` that
+``os.scandir`` already gives us. If those differ, the file's SHA-1 is
+compared before giving up and parsing it again, so a ``touch`` doesn't
+invalidate anything.
+
+The whole cache is dropped when ``version`` changes. Callers should include
+anything that affects what is stored in it, e.g. the file format and the
+Markdown renderer.
+
+``RenderStore`` is a content-addressed cache of rendered HTML in a plain
+directory, meant to live on the volume that every ``slipstream`` process
+shares, so that HTML rendered by one process is reused by all the others
+and by the next cold start.
+'''
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class CachedPost:
+    '''
+    A cache row: the parsed ``headers``, ``body`` and ``html`` of a post,
+    along with its ``publish_timestamp`` and ``update_timestamp`` (``None``
+    if the corresponding header was missing).
+    '''
+    def __init__(self, headers, body, html, publish_timestamp,
+                 update_timestamp):
+        self.headers = headers
+        self.body = body
+        self.html = html
+        self.publish_timestamp = publish_timestamp
+        self.update_timestamp = update_timestamp
+
+
+def _dump_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    return list(timestamp.timetuple()[:6]) + [timestamp.microsecond]
+
+
+def _load_timestamp(parts):
+    if parts is None:
+        return None
+    return datetime(*parts)
+
+
+class PostCache:
+    '''
+    Cache of posts found in ``content_dir``, stored in the sqlite database at
+    ``path``. Use it as a context manager, so that changes are committed and
+    the connection is closed when done:
+
+    ::
+        with PostCache(path, content_dir=content_dir, version='1') as cache:
+            for entry in os.scandir(content_dir):
+                cached = cache.get(entry)
+                if cached is None:
+                    cache.put(entry, text, CachedPost(...))
+            cache.prune()
+    '''
+    def __init__(self, path, *, content_dir, version):
+        self.path = path
+        self.content_dir = content_dir
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._seen = set()
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._setup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        self._conn.close()
+
+    def commit(self):
+        '''
+        Commit the changes so far, without closing the connection.
+        '''
+        self._conn.commit()
+
+    def _setup(self):
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                               ' key TEXT PRIMARY KEY, value TEXT)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS posts ('
+                               ' content_dir TEXT, name TEXT,'
+                               ' mtime_ns INTEGER, size INTEGER, sha1 TEXT,'
+                               ' meta TEXT, body TEXT, html TEXT,'
+                               ' PRIMARY KEY (content_dir, name))')
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?',
+                                     ('version',)).fetchone()
+            if row is None or row[0] != self.version:
+                logger.info('Post cache version changed from %r to %r,'
+                            ' clearing %r', row and row[0], self.version,
+                            self.path)
+                self._conn.execute('DELETE FROM posts')
+                self._conn.execute('INSERT OR REPLACE INTO meta (key, value)'
+                                   ' VALUES (?, ?)', ('version', self.version))
+
+    def get(self, entry):
+        '''
+        Return the ``CachedPost`` for the ``os.DirEntry`` ``entry``, or
+        ``None`` if it is not in the cache or the file has changed since it
+        was cached.
+        '''
+        return self._get(entry.name, entry.path, entry.stat)
+
+    def lookup(self, path):
+        '''
+        Like ``get``, for the file at ``path`` in ``content_dir``.
+        '''
+        return self._get(os.path.basename(path), path,
+                         lambda: os.stat(path))
+
+    def _get(self, name, path, get_stat):
+        self._seen.add(name)
+        row = self._conn.execute('SELECT mtime_ns, size, sha1, meta, body,'
+                                 ' html FROM posts'
+                                 ' WHERE content_dir = ? AND name = ?',
+                                 (self.content_dir, name)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        mtime_ns, size, sha1, meta, body, html = row
+        stat = get_stat()
+        if (stat.st_mtime_ns, stat.st_size) != (mtime_ns, size):
+            with open(path) as f:
+                if hashlib.sha1(f.read().encode()).hexdigest() != sha1:
+                    self.misses += 1
+                    return None
+            self._conn.execute('UPDATE posts SET mtime_ns = ?, size = ?'
+                               ' WHERE content_dir = ? AND name = ?',
+                               (stat.st_mtime_ns, stat.st_size,
+                                self.content_dir, name))
+
+        self.hits += 1
+        meta = json.loads(meta)
+        return CachedPost(headers=meta['headers'],
+                          body=body,
+                          html=html,
+                          publish_timestamp=_load_timestamp(meta['date']),
+                          update_timestamp=_load_timestamp(meta['updated']),
+                          )
+
+    def put(self, entry, text, cached):
+        '''
+        Store the ``CachedPost`` ``cached``, parsed from ``text``, the
+        contents of the file at ``entry``.
+        '''
+        self._seen.add(entry.name)
+        stat = entry.stat()
+        meta = {'headers': cached.headers,
+                'date': _dump_timestamp(cached.publish_timestamp),
+                'updated': _dump_timestamp(cached.update_timestamp),
+                }
+        self._conn.execute('INSERT OR REPLACE INTO posts (content_dir, name,'
+                           ' mtime_ns, size, sha1, meta, body, html)'
+                           ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           (self.content_dir, entry.name,
+                            stat.st_mtime_ns, stat.st_size,
+                            hashlib.sha1(text.encode()).hexdigest(),
+                            json.dumps(meta), cached.body, cached.html))
+
+    def prune(self):
+        '''
+        Remove the cache rows for files that were not seen by ``get`` or
+        ``put``, i.e. posts that have been deleted from ``content_dir``. Only
+        call this after every post in ``content_dir`` has been looked up.
+        '''
+        names = [row[0] for row in
+                 self._conn.execute('SELECT name FROM posts'
+                                    ' WHERE content_dir = ?',
+                                    (self.content_dir,))]
+        stale = [(self.content_dir, name)
+                 for name in names if name not in self._seen]
+        if stale:
+            logger.debug('Pruning %d deleted posts from the cache',
+                         len(stale))
+            self._conn.executemany('DELETE FROM posts'
+                                   ' WHERE content_dir = ? AND name = ?',
+                                   stale)
+
+
+class RenderStore:
+    '''
+    Rendered HTML stored in ``directory``, one file per entry, named by
+    its ``key``. The key is a digest of everything that went into the HTML,
+    so entries never go stale and never need to be invalidated: a change to
+    the input just makes a new key.
+
+    Entries are written to a temporary file and renamed into place, so
+    processes sharing ``directory`` see either a whole entry or none, and
+    two processes storing the same key just store the same HTML twice.
+    Errors reading or writing the directory are logged and treated as
+    misses, so a broken cache never breaks a build.
+
+    Every hit touches its entry, and ``prune`` removes the entries that no
+    process has used for a while, so the entries of old themes and old
+    versions of posts don't pile up forever.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def key(*parts):
+        '''
+        Return the key of the entry rendered from the strings ``parts``.
+        '''
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part.encode('utf-8')
+            digest.update(str(len(data)).encode() + b':' + data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        '''
+        Return the HTML stored under ``key``, or ``None``.
+        '''
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                html = f.read()
+                _touch(f)
+                return html
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning('Unable to read %r from the render store: %s',
+                           key, e)
+            return None
+
+    def put(self, key, html):
+        '''
+        Store ``html`` under ``key``.
+        '''
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                             prefix='.', suffix='.tmp')
+        except OSError as e:
+            logger.warning('Unable to write %r to the render store: %s',
+                           key, e)
+            return
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning('Unable to write %r to the render store: %s',
+                           key, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def prune(self, max_age):
+        '''
+        Remove the entries that weren't stored or used in the last
+        ``max_age`` seconds, and the temporary files left over from writes
+        that long ago, and return how many were removed.
+        '''
+        cutoff = time.time() - max_age
+        removed = 0
+        try:
+            subdirs = [entry.path for entry in os.scandir(self.directory)
+                       if entry.is_dir() and len(entry.name) == 2]
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning('Unable to prune the render store: %s', e)
+            return 0
+        for subdir in subdirs:
+            try:
+                with os.scandir(subdir) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.stat().st_mtime < cutoff:
+                                os.remove(entry.path)
+                                removed += 1
+                        except FileNotFoundError:
+                            # Another process pruned it first.
+                            continue
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning('Unable to prune %r from the render store:'
+                               ' %s', subdir, e)
+        return removed
+
+
+def _touch(f):
+    # Another process may own the entry, or the store may be read-only, in
+    # which case the entry just ages as if it weren't used.
+    try:
+        os.utime(f.fileno())
+    except OSError:
+        pass
@@ -0,0 +1,121 @@
+'''
+The ``slipstream`` command.
+
+``slipstream build`` builds the site and exits, for CI and cron jobs. It
+only imports what the build needs: not Flask or Tornado, and it doesn't
+create an API key. ``slipstream serve``, or just ``slipstream``, serves the
+webhook and preview with Flask like it always has.
+
+::
+
+    $ slipstream build --jobs 8 --incremental
+    Built /blog/output in 1.92s: 41 pages rendered, 3 written, 38 skipped
+      build        1.921s       1 calls
+      scan         0.714s       1 calls
+      ...
+'''
+import argparse
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import time
+
+from . import build
+from . import metrics
+from . import settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='slipstream',
+        description='Publish a static blog from Draft webhooks.',
+    )
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('serve', help='serve the webhook and preview'
+                                      ' (the default)')
+    build_parser = commands.add_parser(
+        'build', help='build the site and exit',
+        description='Build the site from SLIPSTREAM_CONTENT_DIR into'
+                    ' SLIPSTREAM_OUTPUT_DIR, configured by the same'
+                    ' SLIPSTREAM_* variables as the server.',
+    )
+    build_parser.add_argument('--content-dir',
+                              help='default: $SLIPSTREAM_CONTENT_DIR')
+    build_parser.add_argument('--output-dir',
+                              help='default: $SLIPSTREAM_OUTPUT_DIR')
+    build_parser.add_argument('-j', '--jobs', type=int,
+                              help='worker processes (default:'
+                                   ' $SLIPSTREAM_WORKERS, or one per CPU)')
+    build_parser.add_argument('--incremental', action='store_true',
+                              help='only render what changed since the'
+                                   ' last build')
+    build_parser.add_argument('--only', nargs='+', choices=build.PARTS,
+                              default=list(build.PARTS), metavar='PART',
+                              help='only build these parts: '
+                                   + ', '.join(build.PARTS))
+    build_parser.add_argument('--profile', nargs='?', const='-',
+                              metavar='FILE',
+                              help='profile this process, and print the'
+                                   ' slowest calls or save the stats to'
+                                   ' FILE (use --jobs 1 to include'
+                                   ' rendering)')
+    build_parser.add_argument('-v', '--verbose', action='store_true',
+                              help='log what is built')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        return _build(args)
+    # The web server, and the API key it needs, are only loaded to serve.
+    from . import slipstream
+    slipstream.run()
+
+
+def _build(args):
+    logging.basicConfig(level=logging.INFO if args.verbose else
+                        logging.WARNING)
+    environ = dict(os.environ)
+    if args.content_dir:
+        environ['SLIPSTREAM_CONTENT_DIR'] = args.content_dir
+    if args.output_dir:
+        environ['SLIPSTREAM_OUTPUT_DIR'] = args.output_dir
+    if args.jobs:
+        environ['SLIPSTREAM_WORKERS'] = str(args.jobs)
+    site = settings.configure(environ)
+
+    profiler = cProfile.Profile() if args.profile else None
+    with metrics.tally() as tally:
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        report = build.build(content_dir=site['CONTENT_DIR'],
+                             output_dir=site['OUTPUT_DIR'],
+                             workers=site['WORKERS'],
+                             incremental=args.incremental,
+                             only=args.only)
+        if profiler is not None:
+            profiler.disable()
+        seconds = time.perf_counter() - start
+
+    print('Built {} in {:.2f}s: {}'.format(site['OUTPUT_DIR'], seconds,
+                                          report))
+    for phase, (count, total) in sorted(tally.phases.items(),
+                                        key=lambda item: -item[1][1]):
+        print('  {:<12} {:>8.3f}s {:>7} calls'.format(phase, total, count))
+    counters = ['{}={}'.format(name, tally.counters[name])
+                for name in metrics.COUNTERS if tally.counters[name]]
+    if counters:
+        print('  ' + ' '.join(counters))
+
+    if args.profile == '-':
+        pstats.Stats(profiler, stream=sys.stdout) \
+            .sort_stats('cumulative').print_stats(25)
+    elif args.profile:
+        profiler.dump_stats(args.profile)
+        print('Saved the profile to', args.profile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
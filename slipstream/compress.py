@@ -0,0 +1,132 @@
+'''
+Precompressed copies of generated pages.
+
+nginx compresses ``index.html`` and the tag pages again on every request
+unless it finds an already compressed sibling: ``index.html.gz`` for
+``gzip_static on;`` and ``index.html.br`` for ``brotli_static on;`` (from
+the ``ngx_brotli`` module). ``compress`` writes those siblings. Brotli needs
+the optional ``brotli`` package (``pip install slipstream[brotli]``).
+
+Every sibling is written atomically and gets the modification time of its
+page, so ``is_current`` can tell whether it matches the page without
+reading either of them.
+'''
+import gzip
+import io
+import logging
+import os
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+# Only text is worth compressing; images and the like already are.
+COMPRESSIBLE = ('.html', '.xml', '.json')
+
+GZIP_LEVEL = 9
+
+BROTLI_QUALITY = 11
+
+_warned = set()
+
+
+def formats(requested):
+    '''
+    Return a tuple of the formats in ``requested``, a list of names such as
+    ``['gzip', 'br']``, that can be written, warning once about each one
+    that can't.
+    '''
+    available = []
+    for name in requested or ():
+        if name not in SUFFIXES:
+            problem = 'Unknown compression format {!r}'.format(name)
+        elif name == 'br' and brotli is None:
+            problem = 'Install brotli to write .br pages'
+        else:
+            available.append(name)
+            continue
+        if name not in _warned:
+            _warned.add(name)
+            logger.warning('%s, skipping it', problem)
+    return tuple(available)
+
+
+def is_compressible(path):
+    # Hidden files, like the build manifest, aren't served.
+    return (path.endswith(COMPRESSIBLE)
+            and not os.path.basename(path).startswith('.'))
+
+
+def is_current(path, formats):
+    '''
+    Return ``True`` if ``path`` has an up to date sibling in each of
+    ``formats``.
+    '''
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        return all(os.stat(path + SUFFIXES[name]).st_mtime_ns == mtime
+                   for name in formats)
+    except FileNotFoundError:
+        return False
+
+
+def compress(path, formats):
+    '''
+    Write the siblings of ``path`` in each of ``formats``, and return how
+    many were written.
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    stat = os.stat(path)
+    for name in formats:
+        _write(path + SUFFIXES[name], _COMPRESSORS[name](data),
+               (stat.st_atime_ns, stat.st_mtime_ns))
+    return len(formats)
+
+
+def remove(path):
+    '''
+    Remove every compressed sibling of ``path``.
+    '''
+    for suffix in SUFFIXES.values():
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _gzip(data):
+    out = io.BytesIO()
+    # A fixed mtime in the header, so the same page compresses the same.
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=GZIP_LEVEL,
+                       mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+_COMPRESSORS = {'gzip': _gzip, 'br': _brotli}
+
+
+def _write(path, data, times):
+    dirname, filename = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=dirname, prefix='.'+filename,
+                                     suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.utime(temp_path, ns=times)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
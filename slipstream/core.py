@@ -26,58 +26,333 @@ Valid keys are:
 - ``slug`` (Optional): This is how you want the url to be formed. If not
   present, the URL will simply be a replace of non-URL-safe characters with
   ``-``.
-- ``date``: Any ``arrow.get``-parsable string, but keep it to something simple
-  like 'YYYY-MM-DD', or 'YYYY-MM-DD HH:MM', mmkay? This is the date theat you
-  wrote your post.
-- ``updated``: When you updated your post.
+- ``date``: 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM' or 'YYYY-MM-DD HH:MM:SS'. This
+  is the date that you wrote your post. Without it, a post in the content
+  directory is dated when its file was last modified.
+- ``updated``: When you updated your post, in the same format as ``date``.
 - ``author``: The email address of the author. Doesn't have to be a *real*
   address - just as long as it has an `@` sign in it.
 - ``tags``: Comma-delimited list of tags. e.g. ``these are, tags, okay``.
 
 
 '''
-import CommonMark
+import bisect
+import collections
+import contextlib
 import functools
-import jinja2
+import hashlib
+import io
 import logging
 import os
+import pickle
+import posixpath
 import re
-from flask import current_app
+import tempfile
+import threading
+import time
 from datetime import datetime
 from textwrap import dedent
+from . import compress
 from . import config
+from . import feeds
+from . import markdown
+from . import metrics
+from . import search
+from .cache import CachedPost, PostCache, RenderStore
 
 logger = logging.getLogger(__name__)
 
-parser = CommonMark.DocParser()
-renderer = CommonMark.HTMLRenderer()
+# Bump this when the file format or the way posts are parsed change, so
+# that the post cache gets thrown away. ``cache_version`` adds the Markdown
+# renderer and its version.
+FORMAT_VERSION = '1'
 
-env = jinja2.Environment(
-    loader = jinja2.FileSystemLoader(os.path.join(os.path.dirname(__file__),
-                                                  'themes')),
-)
+# Importing this module doesn't import a Markdown renderer or Jinja: the
+# renderer and ``env`` are created the first time they're used, and so is
+# ``CACHE_VERSION``, which depends on the renderer. Code in this module goes
+# through ``markdown_renderer()``, ``get_env()`` and ``cache_version()``.
+_lazy_lock = threading.Lock()
 
 
-class Post:
+def __getattr__(name):
+    if name == 'env':
+        return get_env()
+    if name == 'CACHE_VERSION':
+        return cache_version()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__,
+                                                                   name))
+
+
+def markdown_renderer():
+    '''
+    Return the ``markdown.Renderer`` named by ``config['MARKDOWN']``.
+    '''
+    return markdown.get(config.get('MARKDOWN'))
+
+
+def cache_version():
+    '''
+    Return the version of the post cache: ``FORMAT_VERSION`` and the ``id``
+    of the Markdown renderer.
+    '''
+    return '{}:{}'.format(FORMAT_VERSION, markdown_renderer().id)
+
+
+class RenderCache:
+    '''
+    Process-wide LRU of Markdown rendered to HTML, keyed by the renderer and
+    the SHA-1 of the Markdown. At most ``maxsize`` entries are kept, so
+    long-running servers don't grow without bounds. ``hits`` and ``misses``
+    count lookups. Markdown that isn't in the LRU is looked up in the
+    ``render_store`` before it is rendered.
+    '''
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def render(self, text):
+        '''
+        Return ``text`` rendered to HTML, rendering it only if it isn't
+        already in the cache.
+        '''
+        renderer = markdown_renderer()
+        key = (renderer.id, hashlib.sha1(text.encode()).hexdigest())
+        with self._lock:
+            try:
+                html = self._cache[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                metrics.inc('render_cache_hits')
+                return html
+
+        metrics.inc('render_cache_misses')
+        store = render_store()
+        html = None
+        if store is not None:
+            store_key = store.key('markdown', FORMAT_VERSION, renderer.id,
+                                  text)
+            html = _lookup(store, store_key)
+        if html is None:
+            with metrics.timer('markdown'):
+                html = renderer.render(text)
+            if store is not None:
+                store.put(store_key, html)
+        with self._lock:
+            self._cache[key] = html
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return html
+
+    def stats(self):
+        '''
+        Return a dict of the cache's ``hits``, ``misses``, ``size`` and
+        ``maxsize``.
+        '''
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self),
+                'maxsize': self.maxsize,
+                }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+
+markdown_cache = RenderCache()
+
+_render_stores = {}
+
+
+def render_store():
+    '''
+    Return the ``RenderStore`` in ``config['RENDER_STORE']``, or ``None`` if
+    that isn't set.
+    '''
+    directory = config.get('RENDER_STORE')
+    if not directory:
+        return None
+    store = _render_stores.get(directory)
+    if store is None:
+        store = _render_stores.setdefault(directory, RenderStore(directory))
+    return store
+
+
+def prune_render_store():
+    '''
+    Remove the entries of the ``render_store`` that no process used in the
+    last ``config['RENDER_STORE_MAX_AGE']`` days, if that is set.
+    '''
+    store = render_store()
+    max_age = config.get('RENDER_STORE_MAX_AGE')
+    if store is None or not max_age:
+        return
+    metrics.inc('render_store_pruned', store.prune(max_age * 24 * 60 * 60))
+
+
+def _lookup(store, key):
+    html = store.get(key)
+    metrics.inc('render_store_misses' if html is None else 'render_store_hits')
+    return html
+
+# Pages are streamed to disk through a buffer of this many bytes.
+WRITE_BUFFER_SIZE = 64 * 1024
+
+HEADER_CHUNK_SIZE = 4 * 1024
+
+THEME_DIR = os.path.join(os.path.dirname(__file__), 'themes')
+
+_env = None
+
+
+def get_env():
+    '''
+    Return the Jinja environment of the theme, ``env``, creating it the first
+    time. Templates stay loaded in it and are only reloaded when their file
+    changes. Call ``use_bytecode_cache`` to keep them compiled across
+    processes.
+    '''
+    global _env
+    if _env is None:
+        import jinja2
+        with _lazy_lock:
+            if _env is None:
+                _env = jinja2.Environment(
+                    loader = jinja2.FileSystemLoader(THEME_DIR),
+                    auto_reload = True,
+                )
+    return _env
+
+
+def use_bytecode_cache(directory):
+    '''
+    Keep the compiled templates of ``env`` in ``directory``. Templates are
+    then only compiled when their source changes, instead of once in every
+    process that uses them.
+    '''
+    import jinja2
+    env = get_env()
+    os.makedirs(directory, exist_ok=True)
+    env.bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
+    # Templates loaded before now never made it into the bytecode cache.
+    if env.cache is not None:
+        env.cache.clear()
+
+
+def precompile_templates():
+    '''
+    Load every template of the theme into ``env``, and into its bytecode
+    cache if there is one, so that rendering pages doesn't pay for
+    compiling them. Return the names of the templates.
+    '''
+    env = get_env()
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+# The formats accepted for ``date`` and ``updated``: YYYY-MM-DD, optionally
+# followed by HH:MM or HH:MM:SS.
+DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})'
+                     r'(?: (\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?\Z')
+
+
+class _PostDisplay:
+    '''
+    What the templates use from both ``Post`` and ``PostMeta``.
+    '''
+    __slots__ = ()
+
+    def _pretty_timestamp(self, timestamp):
+        if timestamp.hour or timestamp.minute:
+            fmt = '{:%Y-%m-%d %I:%M %p}'
+        else:
+            fmt = '{:%Y-%m-%d}'
+        return fmt.format(timestamp)
+
+    @property
+    def pretty_publish_timestamp(self):
+        return self._pretty_timestamp(self.publish_timestamp)
+
+    @property
+    def pretty_update_timestamp(self):
+        if self.update_timestamp:
+            return self._pretty_timestamp(self.update_timestamp)
+        else:
+            return 'Never'
+
+    @property
+    def excerpt(self):
+        '''
+        The HTML rendered from the first paragraph of ``raw_content``.
+        '''
+        return markdown_cache.render(
+            self.raw_content.strip().split('\n\n', 1)[0]
+        )
+
+    def render(self, template=None):
+        '''
+        Return HTML-rendered version of the post. If ``template`` is provided,
+        return the output of ``template.render(post=self)``, otherwise use the
+        template in ``config['POST_TEMPLATE']``, falling back to the theme's
+        ``post.html``.
+        '''
+        template = _post_template(template)
+        result = template.render(post=self)
+        return result
+
+
+class Post(_PostDisplay):
     def __init__(self, text, **more_headers):
         headers, body = self._parse_headers(text)
         headers.update(more_headers)
+        self._set_headers(headers, body)
+
+    @classmethod
+    def from_headers(cls, headers, body, *, publish_timestamp=None,
+                     update_timestamp=None, content=None):
+        '''
+        Create a post from already parsed ``headers`` and ``body``. The
+        ``publish_timestamp`` and ``update_timestamp``, if provided, are used
+        instead of parsing the ``date`` and ``updated`` headers, and
+        ``content`` is used as the rendered HTML of ``body``.
+        '''
+        post = cls.__new__(cls)
+        post._set_headers(headers, body,
+                          publish_timestamp=publish_timestamp,
+                          update_timestamp=update_timestamp)
+        if content is not None:
+            post._rendered = (body, content)
+        return post
+
+    def _set_headers(self, headers, body, *, publish_timestamp=None,
+                     update_timestamp=None):
         if not body.strip():
             raise ValueError('Must add body text to post')
 
         self.title = headers['title']
         self.author = headers.get('author', config['DEFAULT_AUTHOR'])
-        self.publish_timestamp = self._parse_date(headers.get('date'))
-        if headers.get('updated') is None:
-            self.update_timestamp = None
-        else:
-            self.update_timestamp = self._parse_date(headers.get('updated'))
+        if publish_timestamp is None:
+            publish_timestamp = self._parse_date(headers.get('date'))
+        self.publish_timestamp = publish_timestamp
+        if update_timestamp is None and headers.get('updated') is not None:
+            update_timestamp = self._parse_date(headers.get('updated'))
+        self.update_timestamp = update_timestamp
         self.raw_content = body
-        self.tags = [tag.strip() 
-                     for tag in headers.get('tags', '').split(',')
-                     if tag
-                     ]
+        self.tags = _parse_tags(headers.get('tags', ''))
         self._slug = headers.get('slug')
+        self._rendered = None
 
     def __str__(self):
         optional_headers = []
@@ -98,78 +373,175 @@ class Post:
                       {0.raw_content}'''
                       ).format(self, '\n'.join(optional_headers)+'\n')
 
-    def _parse_headers(self, text):
+    @staticmethod
+    def _parse_headers(text):
         '''
         Return a dict of headers from the text. Text must have `key:value` 
         headers. A blank line signifies the end of the headers. Leading and
         trailing whitespace are stripped from all values.
         '''
 
-        header_text, body = text.split('\n\n', maxsplit=1)
-        headers = {}
-        for header in header_text.split('\n'):
-            key, value = header.split(':', maxsplit=1)
-            headers[key.lower()] = value.strip()
-        return headers, body
+        header_text, blank, body = text.partition('\n\n')
+        if not blank:
+            raise ValueError('Post headers must be followed by a blank line')
+        return _parse_header_lines(header_text.split('\n')), body
 
-    def _parse_date(self, date):
+    @staticmethod
+    def _parse_date(date):
         '''
         Parse the provided ``date`` into a ``datetime.datetime``. If ``date``
         is ``None``, return ``datetime.datetime.now()``.
         '''
         if date is None:
             return datetime.now()
-        formats = ('%Y-%m-%d %H:%M:%S',
-                   '%Y-%m-%d %H:%M',
-                   '%Y-%m-%d',
-                  )
-        exc = None
-        for fmt in formats:
-            try:
-                timestamp = datetime.strptime(date, fmt)
-                break
-            except ValueError as e:
-                exc = e
-        else:
-            raise exc
-
-        return timestamp
-
-    def _pretty_timestamp(self, timestamp):
-        if timestamp.hour or timestamp.minute:
-            fmt = '{:%Y-%m-%d %I:%M %p}'
-        else:
-            fmt = '{:%Y-%m-%d}'
-        return fmt.format(timestamp)
+        match = DATE_RE.match(date)
+        if match is None:
+            raise ValueError('Unable to parse date {!r}'.format(date))
+        return datetime(*(int(part) for part in match.groups()
+                          if part is not None))
 
     @property
-    def pretty_publish_timestamp(self):
-        return self._pretty_timestamp(self.publish_timestamp)
+    def slug(self):
+        return self._slug or slugify(self.title)
 
     @property
-    def pretty_update_timestamp(self):
-        if self.update_timestamp:
-            return self._pretty_timestamp(self.update_timestamp)
+    def content(self):
+        '''
+        The HTML rendered from ``raw_content``. It is only rendered again when
+        ``raw_content`` changes, and then through ``markdown_cache``.
+        '''
+        if self._rendered is None or self._rendered[0] != self.raw_content:
+            self._rendered = (self.raw_content,
+                              markdown_cache.render(self.raw_content))
+        return self._rendered[1]
+
+    def load(self):
+        '''
+        Return the post itself. See ``PostMeta.load``.
+        '''
+        return self
+
+
+class PostMeta(_PostDisplay):
+    '''
+    The headers of the post saved at ``path``, without its body.
+
+    ``PostIndex`` holds these instead of ``Post`` so that the memory it uses
+    doesn't grow with the size of the posts. ``raw_content`` and ``content``
+    are read from ``path``, or from the ``PostCache`` if there is one (see
+    ``post_cache``), each time they are used; call ``load`` to get the whole
+    ``Post`` once.
+    '''
+    __slots__ = ('title', 'author', 'slug', 'tags', 'publish_timestamp',
+                 'update_timestamp', 'path')
+
+    def __init__(self, *, title, author, slug, tags, publish_timestamp,
+                 update_timestamp, path):
+        self.title = title
+        self.author = author
+        self.slug = slug
+        self.tags = tags
+        self.publish_timestamp = publish_timestamp
+        self.update_timestamp = update_timestamp
+        self.path = path
+
+    @classmethod
+    def from_headers(cls, headers, *, path):
+        '''
+        Return the metadata of the post saved at ``path`` from its parsed
+        ``headers``.
+        '''
+        title = headers['title']
+        updated = headers.get('updated')
+        return cls(title=title,
+                   author=headers.get('author', config['DEFAULT_AUTHOR']),
+                   slug=headers.get('slug') or slugify(title),
+                   tags=tuple(_parse_tags(headers.get('tags', ''))),
+                   publish_timestamp=_publish_timestamp(headers, path),
+                   update_timestamp=(Post._parse_date(updated)
+                                     if updated is not None else None),
+                   path=path)
+
+    @classmethod
+    def from_post(cls, post, *, path):
+        '''
+        Return the metadata of ``post``, which is saved at ``path``.
+        '''
+        return cls(title=post.title,
+                   author=post.author,
+                   slug=post.slug,
+                   tags=tuple(post.tags),
+                   publish_timestamp=post.publish_timestamp,
+                   update_timestamp=post.update_timestamp,
+                   path=path)
+
+    def load(self):
+        '''
+        Return the full ``Post`` saved at ``path``, with the timestamps of
+        this one.
+        '''
+        with post_cache(os.path.dirname(os.path.abspath(self.path))) as cache:
+            cached = cache.lookup(self.path) if cache is not None else None
+        if cached is not None:
+            headers, body, content = cached.headers, cached.body, cached.html
         else:
-            return 'Never'
+            with open(self.path) as f:
+                headers, body = Post._parse_headers(f.read())
+            content = None
+        return Post.from_headers(headers, body,
+                                 publish_timestamp=self.publish_timestamp,
+                                 update_timestamp=self.update_timestamp,
+                                 content=content)
 
     @property
-    def slug(self):
-        return self._slug or slugify(self.title)
+    def raw_content(self):
+        return self.load().raw_content
 
     @property
     def content(self):
-        return renderer.render(parser.parse(self.raw_content))
+        return self.load().content
+
+
+def _parse_header_lines(lines):
+    headers = {}
+    for line in lines:
+        key, colon, value = line.partition(':')
+        if not colon:
+            raise ValueError('Invalid header line {!r}'.format(line))
+        headers[key.lower()] = value.strip()
+    return headers
 
-    def render(self, template=None):
-        '''
-        Return HTML-rendered version of the post. If ``template`` is provided,
-        return the output of ``template.render(post=self)``, otherwise use the
-        template in ``config['POST_TEMPLATE']``.
-        '''
-        template = template or config['POST_TEMPLATE']
-        result = template.render(post=self)
-        return result
+
+def _parse_tags(text):
+    return [tag.strip() for tag in text.split(',') if tag]
+
+
+def read_headers(path):
+    '''
+    Return the headers of the post saved at ``path``. The file is read in
+    ``HEADER_CHUNK_SIZE`` chunks only until the end of the headers and the
+    start of the body, so the size of the body doesn't matter.
+    '''
+    with open(path) as f:
+        text = f.read(HEADER_CHUNK_SIZE)
+        while '\n\n' not in text:
+            chunk = f.read(HEADER_CHUNK_SIZE)
+            if not chunk:
+                raise ValueError('Post headers must be followed by a blank'
+                                 ' line')
+            text += chunk
+        header_text, blank, body = text.partition('\n\n')
+        while not body.strip():
+            body = f.read(HEADER_CHUNK_SIZE)
+            if not body:
+                raise ValueError('Must add body text to post')
+    return _parse_header_lines(header_text.split('\n'))
+
+
+def _post_template(template=None):
+    return (template
+            or config.get('POST_TEMPLATE')
+            or get_env().get_template('post.html'))
 
 
 def slugify(text):
@@ -192,6 +564,13 @@ def slugify(text):
 def publish(title, author, content, **headers):
     '''
     Publish stuff
+
+    Only the pages that the post touches are rebuilt: the post's own page,
+    the index, and the tag pages for every tag the post has now or had
+    before this publish. All of them are rendered from a single snapshot of
+    the posts in ``config['CONTENT_DIR']``, the ``PostIndex`` returned by
+    ``get_index``, and only the pages of the listings whose contents
+    shifted are rendered.
     '''
 
     try:
@@ -203,82 +582,1139 @@ def publish(title, author, content, **headers):
                            {}
                            ''').format(title, content), **headers)
 
-    path_to_post = os.path.join(config['CONTENT_DIR'], new_post.slug+'.md')
-    with open(path_to_post, 'w') as f:
-        f.write(str(new_post))
+    with metrics.build('publish', slug=new_post.slug):
+        path_to_post = os.path.join(config['CONTENT_DIR'], new_post.slug+'.md')
+        old_post = load_post(path_to_post)
+        # Loaded before the post is written, so that it is the snapshot of
+        # the posts as they were.
+        index = get_index(config['CONTENT_DIR'])
+        with open(path_to_post, 'w') as f:
+            f.write(str(new_post))
+
+        update_post(new_post, old_post=old_post, path=path_to_post,
+                    index=index,
+                    content_dir=config['CONTENT_DIR'],
+                    output_dir=config['OUTPUT_DIR'])
+
+        if config.get('PUBLISH_WEBHOOK'):
+            publish_webhook(new_post, config['PUBLISH_WEBHOOK'])
 
-    generate_index(content_dir=config['CONTENT_DIR'],
-                   output_dir=config['OUTPUT_DIR'])
 
-    for tag in new_post.tags:
-        logger.debug('Generating tag page for %r', tag)
-        generate_tag_page(tag=tag,
-                          content_dir=config['CONTENT_DIR'],
-                          output_dir=config['OUTPUT_DIR'])
+def update_post(post, *, path, index, content_dir, output_dir, old_post=None):
+    '''
+    Add ``post``, saved at ``path``, to ``index`` in place of ``old_post``,
+    and render the pages that changed: the post's own page, the pages of the
+    index and of its tags whose contents shifted, and the feeds. If
+    ``old_post`` had another slug, its page is removed. The search index is
+    updated too. Return a ``BuildReport``.
+    '''
+    tags = affected_tags(post, old_post)
+    report = BuildReport()
+    with post_cache(content_dir), fixed_theme():
+        with compressing(), index.lock:
+            old_posts = index.posts
+            old_tagged = {tag: index.tagged(tag) for tag in tags}
+            removed = []
+            if old_post is not None and old_post.slug != post.slug:
+                index.remove(old_post.slug)
+                _remove_post_page(output_dir, old_post.slug)
+                removed.append(old_post.slug)
+            index.add(PostMeta.from_post(post, path=path))
+
+            report += generate_post_page(post=post, output_dir=output_dir)
 
-    generate_rss(content_dir=config['CONTENT_DIR'],
-                 output_dir=config['OUTPUT_DIR'])
+            report += generate_index(content_dir=content_dir,
+                                     output_dir=output_dir,
+                                     index=index,
+                                     pages=changed_pages(old_posts,
+                                                         index.posts, post))
 
-    generate_atom(content_dir=config['CONTENT_DIR'],
-                  output_dir=config['OUTPUT_DIR'])
+            for tag in tags:
+                logger.debug('Generating tag page for %r', tag)
+                report += generate_tag_page(
+                    tag=tag,
+                    content_dir=content_dir,
+                    output_dir=output_dir,
+                    index=index,
+                    pages=changed_pages(old_tagged[tag], index.tagged(tag),
+                                        post),
+                )
 
-    if config.get('PUBLISH_WEBHOOK'):
-        publish_webhook(new_post, config['PUBLISH_WEBHOOK'])
+            generate_search_index(output_dir=output_dir, index=index,
+                                  posts=[post], removed=removed)
 
+            # The entry of a post that changed its slug can't be replaced,
+            # so the feeds are generated again from the index.
+            feed_post = None if removed else post
+            generate_rss(content_dir=content_dir, output_dir=output_dir,
+                         post=feed_post, index=index)
+            generate_atom(content_dir=content_dir, output_dir=output_dir,
+                          post=feed_post, index=index)
+    return report
 
-def load_posts(*, content_dir):
+
+def remove_post(post, *, index, content_dir, output_dir):
+    '''
+    Remove ``post`` from ``index``, its page from ``output_dir`` and its
+    terms from the search index, and render the pages of the index, its tags
+    and the feeds that it drops out of. Return a ``BuildReport``.
+    '''
+    report = BuildReport()
+    with post_cache(content_dir):
+        with compressing(), index.lock:
+            old_posts = index.posts
+            old_tagged = {tag: index.tagged(tag) for tag in post.tags}
+            index.remove(post.slug)
+            _remove_post_page(output_dir, post.slug)
+
+            report += generate_index(content_dir=content_dir,
+                                     output_dir=output_dir,
+                                     index=index,
+                                     pages=changed_pages(old_posts,
+                                                         index.posts, post))
+
+            for tag in post.tags:
+                report += generate_tag_page(
+                    tag=tag,
+                    content_dir=content_dir,
+                    output_dir=output_dir,
+                    index=index,
+                    pages=changed_pages(old_tagged[tag], index.tagged(tag),
+                                        post),
+                )
+
+            generate_search_index(output_dir=output_dir, index=index,
+                                  removed=[post.slug])
+
+            generate_rss(content_dir=content_dir, output_dir=output_dir,
+                         index=index)
+            generate_atom(content_dir=content_dir, output_dir=output_dir,
+                          index=index)
+    return report
+
+
+def _remove_post_page(output_dir, slug):
+    path = os.path.join(output_dir, slug+'.html')
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    else:
+        logger.debug('Removed %r', path)
+    compress.remove(path)
+
+
+def affected_tags(post, old_post=None):
+    '''
+    Return the tags whose pages change when ``old_post`` is replaced by
+    ``post``: every tag ``post`` has, plus any tag that ``old_post`` had and
+    ``post`` lost. The tags are returned in the order they first appear.
+    '''
+    tags = list(post.tags)
+    if old_post is not None:
+        tags.extend(tag for tag in old_post.tags if tag not in post.tags)
+    return tags
+
+
+def paginate(posts):
+    '''
+    Split ``posts`` into pages of ``config['PAGE_SIZE']`` posts. If that
+    isn't set, all of the posts are on one page. There is always at least one
+    page, even if it is empty.
+    '''
+    page_size = _page_size(posts)
+    return [posts[start:start+page_size]
+            for start in range(0, len(posts), page_size)] or [[]]
+
+
+def _page_size(posts):
+    return config.get('PAGE_SIZE') or len(posts) or 1
+
+
+def _page_of(posts, number, page_size):
+    '''
+    Lazily yield the posts on page ``number`` of ``posts``, each loaded once
+    however many times the template uses its content.
+    '''
+    for i in range((number-1)*page_size, min(number*page_size, len(posts))):
+        yield posts[i].load()
+
+
+def page_path(prefix, number):
     '''
-    Load all posts from the provided ``content_dir``.
+    Return the path, relative to the output directory, of page ``number`` of
+    the listing at ``prefix``. The first page of the index (``prefix`` is
+    ``''``) is ``index.html``, and the first page of a tag is
+    ``tag/<tag>.html``. Later pages are ``<prefix>/page/<number>.html``.
     '''
-    posts = []
-    for entry in os.scandir(content_dir):
-        if not entry.name.startswith('.') and entry.name.endswith('.md') and entry.is_file():
-            with open(os.path.join(content_dir, entry.name)) as f:
-                posts.append(Post(f.read()))
-    return list(reversed(sorted(posts, key=lambda x: x.publish_timestamp)))
+    if number == 1:
+        return (prefix or 'index') + '.html'
+    return posixpath.join(prefix, 'page', '{}.html'.format(number))
 
 
-def generate_index(*, content_dir, output_dir):
+def changed_pages(old_posts, new_posts, post):
+    '''
+    Return the numbers of the pages of a listing that changed when it went
+    from ``old_posts`` to ``new_posts`` because ``post`` changed: the pages
+    that now hold different posts, hold ``post`` itself, or gained or lost
+    a next page.
+    '''
+    return changed_listing_pages(old_posts, new_posts, {post.slug})
+
+
+def changed_listing_pages(old_posts, new_posts, slugs):
+    '''
+    Like ``changed_pages``, for the posts with any of ``slugs`` changing.
+    '''
+    old_pages = [[p.slug for p in page] for page in paginate(old_posts)]
+    new_pages = [[p.slug for p in page] for page in paginate(new_posts)]
+    changed = set()
+    for number, page_slugs in enumerate(new_pages, 1):
+        if (number > len(old_pages)
+                or old_pages[number-1] != page_slugs
+                or not slugs.isdisjoint(page_slugs)):
+            changed.add(number)
+    if len(old_pages) != len(new_pages):
+        changed.add(min(len(old_pages), len(new_pages)))
+    return sorted(changed)
+
+
+def newest_first(posts):
+    '''
+    Return ``posts`` sorted by ``publish_timestamp``, newest first. Posts
+    published at the same time are sorted by slug, in reverse.
+    '''
+    return sorted(posts, key=_sort_key, reverse=True)
+
+
+def _sort_key(post):
+    return post.publish_timestamp, post.slug
+
+
+class PostIndex:
+    '''
+    The posts of a site, indexed by slug and by tag.
+
+    ``posts`` and ``tagged`` return the posts newest first, in the same order
+    as ``newest_first``. ``from_dir`` indexes a ``PostMeta`` for each post,
+    so that post bodies are only read when a page needs them. Posts can be
+    added, replaced and removed without rebuilding the index. Hold ``lock``
+    to make several changes and reads atomically.
+    '''
+    def __init__(self, posts=()):
+        self.lock = threading.RLock()
+        self._by_slug = {}
+        self._keys = []
+        self._tag_keys = collections.defaultdict(list)
+        for post in posts:
+            self._by_slug[post.slug] = post
+        for post in self._by_slug.values():
+            key = _sort_key(post)
+            self._keys.append(key)
+            for tag in set(post.tags):
+                self._tag_keys[tag].append(key)
+        self._keys.sort()
+        for keys in self._tag_keys.values():
+            keys.sort()
+
+    @classmethod
+    def from_dir(cls, content_dir, *, executor=None):
+        '''
+        Return a new index of the posts in ``content_dir``.
+        '''
+        return cls(load_posts(content_dir=content_dir, executor=executor,
+                              lazy=True))
+
+    def __len__(self):
+        return len(self._by_slug)
+
+    def __contains__(self, slug):
+        return slug in self._by_slug
+
+    def __iter__(self):
+        return iter(self.posts)
+
+    def get(self, slug):
+        '''
+        Return the post with ``slug``, or ``None`` if there isn't one.
+        '''
+        return self._by_slug.get(slug)
+
+    @property
+    def posts(self):
+        '''
+        A list of all the posts, newest first.
+        '''
+        with self.lock:
+            return self._resolve(self._keys)
+
+    @property
+    def tags(self):
+        '''
+        A sorted list of every tag used by a post.
+        '''
+        with self.lock:
+            return sorted(self._tag_keys)
+
+    def tagged(self, tag):
+        '''
+        Return a list of the posts tagged ``tag``, newest first.
+        '''
+        with self.lock:
+            return self._resolve(self._tag_keys.get(tag, ()))
+
+    def _resolve(self, keys):
+        return [self._by_slug[slug] for timestamp, slug in reversed(keys)]
+
+    def add(self, post):
+        '''
+        Add ``post`` to the index, replacing the post with the same slug.
+        Return the replaced post, or ``None``.
+        '''
+        with self.lock:
+            old_post = self.remove(post.slug)
+            key = _sort_key(post)
+            self._by_slug[post.slug] = post
+            bisect.insort(self._keys, key)
+            for tag in set(post.tags):
+                bisect.insort(self._tag_keys[tag], key)
+            return old_post
+
+    def remove(self, slug):
+        '''
+        Remove the post with ``slug`` from the index and return it, or return
+        ``None`` if there is no such post.
+        '''
+        with self.lock:
+            post = self._by_slug.pop(slug, None)
+            if post is None:
+                return None
+            key = _sort_key(post)
+            del self._keys[bisect.bisect_left(self._keys, key)]
+            for tag in set(post.tags):
+                keys = self._tag_keys[tag]
+                del keys[bisect.bisect_left(keys, key)]
+                if not keys:
+                    del self._tag_keys[tag]
+            return post
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(content_dir):
+    '''
+    Return the shared ``PostIndex`` of ``content_dir``, loading it the first
+    time it is needed.
+    '''
+    with _indexes_lock:
+        index = _indexes.get(os.path.abspath(content_dir))
+    if index is None:
+        index = load_index(content_dir)
+    return index
+
+
+def load_index(content_dir, *, executor=None):
+    '''
+    Load a new ``PostIndex`` of ``content_dir`` and make it the one returned
+    by ``get_index``.
+    '''
+    index = PostIndex.from_dir(content_dir, executor=executor)
+    with _indexes_lock:
+        _indexes[os.path.abspath(content_dir)] = index
+    return index
+
+
+def load_post(path):
+    '''
+    Load the post saved at ``path``, or return ``None`` if there is no such
+    file or it does not contain a valid post.
+    '''
+    try:
+        with open(path) as f:
+            return Post(f.read())
+    except FileNotFoundError:
+        return None
+    except (KeyError, ValueError):
+        logger.warning('Unable to load existing post %r', path)
+        return None
+
+
+_post_caches = threading.local()
+
+
+@contextlib.contextmanager
+def post_cache(content_dir):
+    '''
+    Yield the ``PostCache`` of the posts in ``content_dir`` if
+    ``config['POST_CACHE']`` is set and ``content_dir`` isn't ``None``, or
+    ``None``. The posts that this thread loads in the ``with`` block are
+    looked up in it, so wrap a build in one to connect to the cache once
+    instead of for every post. Nested blocks share the outer block's cache.
+    In worker processes it is kept open until the process exits.
+    '''
+    cache_path = config.get('POST_CACHE')
+    if not cache_path or content_dir is None:
+        yield None
+        return
+
+    key = (cache_path, os.path.abspath(content_dir), cache_version())
+    caches = _post_caches.__dict__.setdefault('caches', {})
+    if key in caches or getattr(_post_caches, 'keep_open', False):
+        if key not in caches:
+            caches[key] = PostCache(cache_path, content_dir=key[1],
+                                    version=key[2])
+        yield caches[key]
+        caches[key].commit()
+        return
+
+    with PostCache(cache_path, content_dir=key[1],
+                   version=key[2]) as cache:
+        caches[key] = cache
+        try:
+            yield cache
+        finally:
+            del caches[key]
+
+
+def load_posts(*, content_dir, executor=None, lazy=False):
+    '''
+    Load all posts from the provided ``content_dir``. If ``lazy`` is true,
+    return a ``PostMeta`` for each post instead of the whole ``Post``; only
+    the headers of the posts are read, unless they are being cached.
+
+    If ``config['POST_CACHE']`` is set, it is the path of a ``PostCache``
+    that is used to skip parsing the posts that haven't changed since the
+    last time they were loaded. If ``executor`` is provided, the posts that
+    need parsing are parsed and rendered by it.
+    '''
+    with metrics.timer('scan'):
+        entries = sorted((entry for entry in os.scandir(content_dir)
+                          if not entry.name.startswith('.')
+                          and entry.name.endswith('.md')
+                          and entry.is_file()),
+                         key=lambda entry: entry.name)
+        with post_cache(content_dir) as cache:
+            if cache is not None:
+                hits, misses = cache.hits, cache.misses
+                posts = [None] * len(entries)
+                missing = []
+                for i, entry in enumerate(entries):
+                    cached = cache.get(entry)
+                    if cached is None:
+                        missing.append(i)
+                    else:
+                        posts[i] = _loaded(
+                            _post_from_cache(cached, path=entry.path), entry,
+                            lazy,
+                        )
+                parsed = _map(executor, _parse_post_file,
+                              [entries[i].path for i in missing])
+                for i, (text, cached) in zip(missing, parsed):
+                    cache.put(entries[i], text, cached)
+                    posts[i] = _loaded(
+                        _post_from_cache(cached, path=entries[i].path),
+                        entries[i], lazy,
+                    )
+                cache.prune()
+                cache.commit()
+                hits, misses = cache.hits - hits, cache.misses - misses
+                logger.debug('Post cache: %d hits, %d misses', hits, misses)
+                metrics.inc('post_cache_hits', hits)
+                metrics.inc('post_cache_misses', misses)
+                metrics.inc('posts_parsed', len(missing))
+            elif lazy:
+                posts = _map(executor, _read_post_meta,
+                             [entry.path for entry in entries])
+            elif executor is not None:
+                metrics.inc('posts_parsed', len(entries))
+                parsed = _map(executor, _parse_post_file,
+                              [entry.path for entry in entries])
+                posts = [_loaded(_post_from_cache(cached, path=entry.path),
+                                 entry, lazy)
+                         for entry, (text, cached) in zip(entries, parsed)]
+            else:
+                metrics.inc('posts_parsed', len(entries))
+                posts = []
+                for entry in entries:
+                    with open(os.path.join(content_dir, entry.name)) as f:
+                        headers, body = Post._parse_headers(f.read())
+                    post = Post.from_headers(
+                        headers, body,
+                        publish_timestamp=_publish_timestamp(headers,
+                                                             entry.path),
+                    )
+                    posts.append(_loaded(post, entry, lazy))
+        metrics.inc('posts_loaded', len(posts))
+    return newest_first(posts)
+
+
+def _read_post_meta(path):
+    return PostMeta.from_headers(read_headers(path), path=path)
+
+
+def _loaded(post, entry, lazy):
+    if lazy:
+        return PostMeta.from_post(post, path=entry.path)
+    return post
+
+
+def _parse_post_file(path):
+    '''
+    Parse the post at ``path`` and render its content. Return the text of the
+    file and a ``CachedPost``.
+    '''
+    with open(path) as f:
+        text = f.read()
+    headers, body = Post._parse_headers(text)
+    post = Post.from_headers(headers, body)
+    has_date = headers.get('date') is not None
+    return text, CachedPost(headers=headers,
+                            body=body,
+                            html=post.content,
+                            publish_timestamp=(post.publish_timestamp
+                                               if has_date else None),
+                            update_timestamp=post.update_timestamp,
+                            )
+
+
+def _publish_timestamp(headers, path):
+    '''
+    Return the ``date`` in ``headers`` of the post saved at ``path``, or if
+    it has none, when the file was last modified, so that it is the same
+    every time the post is loaded.
+    '''
+    if headers.get('date') is None and path is not None:
+        return _modified(path)
+    return Post._parse_date(headers.get('date'))
+
+
+def _modified(path):
+    return datetime.fromtimestamp(os.stat(path).st_mtime)
+
+
+def _post_from_cache(cached, *, path=None):
+    publish_timestamp = cached.publish_timestamp
+    if publish_timestamp is None and path is not None:
+        publish_timestamp = _modified(path)
+    return Post.from_headers(cached.headers, cached.body,
+                             publish_timestamp=publish_timestamp,
+                             update_timestamp=cached.update_timestamp,
+                             content=cached.html)
+
+
+class BuildReport:
+    '''
+    The number of pages a build ``rendered``, and how many of those were
+    ``written`` or ``skipped`` because they were unchanged. Reports can be
+    added together.
+    '''
+    def __init__(self, *, rendered=0, written=0):
+        self.rendered = rendered
+        self.written = written
+
+    @classmethod
+    def of_page(cls, written):
+        '''
+        Return the report of rendering one page, which was ``written`` or not.
+        '''
+        return cls(rendered=1, written=int(written))
+
+    @property
+    def skipped(self):
+        return self.rendered - self.written
+
+    def __add__(self, other):
+        return BuildReport(rendered=self.rendered + other.rendered,
+                           written=self.written + other.written)
+
+    def __eq__(self, other):
+        if not isinstance(other, BuildReport):
+            return NotImplemented
+        return (self.rendered, self.written) == (other.rendered, other.written)
+
+    def __str__(self):
+        return '{} pages rendered, {} written, {} skipped'.format(
+            self.rendered, self.written, self.skipped,
+        )
+
+
+def generate_post_page(*, post, output_dir, template=None):
+    '''
+    Generate ``output_dir``/``post.slug``.html from the provided ``post``,
+    using ``template`` if it is provided. Return a ``BuildReport``.
+    '''
+    post = post.load()
+    path = os.path.join(output_dir, post.slug+'.html')
+    template = _post_template(template)
+    store = render_store()
+    theme = store and theme_fingerprint()
+    key = store and _page_key(template, post, theme)
+    if not key:
+        return BuildReport.of_page(write_template(path, template, post=post))
+
+    html = _lookup(store, key)
+    if html is None:
+        with metrics.timer('render'):
+            html = template.render(post=post)
+        metrics.inc('pages_rendered')
+        # Only store the page if the theme didn't change since it was
+        # fingerprinted, or it would be stored under the key of the old theme.
+        if _theme_fingerprint() == theme:
+            store.put(key, html)
+    written = write_atomically(path, lambda f: f.write(html), phase='write')
+    metrics.inc('pages_written' if written else 'pages_skipped')
+    return BuildReport.of_page(written)
+
+
+def _page_key(template, post, theme):
+    '''
+    Return the ``render_store`` key of the page of ``post`` rendered with
+    ``template`` from the theme with the fingerprint ``theme``, or ``None``
+    if ``template`` isn't one of the theme's.
+    '''
+    name = _template_name(template)
+    if name is None:
+        return None
+    return RenderStore.key('page', cache_version(), name, theme,
+                           str(post), repr(post.publish_timestamp),
+                           repr(post.update_timestamp))
+
+
+_theme_digest = (None, None, ())
+_themes = threading.local()
+
+
+def theme_fingerprint():
+    '''
+    Return a digest of the source of every template in ``env`` and of the
+    template globals they use, which changes whenever a page rendered from
+    the theme might. In a ``fixed_theme`` block, return the block's.
+    '''
+    fixed = getattr(_themes, 'fingerprint', None)
+    return fixed if fixed is not None else _theme_fingerprint()
+
+
+@contextlib.contextmanager
+def fixed_theme(fingerprint=None):
+    '''
+    Yield ``fingerprint``, or the ``theme_fingerprint`` if it's ``None``,
+    and use it for the pages that this thread renders in the ``with``
+    block, so that a build walks ``THEME_DIR`` once instead of for every
+    page. Nested blocks share the outer block's fingerprint.
+    '''
+    if getattr(_themes, 'fingerprint', None) is not None:
+        yield _themes.fingerprint
+        return
+
+    _themes.fingerprint = fingerprint or _theme_fingerprint()
+    try:
+        yield _themes.fingerprint
+    finally:
+        _themes.fingerprint = None
+
+
+def _theme_fingerprint():
+    import jinja2.nodes
+    global _theme_digest
+    env = get_env()
+    stamp = fingerprint(THEME_DIR)
+    if _theme_digest[0] != stamp:
+        digest = hashlib.sha256()
+        names = set()
+        for name in env.list_templates():
+            source = env.loader.get_source(env, name)[0]
+            digest.update(RenderStore.key(name, source).encode())
+            names.update(node.name for node in
+                         env.parse(source).find_all(jinja2.nodes.Name))
+        _theme_digest = (stamp, digest.hexdigest(), sorted(names))
+    stamp, digest, names = _theme_digest
+    return RenderStore.key(digest, repr([(name, env.globals.get(name))
+                                         for name in names]))
+
+
+def write_template(path, template, **context):
+    '''
+    Render ``template`` with ``context`` into the file at ``path``. The
+    output is streamed to the file as it is rendered, rather than building
+    the whole page in memory first. Return ``True`` if the file was written.
+
+    The page is rendered into a temporary file next to ``path`` which
+    replaces ``path`` atomically, so readers never see a half-written page.
+    If the new page is the same as the one already at ``path``, it is left
+    alone, so that its modification time (and ETag) don't change.
+    '''
+    written = write_atomically(path, template.stream(**context).dump)
+    metrics.inc('pages_rendered')
+    metrics.inc('pages_written' if written else 'pages_skipped')
+    return written
+
+
+def write_atomically(path, write, *, phase='render'):
+    '''
+    Call ``write`` with a text file to write the new contents of ``path``
+    into, timed as the metrics ``phase``. Like ``write_template``, the file
+    is replaced atomically, and only if its contents changed. Return
+    ``True`` if the file was written.
+
+    HTML, XML and JSON files are then compressed into sidecar files in the
+    formats listed in ``config['COMPRESS']``, unless neither the file nor
+    its sidecars changed. Inside ``compressing`` that happens in a thread pool.
+    '''
+    dirname, filename = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=dirname, prefix='.'+filename,
+                                     suffix='.tmp')
+    try:
+        with metrics.timer(phase), \
+                open(fd, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            writer = _HashingWriter(f)
+            write(writer)
+        with metrics.timer('write'):
+            written = not _same_file(path, writer.hash.hexdigest(),
+                                     writer.size)
+            if written:
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+            else:
+                logger.debug('%r is unchanged', path)
+                os.remove(temp_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    if written:
+        metrics.inc('bytes_written', writer.size)
+    _precompress(path, changed=written)
+    return written
+
+
+_compression = threading.local()
+
+
+@contextlib.contextmanager
+def compressing():
+    '''
+    Compress the files written by this thread in the ``with`` block in a
+    thread pool of ``config['WORKERS']`` threads, and wait for all of them
+    at the end of the block. Nested blocks share the outer block's pool.
+    '''
+    if (getattr(_compression, 'executor', None) is not None
+            or not compress.formats(config.get('COMPRESS'))):
+        yield
+        return
+
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.get('WORKERS') or None) as executor:
+        _compression.executor = executor
+        _compression.futures = []
+        try:
+            yield
+        finally:
+            _compression.executor = None
+            for future in _compression.futures:
+                try:
+                    _record_compression(future.result())
+                except OSError as e:
+                    logger.warning('Unable to compress a page: %s', e)
+            _compression.futures = []
+
+
+def _precompress(path, *, changed):
+    formats = compress.formats(config.get('COMPRESS'))
+    if not formats or not compress.is_compressible(path):
+        return
+    if not changed and compress.is_current(path, formats):
+        return
+    executor = getattr(_compression, 'executor', None)
+    if executor is None:
+        _record_compression(_compress_page(path, formats))
+    else:
+        _compression.futures.append(executor.submit(_compress_page, path,
+                                                    formats))
+
+
+def _compress_page(path, formats):
+    start = time.perf_counter()
+    count = compress.compress(path, formats)
+    return count, time.perf_counter() - start
+
+
+def _record_compression(result):
+    count, seconds = result
+    metrics.inc('pages_compressed', count)
+    metrics.observe('compress', seconds)
+
+
+class _HashingWriter(io.TextIOBase):
+    '''
+    Text file that writes to the binary file ``f`` as UTF-8, keeping track
+    of the SHA-1 and size of what was written.
+    '''
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha1()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.hash.update(data)
+        self.size += len(data)
+        self.f.write(data)
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
+def _same_file(path, sha1, size):
+    '''
+    Return ``True`` if the file at ``path`` has the given ``size`` and
+    ``sha1`` hex digest.
+    '''
+    try:
+        if os.path.getsize(path) != size:
+            return False
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(functools.partial(f.read, WRITE_BUFFER_SIZE),
+                              b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return False
+    return digest.hexdigest() == sha1
+
+
+def generate_index(*, content_dir, output_dir, index=None, pages=None):
     '''
     Generate index.html from the posts contained in content_dir``, saving the
     output in ``output_dir``. If files exist in the output_dir with the same
-    name they will be overwritten.
+    name they will be overwritten. If there are more than
+    ``config['PAGE_SIZE']`` posts, the rest go to ``page/2.html`` and so on.
+
+    If ``index``, a ``PostIndex``, is provided it is used instead of loading
+    the posts from ``content_dir``. If ``pages`` is provided, only those
+    page numbers are rendered. Return a ``BuildReport``.
     '''
-    posts = load_posts(content_dir=content_dir)
-    template = env.get_template('index.html')
-    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
-        f.write(template.render(posts=posts))
+    if index is None:
+        index = PostIndex.from_dir(content_dir)
+    with post_cache(content_dir):
+        return _generate_listing(
+            template=get_env().get_template('index.html'),
+            posts=index.posts,
+            output_dir=output_dir,
+            prefix='',
+            pages=pages,
+        )
 
 
-def generate_tag_page(*, tag, content_dir, output_dir):
+def generate_tag_page(*, tag, content_dir, output_dir, index=None,
+                      pages=None):
     '''
     Generate ``output_dir``/tag/``tag``.html that contains snippets and links
-    to each of the posts that has the provided tag.
+    to each of the posts that has the provided tag, paginated like the
+    index into ``tag/<tag>/page/2.html`` and so on. If no post has the tag
+    any longer, its pages are removed.
+
+    If ``index``, a ``PostIndex``, is provided it is used instead of loading
+    the posts from ``content_dir``. If ``pages`` is provided, only those
+    page numbers are rendered. Return a ``BuildReport``.
     '''
     os.makedirs(os.path.join(output_dir, 'tag'), exist_ok=True)
-    template = env.get_template('tag.html')
-    posts = load_posts(content_dir=content_dir)
-    with open(os.path.join(output_dir, 'tag', tag)+'.html', 'w') as f:
-        f.write(template.render(posts=(post 
-                                       for post in posts if tag in post.tags)))
+    if index is None:
+        index = PostIndex.from_dir(content_dir)
+    tagged = index.tagged(tag)
+    prefix = posixpath.join('tag', tag)
+    if not tagged:
+        logger.debug('No posts tagged %r, removing its pages', tag)
+        _remove_pages(output_dir, prefix, first=1)
+        return BuildReport()
+    with post_cache(content_dir):
+        return _generate_listing(
+            template=get_env().get_template('tag.html'),
+            posts=tagged,
+            output_dir=output_dir,
+            prefix=prefix,
+            pages=pages,
+        )
 
 
-def generate_rss(*, content_dir, output_dir):
+def _generate_listing(*, template, posts, output_dir, prefix, pages=None):
     '''
-    Generate ``output_dir/rss.xml`` RSS feed from the posts found in
-    ``content_dir``
+    Render ``pages`` (all of them by default) of the listing of ``posts`` at
+    ``prefix`` with ``template``, and remove any pages left over from when
+    the listing was longer. Return a ``BuildReport``.
+    '''
+    page_size = _page_size(posts)
+    count = max(1, -(-len(posts) // page_size))
+    site_url = config.get('SITE_URL', '')
+    if pages is None:
+        pages = range(1, count+1)
+    report = BuildReport()
+    with compressing():
+        for number in pages:
+            if not 1 <= number <= count:
+                continue
+            path = os.path.join(output_dir, page_path(prefix, number))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            written = write_template(
+                path,
+                template,
+                posts=_page_of(posts, number, page_size),
+                page=number,
+                prev_url=(site_url+'/'+page_path(prefix, number-1)
+                          if number > 1 else None),
+                next_url=(site_url+'/'+page_path(prefix, number+1)
+                          if number < count else None),
+                excerpts=config.get('EXCERPTS', False),
+            )
+            report += BuildReport.of_page(written)
+    _remove_pages(output_dir, prefix, first=count+1)
+    return report
+
+
+def _remove_pages(output_dir, prefix, *, first):
+    '''
+    Remove the pages of the listing at ``prefix`` from page ``first`` on.
+    '''
+    number = first
+    while True:
+        path = os.path.join(output_dir, page_path(prefix, number))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            if number > 1:
+                break
+        else:
+            logger.debug('Removed %r', path)
+        compress.remove(path)
+        number += 1
 
-    # TODO: Only add an entry to the RSS feed -W. Werner, 2015-12-07
+
+def generate_rss(*, content_dir, output_dir, post=None, index=None):
+    '''
+    Generate ``output_dir/rss.xml`` RSS feed from the posts found in
+    ``content_dir``. See ``generate_atom``.
     '''
+    _generate_feed(os.path.join(output_dir, 'rss.xml'),
+                   read=feeds.read_rss,
+                   write=feeds.write_rss,
+                   content_dir=content_dir,
+                   post=post,
+                   index=index)
 
 
-def generate_atom(*, content_dir, output_dir):
+def generate_atom(*, content_dir, output_dir, post=None, index=None):
     '''
     Generate ``output_dir/atom.xml`` ATOM feed from the posts found in
-    ``content_dir``
+    ``content_dir``.
+
+    The feed holds the newest ``config['FEED_SIZE']`` posts. If ``post`` is
+    provided, only its entry is added to the existing feed, or replaced, so
+    no other post has to be loaded. If there's no feed yet, or it can't be
+    updated that way, it is generated from ``index``, a ``PostIndex``, or
+    from the posts in ``content_dir``.
+    '''
+    _generate_feed(os.path.join(output_dir, 'atom.xml'),
+                   read=feeds.read_atom,
+                   write=feeds.write_atom,
+                   content_dir=content_dir,
+                   post=post,
+                   index=index)
+
+
+def _generate_feed(path, *, read, write, content_dir, post, index):
+    from xml.etree import ElementTree
+    size = config.get('FEED_SIZE', 20)
+    if index is None:
+        index = get_index(content_dir)
+    entries = None
+    if post is not None:
+        entry = _feed_entry(post)
+        try:
+            old_entries = read(path)
+        except (OSError, ElementTree.ParseError, ValueError) as e:
+            logger.info('Unable to update %r, generating it again: %s',
+                        path, e)
+        else:
+            entries = feeds.merge_entries(old_entries, entry, size)
+            # If the post moved to the end of the feed, or out of it, a post
+            # that wasn't in the feed may belong before it. Only the index
+            # knows, and the same goes for a feed that is too short.
+            moved_last = (any(old.id == entry.id for old in old_entries)
+                          and entry not in entries[:-1]
+                          and len(index) > size)
+            if moved_last or len(entries) < min(size, len(index)):
+                entries = None
+    if entries is None:
+        with post_cache(content_dir):
+            entries = [_feed_entry(meta.load())
+                       for meta in index.posts[:size]]
+    write_atomically(path,
+                     functools.partial(write, entries=entries,
+                                       title=config.get('BLOG_NAME')
+                                       or 'Slipstream',
+                                       link=config.get('SITE_URL', '')),
+                     phase='feed')
+
 
-    # TODO: Only add an entry to the ATOM feed -W. Werner, 2015-12-07
+def _feed_entry(post):
+    link = '{}/{}.html'.format(config.get('SITE_URL', ''), post.slug)
+    return feeds.FeedEntry(id=link,
+                           title=post.title,
+                           link=link,
+                           author=post.author,
+                           published=post.publish_timestamp,
+                           updated=post.update_timestamp,
+                           content=post.content)
+
+
+def generate_search_index(*, output_dir, index, posts=None, removed=()):
+    '''
+    Update the search index in ``output_dir/search`` (see ``search``) with
+    ``posts`` and without the posts whose slugs are ``removed``, if
+    ``config['SEARCH']`` is set. Only the shards that those posts' terms
+    are in are written. If there are neither, or there's no index to
+    update, it is built from every post in ``index``, a ``PostIndex``.
+    '''
+    if not config.get('SEARCH'):
+        return
+    directory = os.path.join(output_dir, search.DIRECTORY)
+    write = functools.partial(write_atomically, phase='write')
+    with metrics.timer('search'):
+        count = None
+        if posts is not None or removed:
+            search_index = search.SearchIndex.load(directory)
+            try:
+                if search_index is not None:
+                    for slug in removed:
+                        search_index.remove(slug)
+                    for post in posts or ():
+                        search_index.add(post)
+                    count = search_index.save(write)
+            except (OSError, ValueError) as e:
+                logger.info('Unable to update the search index in %r,'
+                            ' building it again: %s', directory, e)
+        if count is None:
+            search_index = search.SearchIndex(directory)
+            for meta in index.posts:
+                search_index.add(meta.load())
+            count = search_index.save(write)
+    metrics.inc('search_shards_written', count)
+
+
+def fingerprint(*dirs):
+    '''
+    Return a fingerprint of the names, sizes and modification times of all
+    the files in ``dirs``. It changes whenever a file is added, removed or
+    modified.
+    '''
+    stats = []
+    for top in dirs:
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                stats.append((path, stat.st_mtime_ns, stat.st_size))
+    return hashlib.sha1(repr(stats).encode()).hexdigest()
+
+
+class Preview:
+    '''
+    Keep the pages in ``output_dir`` up to date while they're previewed.
+
+    Instead of regenerating the whole site for every request, the content
+    and theme directories are fingerprinted. When the fingerprint changes
+    the ``generation`` goes up, and each page is rendered again the next
+    time it is requested. ``output_dir`` is assumed to be up to date when
+    the ``Preview`` is created.
     '''
+    def __init__(self, *, content_dir, output_dir):
+        self.content_dir = content_dir
+        self.output_dir = output_dir
+        self.generation = 0
+        self._fingerprint = fingerprint(content_dir, THEME_DIR)
+        self._index = None
+        self._page_generations = {}
+        self._lock = threading.Lock()
+
+    def update(self, path):
+        '''
+        Render the page at ``path``, relative to ``output_dir``, if the
+        content or templates changed since it was last rendered. Return
+        ``True`` if it was rendered. A ``path`` outside of ``output_dir`` is
+        never rendered.
+        '''
+        path = posixpath.normpath(path)
+        if posixpath.isabs(path) or path.split('/')[0] == '..':
+            logger.warning('Not previewing %r, outside of %r', path,
+                           self.output_dir)
+            return False
+        with self._lock:
+            current = fingerprint(self.content_dir, THEME_DIR)
+            if current != self._fingerprint:
+                logger.debug('Content or templates changed, starting'
+                             ' generation %d', self.generation+1)
+                self._fingerprint = current
+                self.generation += 1
+                self._index = None
+
+            if self._page_generations.get(path, 0) == self.generation:
+                return False
+            with post_cache(self.content_dir):
+                rendered = self._render(path)
+            self._page_generations[path] = self.generation
+            return rendered
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = load_index(self.content_dir)
+        return self._index
+
+    def _render(self, path):
+        dirname, filename = os.path.split(path)
+        name, ext = os.path.splitext(filename)
+        if ext != '.html':
+            return False
+
+        index_page = re.match(r'^(?:index|page/(\d+))\.html$', path)
+        tag_page = re.match(r'^tag/(.+?)(?:/page/(\d+))?\.html$', path)
+        if index_page:
+            generate_index(content_dir=self.content_dir,
+                           output_dir=self.output_dir,
+                           index=self.index,
+                           pages=[int(index_page.group(1) or 1)])
+        elif tag_page:
+            if tag_page.group(1) not in self.index.tags:
+                return False
+            generate_tag_page(tag=tag_page.group(1),
+                              content_dir=self.content_dir,
+                              output_dir=self.output_dir,
+                              index=self.index,
+                              pages=[int(tag_page.group(2) or 1)])
+        elif not dirname:
+            template_name = _template_name(config.get('POST_TEMPLATE'))
+            post = self.index.get(name)
+            if post is None:
+                return False
+            generate_post_page(post=post,
+                               output_dir=self.output_dir,
+                               template=get_env().get_template(
+                                   template_name or 'post.html'
+                               ))
+        else:
+            return False
+        return True
+
 
 def publish_webhook(*, post, webhook_url):
     '''
@@ -288,21 +1724,145 @@ def publish_webhook(*, post, webhook_url):
     # nice to provide other endpoints
 
 
-def regenerate(*, content_dir, output_dir):
+def regenerate(*, content_dir, output_dir, workers=None):
     '''
     Regenerate all pages in the site, from ``content_dir`` to ``output_dir``.
+
+    The posts are scanned once into a ``PostIndex``, which already groups
+    them by tag, so every page is rendered exactly once. Parsing and
+    rendering the posts and their pages is spread over ``workers``
+    processes, ``config['WORKERS']`` by default. With a single worker, or if
+    the processes can't be started, everything is done in this process.
+    Afterwards, the render store is pruned of the entries that went unused
+    for ``config['RENDER_STORE_MAX_AGE']`` days.
+
+    Return a ``BuildReport`` of the pages that were rendered.
+    '''
+    if workers is None:
+        workers = config.get('WORKERS', 1)
+
+    with metrics.build('regenerate', output_dir=output_dir), \
+            compressing(), post_cache(content_dir), fixed_theme() as theme:
+        report = BuildReport()
+        with worker_pool(workers) as executor:
+            index = load_index(content_dir, executor=executor)
+            for post_report in _map(executor,
+                                    functools.partial(_generate_post_page,
+                                                      output_dir=output_dir,
+                                                      theme=theme),
+                                    index.posts):
+                report += post_report
+
+        report += generate_index(content_dir=content_dir,
+                                 output_dir=output_dir, index=index)
+
+        for tag in index.tags:
+            report += generate_tag_page(tag=tag, content_dir=content_dir,
+                                        output_dir=output_dir, index=index)
+
+        generate_rss(content_dir=content_dir, output_dir=output_dir,
+                     index=index)
+        generate_atom(content_dir=content_dir, output_dir=output_dir,
+                      index=index)
+        generate_search_index(output_dir=output_dir, index=index)
+        prune_render_store()
+
+    return report
+
+
+def _generate_post_page(post, *, output_dir, theme=None):
+    with fixed_theme(theme):
+        return generate_post_page(post=post, output_dir=output_dir)
+
+
+@contextlib.contextmanager
+def worker_pool(workers):
+    '''
+    Yield a ``ProcessPoolExecutor`` with ``workers`` processes that share this
+    process's ``config`` and template globals, or ``None`` if ``workers`` is
+    less than 2 or the pool can't be created.
     '''
+    if workers < 2:
+        yield None
+        return
+
+    try:
+        import concurrent.futures
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(_picklable(config), _picklable(get_env().globals),
+                      _template_name(config.get('POST_TEMPLATE')),
+                      getattr(get_env().bytecode_cache, 'directory', None)),
+        )
+    except (ImportError, NotImplementedError, OSError) as e:
+        logger.warning('Unable to start %d workers, running serially: %s',
+                       workers, e)
+        yield None
+        return
+
+    with executor:
+        yield executor
 
-    for entry in os.scandir(content_dir):
-        if not entry.name.endswith('.md'):
+
+def _init_worker(settings, env_globals, post_template, bytecode_cache):
+    # A forked worker inherits the thread pool of the ``compressing`` block
+    # it was started in, which isn't running in this process, and the
+    # connections of the ``post_cache`` block, which can't be shared.
+    _compression.executor = None
+    _compression.futures = []
+    _post_caches.caches = {}
+    _post_caches.keep_open = True
+    config.clear()
+    config.update(settings)
+    get_env().globals.update(env_globals)
+    if bytecode_cache is not None:
+        use_bytecode_cache(bytecode_cache)
+    if post_template is not None:
+        config['POST_TEMPLATE'] = get_env().get_template(post_template)
+
+
+def _picklable(mapping):
+    '''
+    Return the items from ``mapping`` that can be sent to a worker process.
+    '''
+    result = {}
+    for key, value in mapping.items():
+        try:
+            pickle.dumps(value)
+        except Exception:
             continue
-        with open(os.path.join(content_dir, entry.name), 'r') as f:
-            post = Post(f.read())
-            with open(os.path.join(output_dir, post.slug+'.html'), 'w') as f:
-                f.write(post.render())
+        result[key] = value
+    return result
+
+
+def _template_name(template):
+    return getattr(template, 'name', None)
 
-    generate_index(content_dir=content_dir, output_dir=output_dir)
 
-    for post in load_posts(content_dir=content_dir):
-        for tag in post.tags:
-            generate_tag_page(tag=tag, content_dir=content_dir, output_dir=output_dir)
+def _map(executor, func, items):
+    '''
+    Return ``func`` applied to each of ``items``, in order, using
+    ``executor`` if it isn't ``None``.
+    '''
+    if executor is None:
+        return [func(item) for item in items]
+    # Big enough chunks to amortize the pickling, small enough to keep every
+    # worker busy.
+    chunksize = max(1, len(items) // 64)
+    results = []
+    for result, tally in executor.map(functools.partial(_tallied, func),
+                                      items, chunksize=chunksize):
+        metrics.merge(tally)
+        results.append(result)
+    return results
+
+
+def _tallied(func, item):
+    '''
+    Return ``func(item)`` and a ``metrics.Tally`` of what it did, which would
+    otherwise be lost in the worker process.
+    '''
+    with metrics.tally() as tally:
+        result = func(item)
+    return result, tally
@@ -0,0 +1,163 @@
+'''
+RSS and Atom feeds.
+
+Feeds are written with ``xml.sax.saxutils.XMLGenerator``, one element at a
+time, and read back with ``ElementTree.iterparse``, so that publishing a
+post can update the existing feed with ``merge_entries`` rather than
+loading and rendering every post in it again. The XML and email modules are
+only imported when a feed is read or written; ``xml.sax.saxutils`` alone
+pulls in ``urllib.request``.
+'''
+from datetime import datetime
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+
+ATOM_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+class FeedEntry:
+    '''
+    One post in a feed. ``id`` identifies the post across updates, and
+    ``content`` is its HTML.
+    '''
+    def __init__(self, *, id, title, link, author, published, updated=None,
+                 content=''):
+        self.id = id
+        self.title = title
+        self.link = link
+        self.author = author
+        self.published = published
+        self.updated = updated
+        self.content = content
+
+
+def merge_entries(entries, entry, size):
+    '''
+    Return ``entries`` with ``entry`` added, replacing the entry with the
+    same ``id``, newest first and cut down to the newest ``size``.
+    '''
+    entries = [old for old in entries if old.id != entry.id]
+    entries.append(entry)
+    entries.sort(key=lambda entry: (entry.published, entry.id), reverse=True)
+    return entries[:size]
+
+
+def write_rss(out, entries, *, title, link, description=''):
+    '''
+    Write an RSS 2.0 feed of ``entries`` to the text file ``out``.
+    '''
+    from email.utils import format_datetime
+    from xml.sax.saxutils import XMLGenerator
+    xml = XMLGenerator(out, encoding='utf-8', short_empty_elements=True)
+    xml.startDocument()
+    xml.startElement('rss', {'version': '2.0'})
+    xml.startElement('channel', {})
+    _element(xml, 'title', title)
+    _element(xml, 'link', link)
+    _element(xml, 'description', description)
+    for entry in entries:
+        xml.startElement('item', {})
+        _element(xml, 'title', entry.title)
+        _element(xml, 'link', entry.link)
+        _element(xml, 'guid', entry.id, {'isPermaLink': 'false'})
+        _element(xml, 'author', entry.author)
+        _element(xml, 'pubDate', format_datetime(entry.published))
+        _element(xml, 'description', entry.content)
+        xml.endElement('item')
+        xml.ignorableWhitespace('\n')
+    xml.endElement('channel')
+    xml.endElement('rss')
+    xml.endDocument()
+
+
+def read_rss(path):
+    '''
+    Return the ``FeedEntry`` list of the RSS feed at ``path``.
+    '''
+    from email.utils import parsedate_to_datetime
+    from xml.etree import ElementTree
+    entries = []
+    for event, element in ElementTree.iterparse(path):
+        if element.tag == 'item':
+            entries.append(FeedEntry(
+                id=element.findtext('guid'),
+                title=element.findtext('title'),
+                link=element.findtext('link'),
+                author=element.findtext('author'),
+                published=parsedate_to_datetime(element.findtext('pubDate')),
+                content=element.findtext('description', ''),
+            ))
+            element.clear()
+    return entries
+
+
+def write_atom(out, entries, *, title, link):
+    '''
+    Write an Atom feed of ``entries`` to the text file ``out``.
+    '''
+    from xml.sax.saxutils import XMLGenerator
+    updated = max((entry.updated or entry.published for entry in entries),
+                  default=datetime.now())
+    xml = XMLGenerator(out, encoding='utf-8', short_empty_elements=True)
+    xml.startDocument()
+    xml.startElement('feed', {'xmlns': ATOM_NS})
+    _element(xml, 'id', link + '/')
+    _element(xml, 'title', title)
+    _element(xml, 'updated', updated.strftime(ATOM_DATE_FORMAT))
+    _element(xml, 'link', attrs={'rel': 'self', 'href': link + '/atom.xml'})
+    _element(xml, 'link', attrs={'href': link + '/'})
+    for entry in entries:
+        xml.startElement('entry', {})
+        _element(xml, 'id', entry.id)
+        _element(xml, 'title', entry.title)
+        _element(xml, 'link', attrs={'href': entry.link})
+        _element(xml, 'published',
+                 entry.published.strftime(ATOM_DATE_FORMAT))
+        _element(xml, 'updated', (entry.updated or entry.published)
+                                 .strftime(ATOM_DATE_FORMAT))
+        xml.startElement('author', {})
+        _element(xml, 'name', entry.author)
+        xml.endElement('author')
+        _element(xml, 'content', entry.content, {'type': 'html'})
+        xml.endElement('entry')
+        xml.ignorableWhitespace('\n')
+    xml.endElement('feed')
+    xml.endDocument()
+
+
+def read_atom(path):
+    '''
+    Return the ``FeedEntry`` list of the Atom feed at ``path``.
+    '''
+    from xml.etree import ElementTree
+    def text(element, tag, default=None):
+        return element.findtext('{{{}}}{}'.format(ATOM_NS, tag), default)
+
+    entries = []
+    for event, element in ElementTree.iterparse(path):
+        if element.tag == '{{{}}}entry'.format(ATOM_NS):
+            published = datetime.strptime(text(element, 'published'),
+                                          ATOM_DATE_FORMAT)
+            updated = datetime.strptime(text(element, 'updated'),
+                                        ATOM_DATE_FORMAT)
+            link = element.find('{{{}}}link'.format(ATOM_NS))
+            entries.append(FeedEntry(
+                id=text(element, 'id'),
+                title=text(element, 'title'),
+                link=link.get('href') if link is not None else None,
+                author=element.findtext('{{{0}}}author/{{{0}}}name'
+                                        .format(ATOM_NS)),
+                published=published,
+                updated=updated if updated != published else None,
+                content=text(element, 'content', ''),
+            ))
+            element.clear()
+    return entries
+
+
+def _element(xml, name, text=None, attrs=None):
+    xml.startElement(name, attrs or {})
+    if text:
+        xml.characters(text)
+    xml.endElement(name)
+    xml.ignorableWhitespace('\n')
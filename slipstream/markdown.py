@@ -0,0 +1,208 @@
+'''
+Markdown renderers.
+
+``Post.content`` is rendered by the backend named in ``config['MARKDOWN']``
+(``SLIPSTREAM_MARKDOWN``):
+
+- ``commonmark``, the default: CommonMark-py, in pure Python.
+- ``cmark``: GitHub's C implementation of CommonMark, through ``cmarkgfm``
+  (``pip install slipstream[cmark]``). It renders many times faster.
+- ``markdown-it``: ``markdown-it-py`` in CommonMark mode
+  (``pip install slipstream[markdown-it]``), which follows a newer version
+  of the spec, in pure Python.
+
+Every backend passes raw HTML in posts through, like CommonMark-py does.
+Their HTML only differs where ``canonical`` says it doesn't matter, which
+``tests/test_markdown.py`` checks and ``benchmarks/renderers.py`` checks on
+a whole corpus while it measures how fast each one is. A backend that isn't
+installed is warned about once, and ``commonmark`` is used instead.
+'''
+import functools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT = 'commonmark'
+
+
+class Renderer:
+    '''
+    A Markdown backend. ``render(text)`` returns the HTML of ``text``.
+    ``id`` names the backend and the version of its package, so that
+    caches of its HTML can be keyed on it.
+    '''
+    name = None
+    distribution = None
+
+    def __init__(self, module):
+        version = getattr(module, '__version__', None)
+        if version is None:
+            version = _distribution_version(self.distribution)
+        self.id = '{}-{}'.format(self.name, version)
+
+    def render(self, text):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.id)
+
+
+class CommonMarkRenderer(Renderer):
+    name = 'commonmark'
+    distribution = 'CommonMark'
+
+    def __init__(self):
+        import CommonMark
+        super().__init__(CommonMark)
+        self._parser = CommonMark.DocParser()
+        self._renderer = CommonMark.HTMLRenderer()
+
+    def render(self, text):
+        return self._renderer.render(self._parser.parse(text))
+
+
+class CmarkRenderer(Renderer):
+    name = 'cmark'
+    distribution = 'cmarkgfm'
+
+    def __init__(self):
+        import cmarkgfm
+        from cmarkgfm.cmark import Options
+        super().__init__(cmarkgfm)
+        self._markdown_to_html = cmarkgfm.markdown_to_html
+        # cmark drops raw HTML unless it's told not to.
+        self._options = Options.CMARK_OPT_UNSAFE
+
+    def render(self, text):
+        return self._markdown_to_html(text, options=self._options)
+
+
+class MarkdownItRenderer(Renderer):
+    name = 'markdown-it'
+    distribution = 'markdown-it-py'
+
+    def __init__(self):
+        import markdown_it
+        super().__init__(markdown_it)
+        self._render = markdown_it.MarkdownIt('commonmark').render
+
+    def render(self, text):
+        return self._render(text)
+
+
+BACKENDS = {backend.name: backend
+            for backend in (CommonMarkRenderer, CmarkRenderer,
+                            MarkdownItRenderer)}
+
+_renderers = {}
+_lock = threading.Lock()
+
+
+def get(name=None):
+    '''
+    Return the ``Renderer`` of the backend ``name``, ``DEFAULT`` if it's
+    ``None``. An unknown backend, or one that isn't installed, is warned
+    about the first time, and ``DEFAULT`` is returned instead.
+    '''
+    name = name or DEFAULT
+    try:
+        return _renderers[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _renderers:
+            _renderers[name] = _load(name)
+        return _renderers[name]
+
+
+def _load(name):
+    if name not in BACKENDS:
+        problem = 'Unknown Markdown renderer {!r}'.format(name)
+    else:
+        try:
+            return BACKENDS[name]()
+        except ImportError as e:
+            problem = 'Unable to load the {!r} Markdown renderer: {}'.format(
+                name, e
+            )
+    logger.warning('%s, using %r', problem, DEFAULT)
+    if DEFAULT not in _renderers:
+        _renderers[DEFAULT] = BACKENDS[DEFAULT]()
+    return _renderers[DEFAULT]
+
+
+def available():
+    '''
+    Return the names of the backends that are installed.
+    '''
+    names = []
+    for name in BACKENDS:
+        try:
+            BACKENDS[name]()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def canonical(html):
+    '''
+    Return ``html`` as a list of tags and text, without what doesn't change
+    how it displays: whitespace between block tags, newlines before a
+    closing tag, the order of attributes, how characters are escaped and
+    whether empty tags are closed with ``/>``. CommonMark-py ends code
+    blocks followed by a blank line with an extra newline, for one, which
+    newer versions of the spec don't.
+    '''
+    tokens = _tokenizer()()
+    tokens.feed(html)
+    tokens.close()
+    return tokens.tokens
+
+
+@functools.lru_cache(maxsize=None)
+def _tokenizer():
+    # ``html.parser`` is only imported by the tests and benchmarks that
+    # compare renderers, never by a build.
+    from html.parser import HTMLParser
+
+    class _Tokenizer(_Tokens, HTMLParser):
+        pass
+    return _Tokenizer
+
+
+class _Tokens:
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+
+    def handle_starttag(self, tag, attrs):
+        self.tokens.append(('start', tag, tuple(sorted(attrs))))
+
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        if self.tokens and self.tokens[-1][0] == 'data':
+            data = self.tokens.pop()[1].rstrip('\n')
+            if data:
+                self.tokens.append(('data', data))
+        self.tokens.append(('end', tag))
+
+    def handle_data(self, data):
+        if not data.strip():
+            return
+        if self.tokens and self.tokens[-1][0] == 'data':
+            data = self.tokens.pop()[1] + data
+        self.tokens.append(('data', data))
+
+    def handle_comment(self, data):
+        self.tokens.append(('comment', data))
+
+
+def _distribution_version(distribution):
+    try:
+        from importlib import metadata
+        return metadata.version(distribution)
+    except ImportError:
+        return ''
@@ -0,0 +1,223 @@
+'''
+Counters and phase timers for builds.
+
+The build code counts what it does (``inc('pages_written')``) and times its
+phases (``with timer('render'): ...``) in the process-wide ``registry``.
+``render`` returns everything counted so far in the Prometheus text format,
+for the ``/metrics`` endpoint. Wrapping a build in ``build`` also logs one
+``key=value`` line with what that build did, e.g.::
+
+    build=publish seconds=0.083 posts_parsed=1 pages_rendered=3 ...
+
+Work done in other processes is counted with ``tally`` there and added to
+the registry with ``merge``.
+'''
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'slipstream_'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+COUNTERS = collections.OrderedDict([
+    ('posts_loaded', 'Posts loaded from the content directory.'),
+    ('posts_parsed', 'Posts parsed in full, rather than from the cache or'
+                     ' from their headers.'),
+    ('post_cache_hits', 'Posts found in the post cache.'),
+    ('post_cache_misses', 'Posts missing or out of date in the post cache.'),
+    ('render_cache_hits', 'Markdown renders served by the render cache.'),
+    ('render_cache_misses', 'Markdown renders not in the render cache.'),
+    ('render_store_hits', 'Markdown and pages found in the shared render'
+                          ' store.'),
+    ('render_store_misses', 'Markdown and pages not in the shared render'
+                            ' store.'),
+    ('render_store_pruned', 'Entries unused for RENDER_STORE_MAX_AGE days'
+                            ' removed from the shared render store.'),
+    ('pages_rendered', 'Pages rendered from templates.'),
+    ('pages_written', 'Rendered pages written to the output directory.'),
+    ('pages_skipped', 'Rendered pages skipped because they were unchanged.'),
+    ('bytes_written', 'Bytes of pages written to the output directory.'),
+    ('pages_compressed', 'Compressed copies of pages written next to them.'),
+    ('search_shards_written', 'Shards of the search index written.'),
+])
+
+PHASES_HELP = ('Time spent in each phase of a build: scan (loading posts),'
+               ' markdown, render (templates, streamed to a temporary file),'
+               ' feed, search (the search index), write (comparing and'
+               ' replacing files), compress, and whole publish and'
+               ' regenerate builds.')
+
+
+class Tally:
+    '''
+    Counts and phase timings: ``counters`` maps names to amounts and
+    ``phases`` maps phase names to ``[count, seconds]``.
+    '''
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.phases = collections.defaultdict(lambda: [0, 0.0])
+
+    def add(self, other):
+        self.counters.update(other.counters)
+        for phase, (count, seconds) in other.phases.items():
+            timing = self.phases[phase]
+            timing[0] += count
+            timing[1] += seconds
+
+    def __getstate__(self):
+        return {'counters': self.counters, 'phases': dict(self.phases)}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.counters.update(state['counters'])
+        self.phases.update(state['phases'])
+
+
+class Metrics:
+    '''
+    A registry of counters and phase timers, safe to use from any thread.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total = Tally()
+        self._local = threading.local()
+
+    def _tallies(self):
+        try:
+            return self._local.tallies
+        except AttributeError:
+            self._local.tallies = []
+            return self._local.tallies
+
+    def inc(self, name, amount=1):
+        '''
+        Add ``amount`` to the counter ``name``.
+        '''
+        with self._lock:
+            self._total.counters[name] += amount
+        for tally in self._tallies():
+            tally.counters[name] += amount
+
+    def observe(self, phase, seconds):
+        '''
+        Record that ``phase`` took ``seconds``.
+        '''
+        update = Tally()
+        update.phases[phase] = [1, seconds]
+        with self._lock:
+            self._total.add(update)
+        for tally in self._tallies():
+            tally.add(update)
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        '''
+        Time the ``with`` block as ``phase``.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def tally(self):
+        '''
+        Yield a ``Tally`` of everything counted by this thread in the
+        ``with`` block.
+        '''
+        tally = Tally()
+        self._tallies().append(tally)
+        try:
+            yield tally
+        finally:
+            self._tallies().remove(tally)
+
+    def merge(self, tally):
+        '''
+        Add ``tally``, counted elsewhere, e.g. in a worker process.
+        '''
+        with self._lock:
+            self._total.add(tally)
+        for current in self._tallies():
+            current.add(tally)
+
+    @contextlib.contextmanager
+    def build(self, name, **fields):
+        '''
+        Time the ``with`` block as the phase ``name``, and log what it did,
+        along with ``fields``, as one ``key=value`` line.
+        '''
+        start = time.perf_counter()
+        with self.tally() as tally:
+            try:
+                yield tally
+            finally:
+                seconds = time.perf_counter() - start
+                self.observe(name, seconds)
+        items = [('build', name)]
+        items.extend(sorted(fields.items()))
+        items.append(('seconds', '{:.3f}'.format(seconds)))
+        items.extend((counter, tally.counters[counter])
+                     for counter in COUNTERS)
+        items.extend(('{}_seconds'.format(phase), '{:.3f}'.format(total))
+                     for phase, (count, total) in sorted(tally.phases.items()))
+        logger.info(' '.join('{}={}'.format(key, _logfmt(value))
+                             for key, value in items))
+
+    def snapshot(self):
+        '''
+        Return a copy of the ``Tally`` of everything counted so far.
+        '''
+        snapshot = Tally()
+        with self._lock:
+            snapshot.add(self._total)
+        return snapshot
+
+    def render(self):
+        '''
+        Return the counters and timers in the Prometheus text format.
+        '''
+        snapshot = self.snapshot()
+        lines = []
+        for name, help_text in COUNTERS.items():
+            metric = PREFIX + name + '_total'
+            lines.append('# HELP {} {}'.format(metric, help_text))
+            lines.append('# TYPE {} counter'.format(metric))
+            lines.append('{} {}'.format(metric, snapshot.counters[name]))
+        metric = PREFIX + 'phase_seconds'
+        lines.append('# HELP {} {}'.format(metric, PHASES_HELP))
+        lines.append('# TYPE {} summary'.format(metric))
+        for phase, (count, seconds) in sorted(snapshot.phases.items()):
+            lines.append('{}_sum{{phase="{}"}} {!r}'.format(metric, phase,
+                                                            seconds))
+            lines.append('{}_count{{phase="{}"}} {}'.format(metric, phase,
+                                                            count))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._total = Tally()
+
+
+def _logfmt(value):
+    value = str(value)
+    if not value or any(c in value for c in ' ="'):
+        return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+    return value
+
+
+registry = Metrics()
+
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+tally = registry.tally
+merge = registry.merge
+build = registry.build
+render = registry.render
@@ -0,0 +1,142 @@
+'''
+A durable queue of posts waiting to be published.
+
+The webhook used to publish inline, so Draft had to wait for every page to
+be written, and under ``vortex`` every other request had to wait too. Now
+the webhook only adds the post to a ``PublishQueue`` and returns, and a
+background thread publishes it.
+
+Jobs are kept in sqlite until they have been published, so they survive a
+restart. They are keyed by the Draft document id: publishing the same
+document again before its job has run replaces the job, so a burst of edits
+is published once.
+'''
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PublishQueue:
+    '''
+    Queue of jobs stored in the sqlite database at ``path``. Each job is
+    passed to ``publish`` as keyword arguments once nothing has been queued
+    for its document for ``delay`` seconds.
+    '''
+    # The longest the background thread waits before looking for jobs
+    # again, when ``delay`` is 0.
+    poll_interval = 1.0
+
+    def __init__(self, path=':memory:', *, publish, delay=1.0):
+        self.path = path
+        self.publish = publish
+        self.delay = delay
+        self._conn = sqlite3.connect(path, timeout=30,
+                                     check_same_thread=False)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                               ' document TEXT PRIMARY KEY,'
+                               ' kwargs TEXT, queued_at REAL)')
+
+    def __len__(self):
+        with self._cond:
+            return self._conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+    def put(self, document, **kwargs):
+        '''
+        Queue ``kwargs`` to be published for ``document``, replacing any job
+        for ``document`` that hasn't run yet.
+        '''
+        with self._cond:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO jobs'
+                                   ' (document, kwargs, queued_at)'
+                                   ' VALUES (?, ?, ?)',
+                                   (str(document), json.dumps(kwargs),
+                                    time.time()))
+            self._cond.notify()
+
+    def _next(self, *, ready_before):
+        '''
+        Return the ``(rowid, document, kwargs)`` of the oldest job queued
+        before ``ready_before``, or ``None`` if there isn't one.
+        '''
+        with self._cond:
+            row = self._conn.execute('SELECT rowid, document, kwargs'
+                                     ' FROM jobs WHERE queued_at <= ?'
+                                     ' ORDER BY queued_at LIMIT 1',
+                                     (ready_before,)).fetchone()
+        if row is None:
+            return None
+        rowid, document, kwargs = row
+        return rowid, document, json.loads(kwargs)
+
+    def _run(self, rowid, document, kwargs):
+        try:
+            self.publish(**kwargs)
+        except Exception:
+            logger.exception('Unable to publish %r, dropping it', document)
+        with self._cond:
+            with self._conn:
+                # If the document was queued again while it was being
+                # published, the row was replaced and has to run again.
+                self._conn.execute('DELETE FROM jobs WHERE rowid = ?',
+                                   (rowid,))
+
+    def drain(self):
+        '''
+        Publish every queued job now, without waiting for ``delay``. Return
+        the number of jobs published.
+        '''
+        count = 0
+        job = self._next(ready_before=float('inf'))
+        while job is not None:
+            self._run(*job)
+            count += 1
+            job = self._next(ready_before=float('inf'))
+        return count
+
+    def start(self):
+        '''
+        Start publishing jobs in a background thread.
+        '''
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._work,
+                                        name='slipstream-publisher',
+                                        daemon=True)
+        self._thread.start()
+        logger.info('Started publisher for %r', self.path)
+
+    def stop(self):
+        '''
+        Stop the background thread, after the job it's running is done.
+        '''
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                job = self._next(ready_before=time.time()-self.delay)
+                if job is None:
+                    # Looking for a job and waiting under the same lock
+                    # means a ``put`` can't notify in between and be missed.
+                    # The timeout is only a safety net with no ``delay``.
+                    self._cond.wait(timeout=self.delay or self.poll_interval)
+                    continue
+            self._run(*job)
@@ -0,0 +1,239 @@
+'''
+A search index that browsers can query without a server.
+
+The index is a handful of JSON files in ``output_dir/search``:
+
+- ``posts.json``, the metadata of each post by id::
+
+      {"version": 1, "prefix": 2,
+       "posts": [["fnord", "Fnord", "2010-08-14"], null, ...]}
+
+  A post is ``[slug, title, date]``, and its page is ``<slug>.html``. Ids
+  of removed posts are ``null`` until a new post takes them.
+- ``<prefix>.json``, one shard of the inverted index for every ``prefix``
+  of ``PREFIX_LENGTH`` characters: each term that starts with it, mapped to
+  the sorted ids of the posts that contain it::
+
+      {"python": [0, 3, 7], "pythonic": [3]}
+
+The terms of a post are the words (runs of letters and digits) of its
+title, tags and Markdown, lower cased, leaving out link targets and HTML
+tags. To look up ``python static``, a browser fetches ``posts.json``,
+``py.json`` and ``st.json`` and intersects the posting lists; a shorter
+word is its own prefix.
+
+``.shards.json`` lists the shards each post is in, so that updating or
+removing a post only reads and writes those shards and ``posts.json``,
+without tokenizing the old version of the post or any other post.
+'''
+import bisect
+import collections
+import functools
+import json
+import logging
+import os
+import re
+
+from . import compress
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = 'search'
+
+POSTS = 'posts.json'
+
+SHARDS = '.shards.json'
+
+FORMAT_VERSION = 1
+
+PREFIX_LENGTH = 2
+
+MIN_TERM_LENGTH = 2
+
+# Link targets and HTML tags, which aren't what a post is about.
+_MARKUP = re.compile(r'\]\([^)]*\)|<[^>]*>')
+
+_TERM = re.compile(r'[^\W_]+')
+
+
+def terms(post):
+    '''
+    Return the set of terms in ``post``.
+    '''
+    text = ' '.join([post.title, ' '.join(post.tags),
+                     _MARKUP.sub(' ', post.raw_content)]).lower()
+    return {term for term in _TERM.findall(text)
+            if len(term) >= MIN_TERM_LENGTH}
+
+
+def shard_of(term):
+    return term[:PREFIX_LENGTH]
+
+
+class SearchIndex:
+    '''
+    The search index in ``directory``. ``posts`` and ``post_shards`` are
+    the tables of ``posts.json`` and ``.shards.json``. The shards are only
+    read from ``directory`` when a post in them changes, and only if the
+    index is ``existing`` there; otherwise ``save`` replaces every shard.
+    '''
+    def __init__(self, directory, *, posts=(), post_shards=(),
+                 existing=False):
+        self.directory = directory
+        self.posts = list(posts)
+        self.post_shards = list(post_shards)
+        self.existing = existing
+        self._ids = {post[0]: id for id, post in enumerate(self.posts)
+                     if post is not None}
+        self._shards = {}
+        self._changed = set()
+
+    @classmethod
+    def load(cls, directory):
+        '''
+        Return the index saved in ``directory``, or ``None`` if there isn't
+        a readable one.
+        '''
+        try:
+            with open(os.path.join(directory, POSTS), encoding='utf-8') as f:
+                data = json.load(f)
+            with open(os.path.join(directory, SHARDS),
+                      encoding='utf-8') as f:
+                post_shards = json.load(f)
+            if (data['version'], data['prefix']) != (FORMAT_VERSION,
+                                                     PREFIX_LENGTH):
+                raise ValueError('format {version}, prefix {prefix}'
+                                 .format(**data))
+            if len(data['posts']) != len(post_shards):
+                raise ValueError('{} posts in {}, but {} in {}'.format(
+                    len(data['posts']), POSTS, len(post_shards), SHARDS
+                ))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.info('No search index in %r: %s', directory, e)
+            return None
+        return cls(directory, posts=data['posts'], post_shards=post_shards,
+                   existing=True)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, slug):
+        return slug in self._ids
+
+    def add(self, post):
+        '''
+        Add ``post`` to the index, in place of the post with the same slug,
+        whose id it keeps.
+        '''
+        id = self._ids.get(post.slug)
+        if id is None:
+            id = self._free_id()
+        else:
+            self._unlist(id)
+        by_shard = collections.defaultdict(list)
+        for term in terms(post):
+            by_shard[shard_of(term)].append(term)
+        for name, shard_terms in by_shard.items():
+            shard = self._shard(name)
+            for term in shard_terms:
+                bisect.insort(shard.setdefault(term, []), id)
+            self._changed.add(name)
+        self.posts[id] = [post.slug, post.title,
+                          post.publish_timestamp.strftime('%Y-%m-%d')]
+        self.post_shards[id] = sorted(by_shard)
+        self._ids[post.slug] = id
+
+    def remove(self, slug):
+        '''
+        Remove the post ``slug`` from the index. Return ``False`` if it
+        wasn't in it.
+        '''
+        id = self._ids.pop(slug, None)
+        if id is None:
+            return False
+        self._unlist(id)
+        self.posts[id] = None
+        self.post_shards[id] = None
+        return True
+
+    def save(self, write):
+        '''
+        Write the shards that changed, and the tables, with
+        ``write(path, write_to)`` (see ``core.write_atomically``), and
+        remove the shards that are now empty. Return the number of shards
+        written.
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        names = set(self._changed)
+        if not self.existing:
+            names.update(name[:-len('.json')]
+                         for name in os.listdir(self.directory)
+                         if name.endswith('.json') and name != POSTS
+                         and not name.startswith('.'))
+        written = 0
+        for name in sorted(names):
+            path = os.path.join(self.directory, name + '.json')
+            shard = self._shards.get(name)
+            if shard:
+                write(path, functools.partial(_dump, shard))
+                written += 1
+            else:
+                _remove(path)
+        write(os.path.join(self.directory, SHARDS),
+              functools.partial(_dump, self.post_shards))
+        write(os.path.join(self.directory, POSTS),
+              functools.partial(_dump, {'version': FORMAT_VERSION,
+                                        'prefix': PREFIX_LENGTH,
+                                        'posts': self.posts}))
+        self._changed.clear()
+        self.existing = True
+        return written
+
+    def _free_id(self):
+        try:
+            return self.posts.index(None)
+        except ValueError:
+            self.posts.append(None)
+            self.post_shards.append(None)
+            return len(self.posts) - 1
+
+    def _unlist(self, id):
+        for name in self.post_shards[id] or ():
+            shard = self._shard(name)
+            for term, ids in list(shard.items()):
+                i = bisect.bisect_left(ids, id)
+                if i < len(ids) and ids[i] == id:
+                    del ids[i]
+                    if not ids:
+                        del shard[term]
+            self._changed.add(name)
+
+    def _shard(self, name):
+        shard = self._shards.get(name)
+        if shard is None:
+            shard = {}
+            if self.existing:
+                path = os.path.join(self.directory, name + '.json')
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        shard = json.load(f)
+                except FileNotFoundError:
+                    pass
+            self._shards[name] = shard
+        return shard
+
+
+def _dump(data, f):
+    # One write of ``dumps``, which is much faster than ``dump`` and its
+    # many small writes.
+    f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                       sort_keys=True))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return
+    logger.debug('Removed %r', path)
+    compress.remove(path)
@@ -0,0 +1,97 @@
+'''
+Settings from the ``SLIPSTREAM_*`` environment variables.
+
+``load`` only reads them, and ``configure`` also applies them to
+``config``, the template environment and the caches in ``core``. Neither
+needs the web server, so ``slipstream build`` can use them without
+importing Flask or Tornado, or creating an API key.
+'''
+import os
+
+from . import config
+from . import core
+
+
+def load(environ=None):
+    '''
+    Return a dict of the settings in ``environ``, ``os.environ`` by
+    default. ``POST_TEMPLATE`` is the name of the template.
+    '''
+    if environ is None:
+        environ = os.environ
+    settings = {}
+    settings['CONTENT_DIR'] = os.path.abspath(
+        environ.get('SLIPSTREAM_CONTENT_DIR', 'content')
+    )
+    settings['OUTPUT_DIR'] = os.path.abspath(
+        environ.get('SLIPSTREAM_OUTPUT_DIR', 'output')
+    )
+    data_dir = os.path.dirname(settings['CONTENT_DIR'])
+    settings['POST_CACHE'] = os.path.abspath(
+        environ.get('SLIPSTREAM_POST_CACHE',
+                    os.path.join(data_dir, '.slipstream_cache.sqlite'))
+    )
+    settings['DEFAULT_AUTHOR'] = environ.get('SLIPSTREAM_DEFAULT_AUTHOR',
+                                             'Anonymous')
+    settings['TEMPLATE_CACHE'] = os.path.abspath(
+        environ.get('SLIPSTREAM_TEMPLATE_CACHE',
+                    os.path.join(data_dir, '.slipstream_templates'))
+    )
+    settings['RENDER_STORE'] = os.path.abspath(
+        environ.get('SLIPSTREAM_RENDER_STORE',
+                    os.path.join(data_dir, '.slipstream_renders'))
+    )
+    settings['RENDER_STORE_MAX_AGE'] = float(
+        environ.get('SLIPSTREAM_RENDER_STORE_MAX_AGE', 30)
+    )
+    settings['POST_TEMPLATE'] = environ.get('SLIPSTREAM_POST_TEMPLATE',
+                                            'post.html')
+    settings['SITE_URL'] = environ.get('SLIPSTREAM_SITE_URL', '')
+    settings['PUBLISH_QUEUE'] = os.path.abspath(
+        environ.get('SLIPSTREAM_PUBLISH_QUEUE',
+                    os.path.join(data_dir, '.slipstream_queue.sqlite'))
+    )
+    settings['PUBLISH_DELAY'] = float(
+        environ.get('SLIPSTREAM_PUBLISH_DELAY', 1.0)
+    )
+    settings['WORKERS'] = int(
+        environ.get('SLIPSTREAM_WORKERS', os.cpu_count() or 1)
+    )
+    settings['BLOG_NAME'] = environ.get('SLIPSTREAM_BLOG_NAME')
+    settings['PAGE_SIZE'] = int(environ.get('SLIPSTREAM_PAGE_SIZE', 10))
+    settings['FEED_SIZE'] = int(environ.get('SLIPSTREAM_FEED_SIZE', 20))
+    settings['EXCERPTS'] = str(
+        environ.get('SLIPSTREAM_EXCERPTS')
+    ).lower() == 'true'
+    settings['COMPRESS'] = [
+        name.strip()
+        for name in environ.get('SLIPSTREAM_COMPRESS', 'gzip').split(',')
+        if name.strip()
+    ]
+    settings['WATCH'] = str(
+        environ.get('SLIPSTREAM_WATCH')
+    ).lower() == 'true'
+    settings['SEARCH'] = str(
+        environ.get('SLIPSTREAM_SEARCH', 'true')
+    ).lower() == 'true'
+    settings['MARKDOWN'] = environ.get('SLIPSTREAM_MARKDOWN', 'commonmark')
+    settings['RENDER_CACHE_SIZE'] = int(
+        environ.get('SLIPSTREAM_RENDER_CACHE_SIZE', 1024)
+    )
+    return settings
+
+
+def configure(environ=None):
+    '''
+    Load the settings from ``environ`` and apply them to ``config`` and
+    ``core``. Return the settings, with ``POST_TEMPLATE`` loaded.
+    '''
+    settings = load(environ)
+    core.use_bytecode_cache(settings['TEMPLATE_CACHE'])
+    settings['POST_TEMPLATE'] = core.get_env().get_template(
+        settings['POST_TEMPLATE']
+    )
+    core.markdown_cache.maxsize = settings['RENDER_CACHE_SIZE']
+    config.update(settings)
+    core.get_env().globals.update(settings)
+    return settings
@@ -17,70 +17,142 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import json
 import os
-from flask import Flask, abort, request, send_from_directory
+import threading
+from flask import Flask, Response, abort, request, send_from_directory
 from . import util
 from . import core
 from . import config
+from . import metrics
+from . import settings
+from . import watch
+from .publisher import PublishQueue
 
 app = Flask(__name__)
-app.config['API_KEY'] = util.get_api_key()
 
+_preview = None
+_lock = threading.Lock()
+_publish_queue = None
 
-@app.route('/<api_key>', methods=['POST'])
-def api(api_key):
-    if api_key != app.config['API_KEY']:
-        app.logger.warning('Bad API key %r', api_key)
+
+def api_key():
+    '''
+    Return ``app.config['API_KEY']``, loading it with ``util.get_api_key``
+    the first time, so that importing this module doesn't read or create the
+    key file.
+    '''
+    with _lock:
+        if 'API_KEY' not in app.config:
+            app.config['API_KEY'] = util.get_api_key()
+        return app.config['API_KEY']
+
+
+def _publish(**kwargs):
+    core.publish(**kwargs)
+
+
+def get_publish_queue():
+    '''
+    Return the ``PublishQueue`` stored in ``config['PUBLISH_QUEUE']``,
+    creating it if necessary. If that isn't set, the queue is only kept in
+    memory.
+    '''
+    global _publish_queue
+    with _lock:
+        if _publish_queue is None:
+            _publish_queue = PublishQueue(
+                app.config.get('PUBLISH_QUEUE', ':memory:'),
+                publish=_publish,
+                delay=app.config.get('PUBLISH_DELAY', 1.0),
+            )
+        return _publish_queue
+
+
+def get_preview():
+    '''
+    Return the ``core.Preview`` for the configured content and output
+    directories, creating it if necessary.
+    '''
+    global _preview
+    with _lock:
+        if (_preview is None
+                or _preview.content_dir != app.config['CONTENT_DIR']
+                or _preview.output_dir != app.config['OUTPUT_DIR']):
+            _preview = core.Preview(content_dir=app.config['CONTENT_DIR'],
+                                    output_dir=app.config['OUTPUT_DIR'])
+        return _preview
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route('/<key>', methods=['POST'])
+def api(key):
+    if key != api_key():
+        app.logger.warning('Bad API key %r', key)
         abort(403)
     else:
         app.logger.info('hi')
         app.logger.info('Payload: %s', request.form['payload'])
-        payload = json.loads(request.form['payload'])
-        # TODO: Also pass created/updated dates -W. Werner, 2015-11-21
-        core.publish(id=payload['id'],
-                     title=payload['name'],
-                     content=payload['content'],
-                     author=payload['user']['email'],
-                     )
+        queue_payload(json.loads(request.form['payload']))
+        return 'Accepted', 202
+
 
-        app.logger.debug(payload)
-        return 'OK'
+def queue_payload(payload):
+    '''
+    Queue the post in the Draft webhook ``payload`` to be published.
+    '''
+    # TODO: Also pass created/updated dates -W. Werner, 2015-11-21
+    get_publish_queue().put(payload['id'],
+                            id=payload['id'],
+                            title=payload['name'],
+                            content=payload['content'],
+                            author=payload['user']['email'],
+                            )
+    app.logger.debug(payload)
 
 
 @app.route('/preview', defaults={'path': 'index.html'})
 @app.route('/preview/<path:path>')
 def preview(path):
-    core.env = core.jinja2.Environment(
-        loader = core.jinja2.FileSystemLoader(os.path.join(os.path.dirname(__file__),
-                                                      'themes'))
-    )
-    core.env.globals.update(app.config)
-    core.regenerate(content_dir=app.config['CONTENT_DIR'],
-                    output_dir=app.config['OUTPUT_DIR'],
-                    )
-    app.logger.debug(app.config['OUTPUT_DIR'])
+    if get_preview().update(path):
+        app.logger.debug('Rendered %r in %r', path, app.config['OUTPUT_DIR'])
     return send_from_directory(app.config['OUTPUT_DIR'], path)
 
 
-def run():
-    app.config['CONTENT_DIR'] = os.path.abspath(
-        os.environ.get('SLIPSTREAM_CONTENT_DIR', 'content')
-    )
-    app.config['OUTPUT_DIR'] = os.path.abspath(
-        os.environ.get('SLIPSTREAM_OUTPUT_DIR', 'output')
-    )
-    app.config['DEFAULT_AUTHOR'] = os.environ.get('SLIPSTREAM_DEFAULT_AUTHOR',
-                                                  'Anonymous')
-    app.config['POST_TEMPLATE'] = core.env.get_template(
-        os.environ.get('SLIPSTREAM_POST_TEMPLATE', 'post.html')
-    )
-    app.config['SITE_URL'] = os.environ.get('SLIPSTREAM_SITE_URL', '')
-    app.config['BLOG_NAME'] = os.environ.get('SLIPSTREAM_BLOG_NAME')
+def configure():
+    '''
+    Load the configuration from the ``SLIPSTREAM_*`` environment variables
+    into ``app.config`` and the core ``config`` (see ``settings``). Return
+    the ``(ip, port, debug)`` to serve on.
+    '''
+    app.config.update(settings.configure())
     app.logger.debug('Site url: %r', app.config['SITE_URL'])
     ip = os.environ.get('SLIPSTREAM_IP_ADDR', '0.0.0.0')
     port = int(os.environ.get('SLIPSTREAM_PORT', 5000))
     debug = str(os.environ.get('SLIPSTREAM_DEBUG')).lower() == 'true'
     config.update(app.config)
-    core.env.globals.update(app.config)
+    core.get_env().globals.update(app.config)
+    return ip, port, debug
+
+
+def start():
+    '''
+    Regenerate the site and start publishing queued posts, and rebuilding
+    pages as files change if ``WATCH`` is set.
+    '''
+    core.precompile_templates()
     core.regenerate(content_dir=app.config['CONTENT_DIR'],
                     output_dir=app.config['OUTPUT_DIR'])
+    get_preview()
+    get_publish_queue().start()
+    if app.config.get('WATCH'):
+        watch.Watcher(content_dir=app.config['CONTENT_DIR'],
+                      output_dir=app.config['OUTPUT_DIR']).start()
+
+
+def run():
+    ip, port, debug = configure()
+    start()
     app.run(ip, port=port, debug=debug)
@@ -1,39 +1,88 @@
-import os
+'''
+Serve slipstream with Tornado.
 
+The webhook and preview are native Tornado handlers, so a slow preview
+render doesn't hold up every other connection: rendering happens in a
+thread pool while the IOLoop keeps serving. Any other route falls back to
+the Flask app.
+'''
+import json
+
+from concurrent.futures import ThreadPoolExecutor
 from tornado.wsgi import WSGIContainer
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
+from tornado.web import (Application, FallbackHandler, HTTPError,
+                         RequestHandler, StaticFileHandler)
 
 from . import slipstream
-from . import core
 from . import config
+from . import metrics
 
-def run():
-    slipstream.app.config['CONTENT_DIR'] = os.path.abspath(
-        os.environ.get('SLIPSTREAM_CONTENT_DIR', 'content')
-    )
-    slipstream.app.config['OUTPUT_DIR'] = os.path.abspath(
-        os.environ.get('SLIPSTREAM_OUTPUT_DIR', 'output')
-    )
-    slipstream.app.config['DEFAULT_AUTHOR'] = os.environ.get('SLIPSTREAM_DEFAULT_AUTHOR',
-                                                  'Anonymous')
-    slipstream.app.config['POST_TEMPLATE'] = core.env.get_template(
-        os.environ.get('SLIPSTREAM_POST_TEMPLATE', 'post.html')
+
+class WebhookHandler(RequestHandler):
+    def post(self, key):
+        if key != slipstream.api_key():
+            slipstream.app.logger.warning('Bad API key %r', key)
+            raise HTTPError(403)
+        payload = self.get_body_argument('payload')
+        slipstream.app.logger.info('Payload: %s', payload)
+        slipstream.queue_payload(json.loads(payload))
+        self.set_status(202)
+        self.finish('Accepted')
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', metrics.CONTENT_TYPE)
+        self.finish(metrics.render())
+
+
+class PreviewHandler(StaticFileHandler):
+    '''
+    Serve ``OUTPUT_DIR``, rendering the requested page first if it is out of
+    date. Rendering runs on ``executor`` so that the IOLoop isn't blocked.
+    '''
+    def initialize(self, path, executor, default_filename=None):
+        super().initialize(path, default_filename)
+        self.executor = executor
+
+    async def get(self, path, include_body=True):
+        path = path or self.default_filename
+        await IOLoop.current().run_in_executor(self.executor,
+                                               slipstream.get_preview().update,
+                                               path)
+        await super().get(path, include_body)
+
+
+def make_app(executor=None):
+    '''
+    Return the Tornado ``Application``. Blocking work is done on
+    ``executor``, a new ``ThreadPoolExecutor`` by default.
+    '''
+    executor = executor or ThreadPoolExecutor(
+        max_workers=config.get('WORKERS') or None
     )
-    slipstream.app.config['SITE_URL'] = os.environ.get('SLIPSTREAM_SITE_URL', '')
-    slipstream.app.config['BLOG_NAME'] = os.environ.get('SLIPSTREAM_BLOG_NAME')
-    slipstream.app.logger.debug('Site url: %r', slipstream.app.config['SITE_URL'])
-    ip = os.environ.get('SLIPSTREAM_IP_ADDR', '0.0.0.0')
-    port = int(os.environ.get('SLIPSTREAM_PORT', 5000))
-    debug = str(os.environ.get('SLIPSTREAM_DEBUG')).lower() == 'true'
-    config.update(slipstream.app.config)
-    core.env.globals.update(slipstream.app.config)
-    core.regenerate(content_dir=slipstream.app.config['CONTENT_DIR'],
-                    output_dir=slipstream.app.config['OUTPUT_DIR'])
-
-    http_server = HTTPServer(WSGIContainer(slipstream.app))
-    http_server.listen(port)
-    IOLoop.instance().start()
+    preview_settings = {'path': slipstream.app.config['OUTPUT_DIR'],
+                        'default_filename': 'index.html',
+                        'executor': executor,
+                        }
+    return Application([
+        (r'/preview/?()', PreviewHandler, preview_settings),
+        (r'/preview/(.+)', PreviewHandler, preview_settings),
+        (r'/metrics', MetricsHandler),
+        (r'/([^/]+)', WebhookHandler),
+        (r'.*', FallbackHandler, {'fallback': WSGIContainer(slipstream.app)}),
+    ])
+
+
+def run():
+    ip, port, debug = slipstream.configure()
+    slipstream.start()
+
+    http_server = HTTPServer(make_app(), idle_connection_timeout=60)
+    http_server.listen(port, address=ip)
+    IOLoop.current().start()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,300 @@
+'''
+Rebuild pages as the content directory and the theme change.
+
+A ``Watcher`` watches ``CONTENT_DIR`` and ``core.THEME_DIR`` for files being
+written, moved and removed, with inotify if ``inotify_simple`` is installed
+and by polling their modification times otherwise. A burst of changes, like
+an editor saving through a temporary file or a ``git pull``, is collected
+until nothing has changed for ``delay`` seconds, and then only the pages
+that the changed files affect are rebuilt:
+
+- a changed post rebuilds its own page, the pages of the index and of its
+  tags that it moved in, and the feeds, like publishing it would;
+- a removed post removes its page and rebuilds the listing pages it
+  dropped out of;
+- a changed template rebuilds the pages rendered with it, or with a
+  template that extends or includes it.
+'''
+import logging
+import os
+import threading
+import time
+
+from . import config
+from . import core
+from . import metrics
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+logger = logging.getLogger(__name__)
+
+
+class PollingEvents:
+    '''
+    Changes to the files under ``dirs``, found by comparing their
+    modification times and sizes every ``interval`` seconds.
+    '''
+    def __init__(self, dirs, *, interval=1.0):
+        self.dirs = list(dirs)
+        self.interval = interval
+        self._snapshot = _snapshot(self.dirs)
+
+    def read(self, timeout=None):
+        '''
+        Return the set of paths that changed, waiting up to ``timeout``
+        seconds (or forever, if it is ``None``) for there to be any.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+            if wait > 0:
+                time.sleep(wait)
+            snapshot = _snapshot(self.dirs)
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed or (deadline is not None
+                           and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyEvents:
+    '''
+    Changes to the files under ``dirs``, read from inotify. Directories
+    created under ``dirs`` are watched too.
+    '''
+    def __init__(self, dirs):
+        flags = inotify_simple.flags
+        self._mask = (flags.CREATE | flags.DELETE | flags.MODIFY
+                      | flags.CLOSE_WRITE | flags.MOVED_FROM | flags.MOVED_TO)
+        self._inotify = inotify_simple.INotify()
+        self._dirs = {}
+        for path in dirs:
+            self._add_tree(path)
+
+    def _add_tree(self, root):
+        for dirpath, dirnames, filenames in os.walk(root):
+            self._dirs[self._inotify.add_watch(dirpath, self._mask)] = dirpath
+
+    def read(self, timeout=None):
+        '''
+        Return the set of paths that changed, waiting up to ``timeout``
+        seconds (or forever, if it is ``None``) for there to be any.
+        '''
+        events = self._inotify.read(
+            timeout=None if timeout is None else int(timeout * 1000)
+        )
+        changed = set()
+        for event in events:
+            dirpath = self._dirs.get(event.wd)
+            if dirpath is None:
+                continue
+            path = os.path.join(dirpath, event.name)
+            if (event.mask & inotify_simple.flags.ISDIR
+                    and event.mask & (inotify_simple.flags.CREATE
+                                      | inotify_simple.flags.MOVED_TO)):
+                self._add_tree(path)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        self._inotify.close()
+
+
+def watch_events(dirs, *, interval=1.0):
+    '''
+    Return ``InotifyEvents`` for ``dirs`` if inotify is available, or
+    ``PollingEvents`` that poll every ``interval`` seconds if it isn't.
+    '''
+    if inotify_simple is not None:
+        try:
+            return InotifyEvents(dirs)
+        except OSError as e:
+            logger.warning('Unable to use inotify, polling instead: %s', e)
+    return PollingEvents(dirs, interval=interval)
+
+
+def _snapshot(dirs):
+    snapshot = {}
+    for root in dirs:
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+class Watcher:
+    '''
+    Rebuild the pages of ``content_dir`` in ``output_dir`` when posts or
+    templates change, once nothing has changed for ``delay`` seconds.
+    ``events`` are the changes to watch, ``watch_events`` of the content
+    and theme directories by default.
+    '''
+    def __init__(self, *, content_dir, output_dir, delay=0.5, events=None):
+        self.content_dir = os.path.abspath(content_dir)
+        self.output_dir = output_dir
+        self.theme_dir = os.path.abspath(core.THEME_DIR)
+        self.delay = delay
+        self.events = events or watch_events([self.content_dir,
+                                              self.theme_dir])
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def wait(self, timeout=None):
+        '''
+        Wait up to ``timeout`` seconds for a change, then until nothing has
+        changed for ``delay`` seconds, and return the set of changed paths.
+        '''
+        changed = self.events.read(timeout)
+        while changed:
+            more = self.events.read(self.delay)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def rebuild(self, paths):
+        '''
+        Rebuild the pages affected by changes to ``paths``, and return a
+        ``BuildReport``.
+        '''
+        posts = sorted(path for path in map(os.path.abspath, paths)
+                       if os.path.dirname(path) == self.content_dir
+                       and _is_post(os.path.basename(path)))
+        templates = {os.path.relpath(path, self.theme_dir).replace(os.sep, '/')
+                     for path in map(os.path.abspath, paths)
+                     if path.startswith(self.theme_dir + os.sep)
+                     and path.endswith('.html')}
+        report = core.BuildReport()
+        if not posts and not templates:
+            return report
+
+        with metrics.build('watch', posts=len(posts),
+                           templates=len(templates)), \
+                core.post_cache(self.content_dir), core.fixed_theme():
+            index = core.get_index(self.content_dir)
+            for path in posts:
+                report += self._rebuild_post(path, index)
+            if templates:
+                report += self._rebuild_templates(templates, index)
+        return report
+
+    def _rebuild_post(self, path, index):
+        old_post = next((post for post in index.posts
+                         if os.path.abspath(post.path) == path), None)
+        try:
+            post = core.PostMeta.from_headers(core.read_headers(path),
+                                              path=path)
+        except FileNotFoundError:
+            if old_post is None:
+                return core.BuildReport()
+            logger.info('%r was removed, removing %r', path, old_post.slug)
+            return core.remove_post(old_post, index=index,
+                                    content_dir=self.content_dir,
+                                    output_dir=self.output_dir)
+        except (KeyError, ValueError) as e:
+            logger.warning('Unable to rebuild %r: %s', path, e)
+            return core.BuildReport()
+        logger.info('%r changed, rebuilding %r', path, post.slug)
+        return core.update_post(post, old_post=old_post, path=path,
+                                index=index, content_dir=self.content_dir,
+                                output_dir=self.output_dir)
+
+    def _rebuild_templates(self, templates, index):
+        logger.info('Templates %s changed', ', '.join(sorted(templates)))
+        report = core.BuildReport()
+        post_template = (core._template_name(config.get('POST_TEMPLATE'))
+                         or 'post.html')
+        if templates & _template_closure(post_template):
+            config['POST_TEMPLATE'] = core.get_env().get_template(
+                post_template
+            )
+            for post in index.posts:
+                report += core.generate_post_page(post=post,
+                                                  output_dir=self.output_dir)
+        if templates & _template_closure('index.html'):
+            report += core.generate_index(content_dir=self.content_dir,
+                                          output_dir=self.output_dir,
+                                          index=index)
+        if templates & _template_closure('tag.html'):
+            for tag in index.tags:
+                report += core.generate_tag_page(tag=tag,
+                                                 content_dir=self.content_dir,
+                                                 output_dir=self.output_dir,
+                                                 index=index)
+        return report
+
+    def start(self):
+        '''
+        Start rebuilding in a background thread.
+        '''
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._work,
+                                        name='slipstream-watcher',
+                                        daemon=True)
+        self._thread.start()
+        logger.info('Watching %r and %r', self.content_dir, self.theme_dir)
+
+    def stop(self):
+        '''
+        Stop the background thread, after the rebuild it's running is done.
+        '''
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _work(self):
+        while not self._stopping.is_set():
+            changed = self.wait(timeout=1.0)
+            if not changed:
+                continue
+            try:
+                self.rebuild(changed)
+            except Exception:
+                logger.exception('Unable to rebuild after changes to %s',
+                                 ', '.join(sorted(changed)))
+
+
+def _is_post(name):
+    return not name.startswith('.') and name.endswith('.md')
+
+
+def _template_closure(name):
+    '''
+    Return the names of template ``name`` and of every template it extends
+    or includes, directly or not.
+    '''
+    import jinja2.meta
+    env = core.get_env()
+    names = set()
+    todo = [name]
+    while todo:
+        name = todo.pop()
+        if name in names:
+            continue
+        names.add(name)
+        try:
+            source, filename, uptodate = env.loader.get_source(env, name)
+        except jinja2.TemplateNotFound:
+            continue
+        todo.extend(ref for ref in jinja2.meta.find_referenced_templates(
+                        env.parse(source))
+                    if ref is not None)
+    return names
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+import pytest
+
+from slipstream import build
+from slipstream import config
+from slipstream import core
+from slipstream import search
+
+
+@pytest.fixture
+def site():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(config,
+                            {'CONTENT_DIR': content_dir,
+                             'OUTPUT_DIR': output_dir,
+                             'DEFAULT_AUTHOR': 'fnord@example.com',
+                             'POST_TEMPLATE': core.env.get_template('post.html'),
+                             'PAGE_SIZE': 2,
+                             'WORKERS': 1,
+                            }, clear=True):
+        for day in range(1, 6):
+            write_post(content_dir, day)
+        yield content_dir, output_dir
+
+
+def write_post(content_dir, day, tags='x', body='Hello'):
+    path = os.path.join(content_dir, 'post-{}.md'.format(day))
+    with open(path, 'w') as f:
+        f.write('Title: Post {}\nDate: 2010-08-{:02} 09:23\nTags: {}\n\n{}\n'
+                .format(day, day, tags, body))
+    return path
+
+
+def test_build_should_render_every_page_the_first_time(site):
+    content_dir, output_dir = site
+
+    report = build.build(content_dir=content_dir, output_dir=output_dir,
+                         incremental=True)
+
+    # Five posts, three pages of the index and three of the tag.
+    assert report == core.BuildReport(rendered=11, written=11)
+    assert os.path.exists(os.path.join(output_dir, build.MANIFEST))
+
+
+def test_incremental_build_should_render_nothing_when_nothing_changed(site):
+    content_dir, output_dir = site
+    build.build(content_dir=content_dir, output_dir=output_dir)
+
+    with mock.patch('slipstream.core.generate_rss') as fake_rss:
+        report = build.build(content_dir=content_dir, output_dir=output_dir,
+                             incremental=True)
+
+    assert report == core.BuildReport()
+    assert fake_rss.call_count == 0
+
+
+def test_incremental_build_should_only_render_the_pages_a_post_changed(site):
+    content_dir, output_dir = site
+    build.build(content_dir=content_dir, output_dir=output_dir)
+
+    write_post(content_dir, 1, tags='x, y', body='Changed')
+    report = build.build(content_dir=content_dir, output_dir=output_dir,
+                         incremental=True)
+
+    # The post, the last page of the index and of tag x, and tag y.
+    assert report.rendered == 4
+    with open(os.path.join(output_dir, 'tag', 'y.html')) as f:
+        assert 'Changed' in f.read()
+
+
+def test_incremental_build_should_remove_the_pages_of_removed_posts(site):
+    content_dir, output_dir = site
+    write_post(content_dir, 6, tags='gone')
+    build.build(content_dir=content_dir, output_dir=output_dir)
+
+    os.remove(os.path.join(content_dir, 'post-6.md'))
+    build.build(content_dir=content_dir, output_dir=output_dir,
+                incremental=True)
+
+    assert not os.path.exists(os.path.join(output_dir, 'post-6.html'))
+    assert not os.path.exists(os.path.join(output_dir, 'tag', 'gone.html'))
+    with open(os.path.join(output_dir, 'index.html')) as f:
+        assert 'Post 6' not in f.read()
+
+
+def test_incremental_build_should_render_everything_when_settings_change(
+        site):
+    content_dir, output_dir = site
+    build.build(content_dir=content_dir, output_dir=output_dir)
+
+    with mock.patch.dict(config, {'SITE_URL': 'http://example.com'}):
+        report = build.build(content_dir=content_dir, output_dir=output_dir,
+                             incremental=True)
+
+    assert report.rendered == 11
+
+
+def test_build_should_only_build_the_parts_asked_for(site):
+    content_dir, output_dir = site
+
+    build.build(content_dir=content_dir, output_dir=output_dir,
+                only=['index'])
+
+    assert sorted(os.listdir(output_dir)) == ['index.html', 'page']
+
+
+def test_incremental_build_should_only_index_the_posts_that_changed(site):
+    content_dir, output_dir = site
+    config['SEARCH'] = True
+    build.build(content_dir=content_dir, output_dir=output_dir)
+
+    write_post(content_dir, 1, body='Changed')
+    with mock.patch('slipstream.search.terms',
+                    wraps=search.terms) as fake_terms:
+        build.build(content_dir=content_dir, output_dir=output_dir,
+                    incremental=True)
+
+    assert fake_terms.call_count == 1
+    index = search.SearchIndex.load(os.path.join(output_dir, 'search'))
+    assert len(index) == 5
+    with open(os.path.join(output_dir, 'search', 'ch.json')) as f:
+        assert json.load(f) == {'changed': [index.posts.index(
+            ['post-1', 'Post 1', '2010-08-01'])]}
@@ -0,0 +1,149 @@
+import datetime
+import os
+import pytest
+import tempfile
+from slipstream import cache
+
+
+@pytest.yield_fixture
+def content_dir():
+    with tempfile.TemporaryDirectory() as d:
+        yield d
+
+
+def make_cached_post(body='This is the body'):
+    return cache.CachedPost(headers={'title': 'A title', 'tags': 'a, b'},
+                            body=body,
+                            html='<p>{}</p>'.format(body),
+                            publish_timestamp=datetime.datetime(2010, 8, 14,
+                                                                9, 23, 12),
+                            update_timestamp=None,
+                            )
+
+
+def write_and_cache(content_dir, name, text, cached, version='1'):
+    path = os.path.join(content_dir, name)
+    with open(path, 'w') as f:
+        f.write(text)
+    with cache.PostCache(os.path.join(content_dir, '.cache'),
+                         content_dir=content_dir, version=version) as c:
+        entry = get_entry(content_dir, name)
+        c.put(entry, text, cached)
+
+
+def get_entry(content_dir, name):
+    return next(entry for entry in os.scandir(content_dir)
+                if entry.name == name)
+
+
+def get_cached(content_dir, name, version='1'):
+    with cache.PostCache(os.path.join(content_dir, '.cache'),
+                         content_dir=content_dir, version=version) as c:
+        return c.get(get_entry(content_dir, name))
+
+
+def test_put_post_should_be_returned_by_get(content_dir):
+    expected = make_cached_post()
+    write_and_cache(content_dir, 'post.md', 'text', expected)
+
+    actual = get_cached(content_dir, 'post.md')
+
+    for attr in ('headers', 'body', 'html', 'publish_timestamp',
+                 'update_timestamp'):
+        assert getattr(actual, attr) == getattr(expected, attr)
+
+
+def test_get_should_return_None_when_file_has_changed(content_dir):
+    write_and_cache(content_dir, 'post.md', 'text', make_cached_post())
+    with open(os.path.join(content_dir, 'post.md'), 'w') as f:
+        f.write('different text')
+
+    assert get_cached(content_dir, 'post.md') is None
+
+
+def test_get_should_return_post_when_only_mtime_has_changed(content_dir):
+    write_and_cache(content_dir, 'post.md', 'text', make_cached_post())
+    os.utime(os.path.join(content_dir, 'post.md'), (0, 0))
+
+    assert get_cached(content_dir, 'post.md') is not None
+
+
+def test_changing_version_should_clear_the_cache(content_dir):
+    write_and_cache(content_dir, 'post.md', 'text', make_cached_post())
+
+    assert get_cached(content_dir, 'post.md', version='2') is None
+    assert get_cached(content_dir, 'post.md', version='1') is None
+
+
+def test_prune_should_remove_posts_that_were_not_seen(content_dir):
+    write_and_cache(content_dir, 'gone.md', 'text', make_cached_post())
+    write_and_cache(content_dir, 'kept.md', 'text', make_cached_post())
+    with cache.PostCache(os.path.join(content_dir, '.cache'),
+                         content_dir=content_dir, version='1') as c:
+        c.get(get_entry(content_dir, 'kept.md'))
+        c.prune()
+
+    assert get_cached(content_dir, 'gone.md') is None
+    assert get_cached(content_dir, 'kept.md') is not None
+
+
+def test_lookup_should_find_the_post_by_path(content_dir):
+    write_and_cache(content_dir, 'post.md', 'text', make_cached_post())
+
+    with cache.PostCache(os.path.join(content_dir, '.cache'),
+                         content_dir=content_dir, version='1') as c:
+        assert c.lookup(os.path.join(content_dir, 'post.md')) is not None
+        assert c.lookup(os.path.join(content_dir, 'nope.md')) is None
+
+
+def test_render_store_should_return_what_was_put(content_dir):
+    store = cache.RenderStore(os.path.join(content_dir, 'renders'))
+    key = store.key('page', 'fnord')
+
+    assert store.get(key) is None
+    store.put(key, '<p>Fnord \N{SNOWMAN}</p>')
+
+    assert store.get(key) == '<p>Fnord \N{SNOWMAN}</p>'
+    assert cache.RenderStore(store.directory).get(key) == \
+        '<p>Fnord \N{SNOWMAN}</p>'
+
+
+def test_render_store_keys_should_not_depend_on_where_parts_are_split():
+    assert cache.RenderStore.key('ab', 'c') != cache.RenderStore.key('a', 'bc')
+
+
+def test_render_store_should_treat_an_unwritable_directory_as_a_miss(
+        content_dir):
+    path = os.path.join(content_dir, 'not-a-directory')
+    open(path, 'w').close()
+    store = cache.RenderStore(path)
+    key = store.key('fnord')
+
+    store.put(key, '<p>Fnord</p>')
+
+    assert store.get(key) is None
+
+
+def test_render_store_prune_should_remove_only_entries_unused_for_max_age(
+        content_dir):
+    store = cache.RenderStore(os.path.join(content_dir, 'renders'))
+    old, used, new = (store.key(name) for name in ('old', 'used', 'new'))
+    for key in (old, used, new):
+        store.put(key, '<p>{}</p>'.format(key))
+    a_day_ago = datetime.datetime.now().timestamp() - 24*60*60
+    for key in (old, used):
+        os.utime(store._path(key), (a_day_ago, a_day_ago))
+    store.get(used)
+
+    assert store.prune(60*60) == 1
+
+    assert store.get(old) is None
+    assert store.get(used) is not None
+    assert store.get(new) is not None
+
+
+def test_render_store_prune_of_a_missing_directory_should_remove_nothing(
+        content_dir):
+    store = cache.RenderStore(os.path.join(content_dir, 'renders'))
+
+    assert store.prune(0) == 0
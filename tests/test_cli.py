@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from slipstream import cli
+from slipstream import config
+from slipstream import core
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_build_should_not_import_the_web_server_or_create_an_api_key():
+    script = ('import sys\n'
+              'from slipstream import cli\n'
+              'cli.main(sys.argv[1:])\n'
+              'web = [name for name in sys.modules\n'
+              '       if name.split(".")[0] in ("flask", "tornado")\n'
+              '       or name in ("slipstream.slipstream", "slipstream.util")]\n'
+              'assert not web, web\n')
+    with tempfile.TemporaryDirectory() as cwd:
+        os.mkdir(os.path.join(cwd, 'content'))
+        with open(os.path.join(cwd, 'content', 'fnord.md'), 'w') as f:
+            f.write('Title: Fnord\n\nHello\n')
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        env.pop('SLIPSTREAM_API_KEY', None)
+        output = subprocess.check_output(
+            [sys.executable, '-c', script, 'build', '--jobs', '1'],
+            cwd=cwd, env=env, universal_newlines=True,
+        )
+
+        assert os.path.exists(os.path.join(cwd, 'output', 'fnord.html'))
+        assert not os.path.exists(os.path.join(cwd, '.slipstream_api_key'))
+    assert output.startswith('Built ')
+    assert '2 pages rendered' in output
+
+
+def test_build_should_print_a_profile(capsys, monkeypatch):
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(config), \
+            mock.patch.dict(core.env.globals), \
+            mock.patch.object(core.env, 'bytecode_cache', None):
+        monkeypatch.setenv('SLIPSTREAM_POST_CACHE',
+                           os.path.join(output_dir, '.cache'))
+        monkeypatch.setenv('SLIPSTREAM_RENDER_STORE',
+                           os.path.join(output_dir, '.renders'))
+        monkeypatch.setenv('SLIPSTREAM_TEMPLATE_CACHE',
+                           os.path.join(output_dir, '.templates'))
+        assert cli.main(['build', '--content-dir', content_dir,
+                         '--output-dir', output_dir, '--jobs', '1',
+                         '--only', 'index', '--profile']) == 0
+
+    output = capsys.readouterr().out
+    assert 'Built ' in output
+    assert 'cumulative' in output
@@ -0,0 +1,59 @@
+import gzip
+import os
+import tempfile
+from unittest import mock
+
+import pytest
+
+from slipstream import compress
+
+
+@pytest.fixture
+def page():
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, 'index.html')
+        with open(path, 'w') as f:
+            f.write('<p>Fnord</p>\n' * 100)
+        yield path
+
+
+def test_compress_should_write_a_gzip_sibling_with_the_same_mtime(page):
+    assert compress.compress(page, ('gzip',)) == 1
+
+    with open(page, 'rb') as f, gzip.open(page + '.gz') as compressed:
+        assert compressed.read() == f.read()
+    assert (os.stat(page + '.gz').st_mtime_ns ==
+            os.stat(page).st_mtime_ns)
+
+
+def test_compress_should_give_the_same_bytes_for_the_same_page(page):
+    compress.compress(page, ('gzip',))
+    with open(page + '.gz', 'rb') as f:
+        first = f.read()
+    compress.compress(page, ('gzip',))
+    with open(page + '.gz', 'rb') as f:
+        assert f.read() == first
+
+
+def test_is_current_should_be_false_until_the_page_is_compressed(page):
+    assert not compress.is_current(page, ('gzip',))
+
+    compress.compress(page, ('gzip',))
+    assert compress.is_current(page, ('gzip',))
+
+    os.utime(page, ns=(0, 0))
+    assert not compress.is_current(page, ('gzip',))
+
+
+def test_remove_should_remove_every_sibling(page):
+    compress.compress(page, ('gzip',))
+
+    compress.remove(page)
+    compress.remove(page)
+
+    assert os.listdir(os.path.dirname(page)) == ['index.html']
+
+
+def test_formats_should_skip_brotli_when_it_is_not_installed():
+    with mock.patch.object(compress, 'brotli', None):
+        assert compress.formats(['gzip', 'br', 'zip']) == ('gzip',)
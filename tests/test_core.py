@@ -1,5 +1,8 @@
 import os
 import datetime
+import json
+import gzip
+import jinja2
 import pytest
 import tempfile
 import textwrap
@@ -119,6 +122,43 @@ def test_if_date_is_present_it_should_be_used_for_publish_timestamp():
         assert post.publish_timestamp == timestamp
 
 
+def test_parse_date_should_ValueError_on_unknown_formats():
+    for date in ('2010/08/14', '14-08-2010', '2010-08-14T12:00',
+                 '2010-08-14 12', '2010-13-01'):
+        with pytest.raises(ValueError):
+            core.Post._parse_date(date)
+
+
+def test_parse_date_should_accept_single_digit_fields():
+    assert core.Post._parse_date('2010-8-4 9:05') == \
+        datetime.datetime(2010, 8, 4, 9, 5)
+
+
+def test_read_headers_should_only_read_the_header_block():
+    with tempfile.TemporaryDirectory() as content_dir:
+        path = os.path.join(content_dir, 'post.md')
+        with open(path, 'wb') as f:
+            f.write(b'Title: Fnord\nTags: a, b\n\nBody\n\n')
+            f.write(b'x' * 100000 + b'\xff not UTF-8')
+
+        headers = core.read_headers(path)
+
+        assert headers == {'title': 'Fnord', 'tags': 'a, b'}
+
+
+def test_read_headers_should_ValueError_like_Post():
+    with tempfile.TemporaryDirectory() as content_dir:
+        path = os.path.join(content_dir, 'post.md')
+        for text in ('Title: no blank line', 'Title: no body\n\n\n  \n',
+                     'Title: fine\nbad header\n\nBody'):
+            with open(path, 'w') as f:
+                f.write(text)
+            with pytest.raises(ValueError):
+                core.read_headers(path)
+            with pytest.raises(ValueError):
+                core.Post(text)
+
+
 def test_if_no_author_is_provided_it_should_use_config_DEFAULT_AUTHOR():
     expected_author = 'roscivs@indessed.com'
     with mock.patch.dict(core.config, {'DEFAULT_AUTHOR': expected_author}):
@@ -318,7 +358,9 @@ def test_publish_should_call_generate_index_and_pass_it_config_OUTPUT_DIR_and_CO
                          author='roscivs_bottia@example.com',
                         )
             fake_gen_index.assert_called_with(content_dir=content_dir,
-                                              output_dir=output_dir)
+                                              output_dir=output_dir,
+                                              index=mock.ANY,
+                                              pages=mock.ANY)
 
 
 def test_publish_should_call_generate_tag_page_and_pass_it_each_tag_and_OUTPUT_DIR():
@@ -338,7 +380,79 @@ def test_publish_should_call_generate_tag_page_and_pass_it_each_tag_and_OUTPUT_D
             for tag in expected_tags:
                 fake_gen_tag_pages.assert_any_call(tag=tag,
                                                    content_dir=content_dir,
-                                                   output_dir=output_dir)
+                                                   output_dir=output_dir,
+                                                   index=mock.ANY,
+                                                   pages=mock.ANY)
+
+
+def test_publish_should_regenerate_tag_pages_for_tags_the_post_lost():
+    with tempfile.TemporaryDirectory() as output_dir, \
+            tempfile.TemporaryDirectory() as content_dir, \
+            mock.patch.dict(core.config, {'OUTPUT_DIR': output_dir,
+                                          'CONTENT_DIR': content_dir}):
+        core.publish(title='blargle',
+                     content='This is a post that is for the awesome',
+                     author='roscivs_bottia@example.com',
+                     tags='kept, lost',
+                    )
+        with mock.patch('slipstream.core.generate_tag_page') as fake_gen_tag_pages:
+            core.publish(title='blargle',
+                         content='This is a post that is for the awesome',
+                         author='roscivs_bottia@example.com',
+                         tags='kept, new',
+                        )
+            called_tags = [call[1]['tag']
+                           for call in fake_gen_tag_pages.call_args_list]
+
+    assert sorted(called_tags) == ['kept', 'lost', 'new']
+
+
+def test_publish_should_remove_tag_page_when_no_posts_have_the_tag():
+    with tempfile.TemporaryDirectory() as output_dir, \
+            tempfile.TemporaryDirectory() as content_dir, \
+            mock.patch.dict(core.config, {'OUTPUT_DIR': output_dir,
+                                          'CONTENT_DIR': content_dir}):
+        core.publish(title='blargle',
+                     content='This is a post that is for the awesome',
+                     author='roscivs_bottia@example.com',
+                     tags='lost',
+                    )
+        assert os.path.exists(os.path.join(output_dir, 'tag', 'lost.html'))
+
+        core.publish(title='blargle',
+                     content='This is a post that is for the awesome',
+                     author='roscivs_bottia@example.com',
+                    )
+
+        assert not os.path.exists(os.path.join(output_dir, 'tag', 'lost.html'))
+
+
+def test_publish_should_generate_the_post_page():
+    title = 'This is a title for great good'
+    with tempfile.TemporaryDirectory() as output_dir, \
+            tempfile.TemporaryDirectory() as content_dir, \
+            mock.patch.dict(core.config, {'OUTPUT_DIR': output_dir,
+                                          'CONTENT_DIR': content_dir}):
+        core.publish(title=title,
+                     content='This is a post that is for the awesome',
+                     author='roscivs_bottia@example.com',
+                    )
+
+        assert core.slugify(title)+'.html' in os.listdir(output_dir)
+
+
+def test_publish_should_only_load_posts_once():
+    with tempfile.TemporaryDirectory() as output_dir, \
+            tempfile.TemporaryDirectory() as content_dir, \
+            mock.patch.dict(core.config, {'OUTPUT_DIR': output_dir,
+                                          'CONTENT_DIR': content_dir}), \
+            mock.patch('slipstream.core.load_posts', return_value=[]) as fake_load_posts:
+        core.publish(title='blargle',
+                     content='This is a post that is for the awesome',
+                     author='roscivs_bottia@example.com',
+                     tags='these, are, my tags',
+                     )
+        assert fake_load_posts.call_count == 1
 
 
 def test_if_post_is_not_tagged_then_publish_should_not_call_generate_tag_page():
@@ -408,6 +522,41 @@ def test_for_all_files_in_content_dir_regenerate_should_put_files_in_output_dir(
             assert '{}.html'.format(filename[:-3]) in output_files
 
 
+def test_regenerate_should_render_each_tag_page_once():
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as output_dir:
+        for i in range(5):
+            with open(os.path.join(content_dir, '{}.md'.format(i)), 'w') as f:
+                print('Title: post {}\nTags: common, tag{}\n\nBody'.format(
+                      i, i % 2), file=f)
+
+        with mock.patch.object(core, 'generate_tag_page',
+                               wraps=core.generate_tag_page) as fake_gen:
+            core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                            workers=1)
+
+        assert sorted(call[1]['tag'] for call in fake_gen.call_args_list) == \
+            ['common', 'tag0', 'tag1']
+
+
+def test_regenerate_should_report_pages_written_and_skipped():
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as output_dir:
+        for i in range(3):
+            with open(os.path.join(content_dir, '{}.md'.format(i)), 'w') as f:
+                print('Title: post {}\nTags: fnord\n\nBody'.format(i), file=f)
+
+        first = core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                                workers=1)
+        second = core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                                 workers=1)
+
+    # 3 posts, the index and one tag page.
+    assert first == core.BuildReport(rendered=5, written=5)
+    assert (second.rendered, second.written, second.skipped) == (5, 0, 5)
+    assert str(second) == '5 pages rendered, 0 written, 5 skipped'
+
+
 def test_for_all_posts_in_content_dir_index_should_contain_those_titles():
     expected_titles = ['this is some title',
                        'this is another title',
@@ -429,6 +578,826 @@ def test_for_all_posts_in_content_dir_index_should_contain_those_titles():
 
 
 
+def test_load_posts_with_POST_CACHE_should_not_reparse_unchanged_posts():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as cache_dir, \
+            mock.patch.dict(core.config,
+                            {'POST_CACHE': os.path.join(cache_dir, 'cache')}):
+        with open(os.path.join(content_dir, 'cached.md'), 'w') as f:
+            print('Title: cached\nDate: 2010-08-14\nTags: a, b\n\n'
+                  'This is a *blog* post', file=f)
+
+        expected = core.load_posts(content_dir=content_dir)
+        with mock.patch.object(core.Post, '_parse_date') as fake_parse_date, \
+                mock.patch.object(core.markdown_renderer(),
+                                  'render') as fake_render:
+            actual = core.load_posts(content_dir=content_dir)
+
+            assert fake_parse_date.call_count == 0
+            assert actual[0].content == expected[0].content
+            assert fake_render.call_count == 0
+
+    for attr in ('title', 'raw_content', 'publish_timestamp',
+                 'update_timestamp', 'author', 'tags', 'slug'):
+        assert getattr(actual[0], attr) == getattr(expected[0], attr)
+
+
+
 
 
 # TODO: Write tests for webhook -W. Werner, 2015-12-08
+
+
+def test_post_content_should_only_be_rendered_once():
+    with mock.patch.object(core, 'markdown_cache', core.RenderCache()), \
+            mock.patch.object(core.markdown_renderer(),
+                              'render') as fake_render:
+        post = core.Post(GENERIC_GOOD_POST)
+        post.content
+        post.content
+
+        assert fake_render.call_count == 1
+
+
+def test_post_content_should_be_rendered_again_when_raw_content_changes():
+    with mock.patch.object(core, 'markdown_cache', core.RenderCache()):
+        post = core.Post(GENERIC_GOOD_POST)
+        post.content
+        post.raw_content = 'This is *different*'
+
+        assert '<em>different</em>' in post.content
+
+
+def test_render_cache_should_share_html_between_posts_with_the_same_body():
+    cache = core.RenderCache()
+    with mock.patch.object(core, 'markdown_cache', cache):
+        core.Post(GENERIC_GOOD_POST).content
+        core.Post(GENERIC_GOOD_POST).content
+
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 1024}
+
+
+def test_render_cache_should_evict_least_recently_used_beyond_maxsize():
+    cache = core.RenderCache(maxsize=2)
+    cache.render('one')
+    cache.render('two')
+    cache.render('one')
+    cache.render('three')
+    cache.render('one')
+    cache.render('two')
+
+    assert len(cache) == 2
+    assert cache.hits == 2
+    assert cache.misses == 4
+
+
+def test_render_cache_should_use_html_from_the_render_store():
+    with tempfile.TemporaryDirectory() as store_dir, \
+            mock.patch.dict(core.config, {'RENDER_STORE': store_dir}):
+        core.RenderCache().render('Shared *markdown*')
+        with mock.patch.object(core.markdown_renderer(),
+                               'render') as fake_render:
+            html = core.RenderCache().render('Shared *markdown*')
+
+    assert fake_render.call_count == 0
+    assert '<em>markdown</em>' in html
+
+
+def test_generate_post_page_should_reuse_pages_from_the_render_store():
+    post = core.Post(GENERIC_GOOD_POST)
+    with tempfile.TemporaryDirectory() as store_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            tempfile.TemporaryDirectory() as other_output_dir, \
+            mock.patch.dict(core.config, {'RENDER_STORE': store_dir}):
+        core.generate_post_page(post=post, output_dir=output_dir)
+        template = core.config['POST_TEMPLATE']
+        with mock.patch.object(template, 'render') as fake_render:
+            report = core.generate_post_page(post=post,
+                                             output_dir=other_output_dir)
+
+        assert fake_render.call_count == 0
+        assert report == core.BuildReport(rendered=1, written=1)
+        name = post.slug + '.html'
+        with open(os.path.join(output_dir, name)) as f, \
+                open(os.path.join(other_output_dir, name)) as other:
+            assert f.read() == other.read()
+
+
+def test_render_store_page_keys_should_change_with_the_template_globals():
+    post = core.Post(GENERIC_GOOD_POST)
+    template = core.config['POST_TEMPLATE']
+    with mock.patch.dict(core.env.globals, {'SITE_URL': 'http://one'}):
+        one = core._page_key(template, post, core.theme_fingerprint())
+    with mock.patch.dict(core.env.globals, {'SITE_URL': 'http://two'}):
+        two = core._page_key(template, post, core.theme_fingerprint())
+
+    assert one != two
+
+
+def test_regenerate_should_fingerprint_the_theme_once():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            tempfile.TemporaryDirectory() as store_dir, \
+            mock.patch.dict(core.config, {'RENDER_STORE': store_dir}):
+        for i in range(5):
+            with open(os.path.join(content_dir, '{}.md'.format(i)), 'w') as f:
+                print('Title: post {}\n\nBody'.format(i), file=f)
+        core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                        workers=1)
+
+        with mock.patch('slipstream.core.fingerprint',
+                        wraps=core.fingerprint) as fake_fingerprint:
+            core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                            workers=1)
+
+    assert fake_fingerprint.call_count == 1
+
+
+def test_regenerate_should_prune_the_render_store():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            tempfile.TemporaryDirectory() as store_dir, \
+            mock.patch.dict(core.config, {'RENDER_STORE': store_dir,
+                                          'RENDER_STORE_MAX_AGE': 1}):
+        store = core.render_store()
+        stale = store.key('a page of a theme long gone')
+        store.put(stale, '<p>Stale</p>')
+        os.utime(store._path(stale), (0, 0))
+        with open(os.path.join(content_dir, 'post.md'), 'w') as f:
+            print('Title: post\n\nBody', file=f)
+
+        with core.metrics.tally() as tally:
+            core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                            workers=1)
+
+        assert store.get(stale) is None
+        assert tally.counters['render_store_pruned'] == 1
+
+
+def test_generate_post_page_should_not_store_a_page_of_a_changed_theme():
+    post = core.Post(GENERIC_GOOD_POST)
+    with tempfile.TemporaryDirectory() as store_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'RENDER_STORE': store_dir}):
+        with core.fixed_theme('old theme'):
+            core.generate_post_page(post=post, output_dir=output_dir)
+
+        assert os.listdir(store_dir) == []
+
+
+def test_regenerate_with_workers_should_produce_the_same_output_as_serially():
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as serial_dir, \
+         tempfile.TemporaryDirectory() as parallel_dir:
+        for i in range(10):
+            with open(os.path.join(content_dir, 'post-{}.md'.format(i)), 'w') as f:
+                print('Title: post {0}\nDate: 2010-08-{0:02}\nTags: t{1}, all\n\n'
+                      'This is *blog* post {0}'.format(i+1, i % 3), file=f)
+
+        core.regenerate(content_dir=content_dir, output_dir=serial_dir,
+                        workers=1)
+        core.regenerate(content_dir=content_dir, output_dir=parallel_dir,
+                        workers=2)
+
+        for dirpath, dirnames, filenames in os.walk(serial_dir):
+            for filename in filenames:
+                serial_path = os.path.join(dirpath, filename)
+                parallel_path = os.path.join(parallel_dir,
+                                             os.path.relpath(serial_path,
+                                                             serial_dir))
+                with open(serial_path) as serial, open(parallel_path) as parallel:
+                    assert serial.read() == parallel.read()
+
+
+def test_worker_pool_should_be_None_for_a_single_worker():
+    with core.worker_pool(1) as executor:
+        assert executor is None
+
+
+def test_worker_pool_should_fall_back_to_None_if_processes_cannot_start():
+    with mock.patch('concurrent.futures.ProcessPoolExecutor',
+                    side_effect=NotImplementedError):
+        with core.worker_pool(4) as executor:
+            assert executor is None
+
+
+def test_preview_should_not_render_pages_if_nothing_changed():
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as output_dir:
+        with open(os.path.join(content_dir, 'preview.md'), 'w') as f:
+            print('Title: preview\n\nThis is a *blog* post', file=f)
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+        preview = core.Preview(content_dir=content_dir, output_dir=output_dir)
+
+        with mock.patch('slipstream.core.generate_index') as fake_gen_index:
+            assert not preview.update('index.html')
+            assert fake_gen_index.call_count == 0
+
+
+def test_preview_should_only_render_the_requested_page_when_content_changes():
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as output_dir:
+        with open(os.path.join(content_dir, 'preview.md'), 'w') as f:
+            print('Title: preview\nTags: tagged\n\nThis is a *blog* post', file=f)
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+        preview = core.Preview(content_dir=content_dir, output_dir=output_dir)
+
+        with open(os.path.join(content_dir, 'preview.md'), 'w') as f:
+            print('Title: preview\nTags: tagged\n\nThis is a *changed* post', file=f)
+
+        with mock.patch('slipstream.core.generate_tag_page') as fake_gen_tag_page:
+            assert preview.update('preview.html')
+            assert not preview.update('preview.html')
+            assert fake_gen_tag_page.call_count == 0
+
+        with open(os.path.join(output_dir, 'preview.html')) as f:
+            assert '<em>changed</em>' in f.read()
+        with open(os.path.join(output_dir, 'index.html')) as f:
+            assert '<em>changed</em>' not in f.read()
+
+        assert preview.update('index.html')
+        with open(os.path.join(output_dir, 'index.html')) as f:
+            assert '<em>changed</em>' in f.read()
+
+
+def test_preview_should_not_touch_pages_outside_of_the_output_dir():
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as parent_dir:
+        output_dir = os.path.join(parent_dir, 'output')
+        os.mkdir(output_dir)
+        with open(os.path.join(content_dir, 'preview.md'), 'w') as f:
+            print('Title: preview\nTags: tagged\n\nThis is a post', file=f)
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+        preview = core.Preview(content_dir=content_dir, output_dir=output_dir)
+        victim = os.path.join(parent_dir, 'victim.html')
+        with open(victim, 'w') as f:
+            f.write('Not a page')
+
+        with open(os.path.join(content_dir, 'preview.md'), 'a') as f:
+            print('Changed', file=f)
+
+        with mock.patch('slipstream.core.generate_tag_page',
+                        wraps=core.generate_tag_page) as fake_gen_tag_page:
+            for path in ('tag/../../victim.html', '../victim.html',
+                         'tag/../../output/../victim.html', 'tag/fnord.html'):
+                assert not preview.update(path)
+            assert fake_gen_tag_page.call_count == 0
+            assert preview.update('tag/tagged.html')
+
+        assert os.path.exists(victim)
+
+
+def make_posts(count):
+    return [core.Post('Title: post {0}\nDate: 2010-08-{0:02}\n\n'
+                      'Post number {0}\n\nhas two paragraphs'.format(day))
+            for day in range(count, 0, -1)]
+
+
+def test_page_path_should_put_the_first_page_at_the_listing_itself():
+    assert core.page_path('', 1) == 'index.html'
+    assert core.page_path('', 3) == 'page/3.html'
+    assert core.page_path('tag/fnord', 1) == 'tag/fnord.html'
+    assert core.page_path('tag/fnord', 2) == 'tag/fnord/page/2.html'
+
+
+def test_generate_index_should_paginate_by_PAGE_SIZE():
+    posts = make_posts(5)
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'PAGE_SIZE': 2}):
+        core.generate_index(content_dir=None, output_dir=output_dir,
+                            index=core.PostIndex(posts))
+
+        for path, titles in (('index.html', ('post 5', 'post 4')),
+                             ('page/2.html', ('post 3', 'post 2')),
+                             ('page/3.html', ('post 1',))):
+            with open(os.path.join(output_dir, path)) as f:
+                text = f.read()
+            for post in posts:
+                assert (post.title in text) == (post.title in titles)
+
+        with mock.patch.dict(core.config, {'PAGE_SIZE': 3}):
+            core.generate_index(content_dir=None, output_dir=output_dir,
+                                index=core.PostIndex(posts))
+
+        assert not os.path.exists(os.path.join(output_dir, 'page', '3.html'))
+
+
+def test_listings_with_EXCERPTS_should_only_contain_the_first_paragraph():
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'EXCERPTS': True}):
+        core.generate_index(content_dir=None, output_dir=output_dir,
+                            index=core.PostIndex(make_posts(1)))
+
+        with open(os.path.join(output_dir, 'index.html')) as f:
+            text = f.read()
+
+    assert 'Post number 1' in text
+    assert 'has two paragraphs' not in text
+
+
+def test_changed_pages_should_only_include_the_page_of_an_edited_post():
+    old_posts = make_posts(10)
+    new_posts = make_posts(10)
+    with mock.patch.dict(core.config, {'PAGE_SIZE': 3}):
+        assert core.changed_pages(old_posts, new_posts, new_posts[4]) == [2]
+
+
+def test_changed_pages_should_include_every_shifted_page_for_a_new_post():
+    old_posts = make_posts(9)
+    new_posts = make_posts(10)
+    with mock.patch.dict(core.config, {'PAGE_SIZE': 3}):
+        assert core.changed_pages(old_posts, new_posts, new_posts[0]) == [1, 2, 3, 4]
+
+
+def test_post_index_should_return_posts_newest_first():
+    posts = make_posts(5)
+    index = core.PostIndex(reversed(posts))
+
+    assert index.posts == posts
+    assert list(index) == posts
+    assert len(index) == 5
+
+
+def test_post_index_should_group_posts_by_tag():
+    posts = [core.Post('Title: {}\nDate: 2010-08-{:02}\nTags: {}\n\nBody'
+                       .format(title, day, tags))
+             for title, day, tags in (('one', 1, 'a, b'),
+                                      ('two', 2, 'b'),
+                                      ('three', 3, 'c, a'))]
+    index = core.PostIndex(posts)
+
+    assert index.tags == ['a', 'b', 'c']
+    assert [post.title for post in index.tagged('a')] == ['three', 'one']
+    assert [post.title for post in index.tagged('b')] == ['two', 'one']
+    assert index.tagged('nope') == []
+
+
+def test_post_index_add_should_replace_the_post_with_the_same_slug():
+    posts = make_posts(3)
+    index = core.PostIndex(posts)
+    edited = core.Post('Title: post 1\nDate: 2010-08-10\nTags: new\n\nEdited')
+
+    assert index.add(edited) is posts[2]
+    assert index.posts == [edited, posts[0], posts[1]]
+    assert index.get('post-1') is edited
+    assert index.tagged('new') == [edited]
+
+
+def test_post_index_remove_should_drop_the_post_and_its_empty_tags():
+    post = core.Post('Title: gone\nTags: lonely\n\nBody')
+    index = core.PostIndex(make_posts(2) + [post])
+
+    assert index.remove('gone') is post
+    assert 'gone' not in index
+    assert index.tags == []
+    assert index.remove('gone') is None
+    assert len(index) == 2
+
+
+def test_publish_should_update_the_shared_index():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'CONTENT_DIR': content_dir,
+                                          'OUTPUT_DIR': output_dir}):
+        index = core.load_index(content_dir)
+
+        core.publish(title='Fnord', author='fnord@example.com',
+                     content='Hello', tags='x')
+
+        assert core.get_index(content_dir) is index
+        assert [post.title for post in index.tagged('x')] == ['Fnord']
+
+
+def test_publish_should_render_the_pages_that_shift_before_the_index_loads():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'CONTENT_DIR': content_dir,
+                                          'OUTPUT_DIR': output_dir,
+                                          'PAGE_SIZE': 2}):
+        for day in range(1, 4):
+            with open(os.path.join(content_dir, 'p{}.md'.format(day)),
+                      'w') as f:
+                print('Title: P{0}\nDate: 2010-08-{0:02}\n\nPost {0}'
+                      .format(day), file=f)
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+        core._indexes.clear()
+
+        core.publish(title='P4', author='fnord@example.com', content='New')
+
+        with open(os.path.join(output_dir, 'page', '2.html')) as f:
+            text = f.read()
+        assert 'P2' in text
+        assert 'P1' in text
+
+
+def test_write_template_should_stream_the_template_into_the_file():
+    template = core.env.from_string('{% for x in xs %}{{ x }},{% endfor %}')
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.object(template, 'render') as fake_render:
+        path = os.path.join(output_dir, 'streamed.html')
+        core.write_template(path, template, xs=(x for x in range(3)))
+
+        with open(path) as f:
+            assert f.read() == '0,1,2,'
+        assert fake_render.call_count == 0
+
+
+def test_listing_pages_should_be_passed_lazy_posts():
+    template = mock.MagicMock()
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.object(core.env, 'get_template', return_value=template):
+        core.generate_index(content_dir=None, output_dir=output_dir,
+                            index=core.PostIndex(make_posts(3)))
+
+    posts = template.stream.call_args[1]['posts']
+    assert not isinstance(posts, (list, tuple))
+    assert [post.title for post in posts] == ['post 3', 'post 2', 'post 1']
+
+
+def test_write_template_should_not_touch_unchanged_files():
+    template = core.env.from_string('{{ text }}')
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, 'page.html')
+        assert core.write_template(path, template, text='same')
+        os.utime(path, (0, 0))
+
+        assert not core.write_template(path, template, text='same')
+        assert os.stat(path).st_mtime == 0
+
+        assert core.write_template(path, template, text='different')
+        assert os.stat(path).st_mtime != 0
+        with open(path) as f:
+            assert f.read() == 'different'
+        assert os.listdir(output_dir) == ['page.html']
+
+
+def test_write_template_should_leave_the_old_file_if_rendering_fails():
+    template = core.env.from_string('{{ text }}{{ fail() }}')
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, 'page.html')
+        with open(path, 'w') as f:
+            f.write('old')
+
+        with pytest.raises(ZeroDivisionError):
+            core.write_template(path, template, text='new', fail=lambda: 1/0)
+
+        with open(path) as f:
+            assert f.read() == 'old'
+        assert os.listdir(output_dir) == ['page.html']
+
+
+def test_load_posts_with_lazy_should_return_post_metadata_without_bodies():
+    with tempfile.TemporaryDirectory() as content_dir:
+        path = os.path.join(content_dir, 'lazy.md')
+        with open(path, 'w') as f:
+            f.write('Title: Lazy\nDate: 2010-08-14\nTags: a, b\n\n*Body*')
+
+        meta, = core.load_posts(content_dir=content_dir, lazy=True)
+
+        assert isinstance(meta, core.PostMeta)
+        assert not hasattr(meta, '__dict__')
+        assert (meta.title, meta.slug, meta.tags, meta.path) == \
+            ('Lazy', 'lazy', ('a', 'b'), path)
+        assert meta.raw_content == '*Body*'
+        assert meta.content == '<p><em>Body</em></p>\n'
+
+        with open(path, 'w') as f:
+            f.write('Title: Lazy\nDate: 2010-08-14\n\nChanged')
+
+        assert meta.raw_content == 'Changed'
+
+
+def test_post_meta_load_should_keep_its_timestamps():
+    with tempfile.TemporaryDirectory() as content_dir:
+        path = os.path.join(content_dir, 'undated.md')
+        with open(path, 'w') as f:
+            f.write('Title: Undated\n\nBody')
+        meta, = core.load_posts(content_dir=content_dir, lazy=True)
+
+        post = meta.load()
+
+        assert isinstance(post, core.Post)
+        assert post.publish_timestamp == meta.publish_timestamp
+
+
+def test_post_meta_load_should_use_the_post_cache():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            mock.patch.dict(core.config,
+                            {'POST_CACHE': os.path.join(content_dir,
+                                                        '.cache')}):
+        with open(os.path.join(content_dir, 'cached.md'), 'w') as f:
+            f.write('Title: Cached\n\nBody')
+        meta, = core.load_posts(content_dir=content_dir, lazy=True)
+
+        with mock.patch.object(core.markdown_cache, 'render') as fake_render:
+            assert meta.load().content == '<p>Body</p>\n'
+        assert fake_render.call_count == 0
+
+
+def test_regenerate_should_open_the_post_cache_once():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config,
+                            {'POST_CACHE': os.path.join(output_dir, '.cache'),
+                             'PAGE_SIZE': 2, 'WORKERS': 1}):
+        for i in range(5):
+            with open(os.path.join(content_dir, '{}.md'.format(i)), 'w') as f:
+                print('Title: post {}\nTags: x\n\nBody'.format(i), file=f)
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+
+        with mock.patch('slipstream.core.PostCache',
+                        wraps=core.PostCache) as fake_post_cache, \
+                core.metrics.tally() as tally:
+            core.regenerate(content_dir=content_dir, output_dir=output_dir)
+
+    assert fake_post_cache.call_count == 1
+    assert tally.counters['post_cache_hits'] == 5
+
+
+def test_listings_should_open_the_post_cache_once():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config,
+                            {'POST_CACHE': os.path.join(output_dir, '.cache'),
+                             'PAGE_SIZE': 2}):
+        for i in range(5):
+            with open(os.path.join(content_dir, '{}.md'.format(i)), 'w') as f:
+                print('Title: post {}\nTags: x\n\nBody'.format(i), file=f)
+        index = core.load_index(content_dir)
+
+        with mock.patch('slipstream.core.PostCache',
+                        wraps=core.PostCache) as fake_post_cache:
+            core.generate_index(content_dir=content_dir,
+                                output_dir=output_dir, index=index)
+            core.generate_tag_page(tag='x', content_dir=content_dir,
+                                   output_dir=output_dir, index=index)
+            core.generate_rss(content_dir=content_dir, output_dir=output_dir,
+                              index=index)
+
+    assert fake_post_cache.call_count == 3
+
+
+def test_post_cache_should_be_shared_by_nested_blocks():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            mock.patch.dict(core.config,
+                            {'POST_CACHE': os.path.join(content_dir,
+                                                        '.cache')}):
+        with core.post_cache(content_dir) as cache:
+            with core.post_cache(content_dir) as nested:
+                assert nested is cache
+        with core.post_cache(content_dir) as other:
+            assert other is not cache
+
+    with mock.patch.dict(core.config, {'POST_CACHE': None}):
+        with core.post_cache('.') as cache:
+            assert cache is None
+
+
+def test_listing_pages_should_load_each_post_once():
+    index = core.PostIndex([core.PostMeta.from_post(post, path=None)
+                            for post in make_posts(3)])
+    template = core.get_env().from_string(
+        '{% for post in posts %}{{ post.title }}{{ post.content }}'
+        '{{ post.excerpt }}{% endfor %}'
+    )
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.object(core.PostMeta, 'load',
+                              side_effect=make_posts(3)) as fake_load, \
+            mock.patch.object(core.get_env(), 'get_template',
+                              return_value=template):
+        core.generate_index(content_dir=None, output_dir=output_dir,
+                            index=index)
+
+    assert fake_load.call_count == 3
+
+
+def test_regenerate_should_count_the_work_done_by_workers():
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as output_dir:
+        for i in range(4):
+            with open(os.path.join(content_dir, '{}.md'.format(i)), 'w') as f:
+                print('Title: post {}\n\nBody'.format(i), file=f)
+
+        with core.metrics.tally() as tally:
+            core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                            workers=2)
+
+    # 4 posts and the index.
+    assert tally.counters['pages_written'] == 5
+    assert tally.counters['posts_loaded'] == 4
+    assert tally.phases['regenerate'][0] == 1
+
+
+def test_precompiled_templates_should_not_be_compiled_again():
+    with tempfile.TemporaryDirectory() as cache_dir, \
+            mock.patch.object(core.env, 'bytecode_cache'):
+        core.use_bytecode_cache(cache_dir)
+        names = core.precompile_templates()
+
+        assert {'index.html', 'post.html', 'template/post.html'} <= set(names)
+        assert os.listdir(cache_dir)
+
+        # A new process, or a worker, with the same cache.
+        fresh = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(core.THEME_DIR),
+            bytecode_cache=jinja2.FileSystemBytecodeCache(cache_dir),
+        )
+        with mock.patch.object(fresh, 'compile') as fake_compile:
+            for name in names:
+                fresh.get_template(name)
+
+        assert fake_compile.call_count == 0
+    core.env.cache.clear()
+
+
+def test_publish_should_update_the_feeds_without_loading_other_posts():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'CONTENT_DIR': content_dir,
+                                          'OUTPUT_DIR': output_dir,
+                                          'FEED_SIZE': 3}):
+        for day in range(1, 6):
+            with open(os.path.join(content_dir, '{}.md'.format(day)), 'w') as f:
+                f.write('Title: post {0}\nDate: 2010-08-{0:02}\n\nBody'.format(
+                    day
+                ))
+        core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                        workers=1)
+
+        with mock.patch.object(core.PostMeta, 'load') as fake_load, \
+                mock.patch('slipstream.core.generate_index'):
+            core.publish(title='post 6', author='fnord@example.com',
+                         content='Newest', date='2010-08-06')
+
+        assert fake_load.call_count == 0
+        for read, feed in ((core.feeds.read_rss, 'rss.xml'),
+                           (core.feeds.read_atom, 'atom.xml')):
+            entries = read(os.path.join(output_dir, feed))
+            assert [entry.title for entry in entries] == \
+                ['post 6', 'post 5', 'post 4']
+            assert entries[0].content == '<p>Newest</p>\n'
+
+
+def test_publish_should_generate_the_feed_again_when_a_post_drops_out():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'CONTENT_DIR': content_dir,
+                                          'OUTPUT_DIR': output_dir,
+                                          'FEED_SIZE': 2}):
+        for day in range(1, 4):
+            core.publish(title='post {}'.format(day),
+                         author='fnord@example.com', content='Body',
+                         date='2010-08-{:02}'.format(day))
+
+        # Moving post 3 back in time brings post 1 back into the feed.
+        core.publish(title='post 3', author='fnord@example.com',
+                     content='Body', date='2010-07-01')
+
+        entries = core.feeds.read_rss(os.path.join(output_dir, 'rss.xml'))
+        assert [entry.title for entry in entries] == ['post 2', 'post 1']
+
+
+def test_regenerate_should_write_compressed_copies_of_changed_pages():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'COMPRESS': ['gzip'],
+                                          'WORKERS': 1}):
+        with open(os.path.join(content_dir, 'fnord.md'), 'w') as f:
+            f.write('Title: Fnord\nTags: x\n\nHello')
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+
+        for name in ('index.html', 'fnord.html', 'tag/x.html', 'rss.xml',
+                     'atom.xml'):
+            path = os.path.join(output_dir, name)
+            with open(path, 'rb') as f, gzip.open(path + '.gz') as gz:
+                assert gz.read() == f.read()
+
+        with mock.patch('slipstream.compress.compress') as fake_compress:
+            core.regenerate(content_dir=content_dir, output_dir=output_dir)
+        assert fake_compress.call_count == 0
+
+
+class AnHourLater(datetime.datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.datetime.now(tz) + datetime.timedelta(hours=1)
+
+
+@pytest.mark.parametrize('post_cache', [False, True])
+def test_a_second_build_of_a_post_without_a_date_should_write_nothing(
+        post_cache):
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config,
+                            {'COMPRESS': ['gzip'], 'WORKERS': 1,
+                             'POST_CACHE': (os.path.join(output_dir, '.cache')
+                                            if post_cache else None)}):
+        with open(os.path.join(content_dir, 'fnord.md'), 'w') as f:
+            f.write('Title: Fnord\nTags: x\n\nHello')
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+
+        with mock.patch('slipstream.core.datetime', AnHourLater), \
+                core.metrics.tally() as tally:
+            core.regenerate(content_dir=content_dir, output_dir=output_dir)
+            meta, = core.get_index(content_dir).posts
+            assert meta.load().publish_timestamp == meta.publish_timestamp
+
+    assert 'bytes_written' not in tally.counters
+    assert 'pages_written' not in tally.counters
+
+
+def test_removing_a_page_should_remove_its_compressed_copy():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'COMPRESS': ['gzip'],
+                                          'WORKERS': 1}):
+        path = os.path.join(content_dir, 'fnord.md')
+        with open(path, 'w') as f:
+            f.write('Title: Fnord\nTags: x\n\nHello')
+        core.regenerate(content_dir=content_dir, output_dir=output_dir)
+        index = core.get_index(content_dir)
+
+        core.remove_post(index.get('fnord'), index=index,
+                         content_dir=content_dir, output_dir=output_dir)
+
+        assert not os.path.exists(os.path.join(output_dir, 'fnord.html.gz'))
+        assert not os.path.exists(os.path.join(output_dir, 'tag',
+                                               'x.html.gz'))
+
+
+def test_publish_should_only_update_the_search_shards_of_the_post():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'CONTENT_DIR': content_dir,
+                                          'OUTPUT_DIR': output_dir,
+                                          'SEARCH': True}):
+        for day, word in enumerate(['alpha', 'beta', 'gamma'], 1):
+            path = os.path.join(content_dir, 'post-{}.md'.format(day))
+            with open(path, 'w') as f:
+                f.write('Title: post {}\nDate: 2010-08-{:02}\n\n{}'.format(
+                    day, day, word
+                ))
+        core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                        workers=1)
+        search_dir = os.path.join(output_dir, 'search')
+        with open(os.path.join(search_dir, 'posts.json')) as f:
+            ids = {post[0]: id
+                   for id, post in enumerate(json.load(f)['posts'])}
+
+        with mock.patch('slipstream.search.terms',
+                        wraps=core.search.terms) as fake_terms, \
+                mock.patch.object(core.PostMeta, 'load') as fake_load, \
+                mock.patch('slipstream.core.generate_index'):
+            core.publish(title='post 2', author='fnord@example.com',
+                         content='Delta', date='2010-08-02')
+
+        assert fake_terms.call_count == 1
+        assert fake_load.call_count == 0
+        assert not os.path.exists(os.path.join(search_dir, 'be.json'))
+        with open(os.path.join(search_dir, 'de.json')) as f:
+            assert json.load(f) == {'delta': [ids['post-2']]}
+        with open(os.path.join(search_dir, 'po.json')) as f:
+            assert json.load(f) == {'post': sorted(ids.values())}
+
+
+def test_remove_post_should_remove_it_from_the_search_index():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(core.config, {'SEARCH': True}):
+        for name in ('fnord', 'other'):
+            with open(os.path.join(content_dir, name + '.md'), 'w') as f:
+                f.write('Title: {0}\n\nAll about {0}'.format(name))
+        core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                        workers=1)
+        index = core.load_index(content_dir)
+
+        core.remove_post(index.get('fnord'), index=index,
+                         content_dir=content_dir, output_dir=output_dir)
+
+        search_dir = os.path.join(output_dir, 'search')
+        assert not os.path.exists(os.path.join(search_dir, 'fn.json'))
+        with open(os.path.join(search_dir, 'posts.json')) as f:
+            posts = json.load(f)['posts']
+        assert None in posts
+        assert [post[0] for post in posts if post] == ['other']
+
+
+@pytest.mark.parametrize('feed', ['generate_rss', 'generate_atom'])
+def test_remove_post_should_generate_the_feeds_holding_the_index_lock(feed):
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir:
+        for name in ('fnord', 'other'):
+            with open(os.path.join(content_dir, name + '.md'), 'w') as f:
+                f.write('Title: {0}\n\nAll about {0}'.format(name))
+        core.regenerate(content_dir=content_dir, output_dir=output_dir,
+                        workers=1)
+        index = core.load_index(content_dir)
+        held = []
+
+        with mock.patch('slipstream.core.' + feed,
+                        side_effect=lambda **kwargs:
+                        held.append(index.lock._is_owned())):
+            core.remove_post(index.get('fnord'), index=index,
+                             content_dir=content_dir, output_dir=output_dir)
+
+        assert held == [True]
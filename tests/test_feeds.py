@@ -0,0 +1,59 @@
+import datetime
+import io
+import os
+import tempfile
+
+import pytest
+
+from slipstream import feeds
+
+
+def make_entry(day, title=None, **kwargs):
+    return feeds.FeedEntry(id='/post-{}.html'.format(day),
+                           title=title or 'Post {}'.format(day),
+                           link='/post-{}.html'.format(day),
+                           author='fnord@example.com',
+                           published=datetime.datetime(2010, 8, day, 9, 23),
+                           content='<p>Post number {} &amp; more</p>'.format(
+                               day
+                           ),
+                           **kwargs)
+
+
+@pytest.mark.parametrize('write, read', [(feeds.write_rss, feeds.read_rss),
+                                         (feeds.write_atom, feeds.read_atom)])
+def test_feeds_should_read_back_what_was_written(write, read):
+    updated = datetime.datetime(2010, 8, 20, 12, 0)
+    entries = [make_entry(2, updated=updated), make_entry(1)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, 'feed.xml')
+        with open(path, 'w', encoding='utf-8') as f:
+            write(f, entries, title='A <blog>', link='http://example.com')
+
+        actual = read(path)
+
+    assert len(actual) == 2
+    for attr in ('id', 'title', 'link', 'author', 'published', 'content'):
+        assert ([getattr(entry, attr) for entry in actual] ==
+                [getattr(entry, attr) for entry in entries])
+    if read is feeds.read_atom:
+        assert [entry.updated for entry in actual] == [updated, None]
+
+
+def test_write_atom_should_escape_html_content():
+    out = io.StringIO()
+    feeds.write_atom(out, [make_entry(1)], title='Blog', link='')
+
+    assert ('<content type="html">&lt;p&gt;Post number 1 &amp;amp; more'
+            '&lt;/p&gt;</content>') in out.getvalue()
+
+
+def test_merge_entries_should_replace_the_entry_and_keep_the_newest():
+    entries = [make_entry(day) for day in (5, 4, 3)]
+    edited = make_entry(4, title='Edited')
+
+    merged = feeds.merge_entries(entries, edited, 3)
+    assert [entry.title for entry in merged] == ['Post 5', 'Edited', 'Post 3']
+
+    merged = feeds.merge_entries(merged, make_entry(6), 3)
+    assert [entry.title for entry in merged] == ['Post 6', 'Post 5', 'Edited']
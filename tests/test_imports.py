@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Microseconds that importing each module may take, as measured by
+# ``python -X importtime``. They're a few times what it takes on a laptop,
+# so that only a heavy new import at module level goes over.
+IMPORT_BUDGETS = {
+    'slipstream.core': 150000,
+    'slipstream.cli': 200000,
+}
+
+# Only imported once they're used.
+LAZY_MODULES = ('CommonMark', 'jinja2', 'flask', 'tornado', 'urllib.request',
+                'xml.sax.saxutils', 'email.utils', 'concurrent.futures',
+                'html.parser')
+
+
+def run_python(*args, cwd=None):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('SLIPSTREAM_API_KEY', None)
+    env.pop('SLIPSTREAM_API_KEYFILE', None)
+    return subprocess.run([sys.executable] + list(args), cwd=cwd, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+def import_time(module):
+    '''
+    Return the microseconds ``python -X importtime`` reports for importing
+    ``module`` and everything it imports.
+    '''
+    # Once to write the bytecode, so that compiling it isn't measured.
+    run_python('-c', 'import ' + module)
+    stderr = run_python('-X', 'importtime', '-c', 'import ' + module).stderr
+    for line in stderr.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise AssertionError('No import time for {!r} in {!r}'.format(module,
+                                                                  stderr))
+
+
+@pytest.mark.parametrize('module', sorted(IMPORT_BUDGETS))
+def test_import_should_stay_within_its_budget(module):
+    assert import_time(module) <= IMPORT_BUDGETS[module]
+
+
+@pytest.mark.parametrize('module', ['slipstream.core', 'slipstream.cli',
+                                    'slipstream.build'])
+def test_import_should_not_load_the_markdown_template_or_web_stacks(module):
+    script = ('import sys, {}\n'
+              'print(" ".join(name for name in {!r} if name in sys.modules))'
+              .format(module, LAZY_MODULES))
+    assert run_python('-c', script).stdout.split() == []
+
+
+def test_importing_the_web_app_should_not_create_an_api_key():
+    with tempfile.TemporaryDirectory() as cwd:
+        run_python('-c', 'import slipstream.slipstream', cwd=cwd)
+
+        assert not os.path.exists(os.path.join(cwd, '.slipstream_api_key'))
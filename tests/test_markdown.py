@@ -0,0 +1,105 @@
+import logging
+from unittest import mock
+
+import pytest
+
+from slipstream import config
+from slipstream import core
+from slipstream import markdown
+
+# The Markdown that posts use, from plain paragraphs to raw HTML.
+CORPUS = [
+    'A paragraph with *emphasis*, **strong** and `code`.\n',
+    '# Title\n\n## Section\n\nText under it.\n',
+    'Setext heading\n==============\n\nAnd another\n-----------\n',
+    '- one\n- two\n- three\n',
+    '- loose\n\n- list\n',
+    '1. first\n2. second\n\n3) other\n',
+    '- outer\n    - inner\n    - items\n',
+    '    indented code\n    <with> & escapes\n\nAfter the code.\n',
+    '```python\ndef fnord():\n    return 42\n```\n',
+    '> A quote\n> over lines\n\n> > nested\n',
+    'See [the docs](http://example.com/?a=1&b=2 "Title") and'
+    ' <http://example.com>.\n',
+    '![An image](/img/fnord.png "Fnord")\n',
+    'Line with a hard  \nbreak and a soft\nbreak.\n',
+    '***\n\n---\n',
+    '<div class="note">\nRaw *HTML* block\n</div>\n\n'
+    'Inline <span>html</span>.\n',
+    'Entities: &copy; &amp; &#35; "quotes" \'single\' <3 a > b\n',
+    '[ref]: http://example.com/ref\n\nA [reference][ref] link.\n',
+    'Escaped \\*stars\\* and a_b_c.\n',
+]
+
+OTHER_BACKENDS = sorted(set(markdown.BACKENDS) - {markdown.DEFAULT})
+
+
+def installed(name):
+    try:
+        return markdown.BACKENDS[name]()
+    except ImportError as e:
+        pytest.skip('{} is not installed: {}'.format(name, e))
+
+
+@pytest.mark.parametrize('name', OTHER_BACKENDS)
+def test_backends_should_render_the_corpus_like_the_default(name):
+    renderer = installed(name)
+    default = markdown.get(markdown.DEFAULT)
+
+    for text in CORPUS:
+        assert (markdown.canonical(renderer.render(text))
+                == markdown.canonical(default.render(text))), text
+
+
+@pytest.mark.parametrize('name', sorted(markdown.BACKENDS))
+def test_backends_should_have_an_id_with_their_name(name):
+    assert installed(name).id.startswith(name + '-')
+
+
+def test_canonical_should_ignore_how_the_html_is_written():
+    assert (markdown.canonical('<ul><li><p>a &quot;b&quot;</p></li></ul>'
+                               '<hr />\n<p><a title="t" href="x">c\n</a></p>')
+            == markdown.canonical('<ul>\n<li>\n<p>a "b"</p>\n</li>\n</ul>\n'
+                                  '<hr>\n<p><a href="x" title="t">c</a></p>'))
+
+
+def test_canonical_should_not_ignore_what_changes_the_page():
+    assert (markdown.canonical('<p><em>a</em></p>')
+            != markdown.canonical('<p><strong>a</strong></p>'))
+    assert (markdown.canonical('<pre><code>a\nb</code></pre>')
+            != markdown.canonical('<pre><code>a b</code></pre>'))
+
+
+def test_get_should_fall_back_to_the_default_with_a_warning(caplog):
+    with mock.patch.dict(markdown._renderers, clear=True), \
+            caplog.at_level(logging.WARNING, logger='slipstream.markdown'):
+        renderer = markdown.get('fnord')
+        assert markdown.get('fnord') is renderer
+
+    assert renderer.name == markdown.DEFAULT
+    assert len(caplog.records) == 1
+    assert 'fnord' in caplog.records[0].getMessage()
+
+
+def test_cache_version_should_change_with_the_renderer():
+    fake = mock.Mock(id='fake-1.0')
+    with mock.patch.object(core, 'markdown_renderer', return_value=fake):
+        assert core.cache_version() == core.FORMAT_VERSION + ':fake-1.0'
+
+
+def test_render_cache_should_keep_the_html_of_each_renderer_apart():
+    cache = core.RenderCache()
+    first = mock.Mock(id='first-1', **{'render.return_value': 'one'})
+    second = mock.Mock(id='second-1', **{'render.return_value': 'two'})
+    with mock.patch.dict(config, {'RENDER_STORE': None}), \
+            mock.patch.dict(markdown._renderers, {'first': first,
+                                                  'second': second}):
+        config['MARKDOWN'] = 'first'
+        assert cache.render('Fnord') == 'one'
+        config['MARKDOWN'] = 'second'
+        assert cache.render('Fnord') == 'two'
+        config['MARKDOWN'] = 'first'
+        assert cache.render('Fnord') == 'one'
+
+    assert first.render.call_count == 1
+    assert second.render.call_count == 1
@@ -0,0 +1,67 @@
+import pickle
+import threading
+from unittest import mock
+
+import pytest
+
+from slipstream import metrics
+
+
+@pytest.fixture
+def registry():
+    return metrics.Metrics()
+
+
+def test_render_should_include_every_counter_and_timed_phase(registry):
+    registry.inc('pages_written', 3)
+    registry.inc('bytes_written', 1024)
+    registry.observe('render', 0.5)
+    registry.observe('render', 0.25)
+
+    text = registry.render()
+
+    assert '# TYPE slipstream_pages_written_total counter\n' in text
+    assert '\nslipstream_pages_written_total 3\n' in text
+    assert '\nslipstream_bytes_written_total 1024\n' in text
+    assert '\nslipstream_posts_parsed_total 0\n' in text
+    assert '\nslipstream_phase_seconds_sum{phase="render"} 0.75\n' in text
+    assert '\nslipstream_phase_seconds_count{phase="render"} 2\n' in text
+
+
+def test_tally_should_only_count_this_thread(registry):
+    with registry.tally() as tally:
+        registry.inc('pages_written')
+        thread = threading.Thread(target=registry.inc,
+                                  args=('pages_written',))
+        thread.start()
+        thread.join()
+
+    assert tally.counters['pages_written'] == 1
+    assert registry.snapshot().counters['pages_written'] == 2
+
+
+def test_merge_should_add_a_pickled_tally(registry):
+    other = metrics.Metrics()
+    with other.tally() as tally:
+        with other.timer('markdown'):
+            other.inc('render_cache_misses')
+
+    registry.merge(pickle.loads(pickle.dumps(tally)))
+
+    snapshot = registry.snapshot()
+    assert snapshot.counters['render_cache_misses'] == 1
+    assert snapshot.phases['markdown'][0] == 1
+
+
+def test_build_should_log_what_the_build_did(registry):
+    registry.inc('pages_written', 100)
+    with mock.patch.object(metrics.logger, 'info') as fake_info:
+        with registry.build('publish', slug='a post'):
+            registry.inc('pages_written', 2)
+            registry.observe('write', 0.125)
+
+    line, = fake_info.call_args[0]
+    assert line.startswith('build=publish slug="a post" seconds=')
+    assert ' pages_written=2 ' in line
+    assert line.endswith(' write_seconds=0.125')
+    assert registry.snapshot().phases['publish'][0] == 1
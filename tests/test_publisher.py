@@ -0,0 +1,81 @@
+import os
+import tempfile
+import threading
+from unittest import mock
+from slipstream.publisher import PublishQueue
+
+
+def test_put_should_not_publish_until_drained():
+    publish = mock.Mock()
+    queue = PublishQueue(publish=publish)
+    queue.put('doc', title='a title')
+
+    assert publish.call_count == 0
+    assert queue.drain() == 1
+    publish.assert_called_once_with(title='a title')
+    assert len(queue) == 0
+
+
+def test_jobs_for_different_documents_should_be_published_in_order():
+    publish = mock.Mock()
+    queue = PublishQueue(publish=publish)
+    queue.put('one', title='one')
+    queue.put('two', title='two')
+    queue.put('one', title='one again')
+    queue.drain()
+
+    assert [call[1]['title'] for call in publish.call_args_list] == ['two', 'one again']
+
+
+def test_queued_jobs_should_survive_a_restart():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'queue.sqlite')
+        PublishQueue(path, publish=mock.Mock()).put('doc', title='a title')
+
+        publish = mock.Mock()
+        PublishQueue(path, publish=publish).drain()
+
+    publish.assert_called_once_with(title='a title')
+
+
+def test_failed_jobs_should_be_dropped():
+    queue = PublishQueue(publish=mock.Mock(side_effect=ValueError))
+    queue.put('doc', title='a title')
+    queue.drain()
+
+    assert len(queue) == 0
+
+
+def test_started_queue_should_publish_in_the_background():
+    published = threading.Event()
+    queue = PublishQueue(publish=lambda **kwargs: published.set(), delay=0)
+    queue.start()
+    try:
+        queue.put('doc', title='a title')
+        assert published.wait(timeout=5)
+    finally:
+        queue.stop()
+
+
+def test_a_job_queued_while_looking_for_jobs_should_not_be_missed():
+    published = threading.Event()
+    queue = PublishQueue(publish=lambda **kwargs: published.set(), delay=0)
+    queue.poll_interval = 60
+    next_job = queue._next
+    putter = threading.Thread(target=queue.put, args=('doc',),
+                              kwargs={'title': 'a title'})
+
+    def fake_next(**kwargs):
+        # Queue the job right after the worker found there was none.
+        job = next_job(**kwargs)
+        if job is None and putter.ident is None:
+            putter.start()
+            putter.join(timeout=0.1)
+        return job
+
+    with mock.patch.object(queue, '_next', side_effect=fake_next):
+        queue.start()
+        try:
+            assert published.wait(timeout=5)
+        finally:
+            queue.stop()
@@ -0,0 +1,131 @@
+import collections
+import datetime
+import json
+import os
+import tempfile
+from unittest import mock
+
+import pytest
+
+from slipstream import search
+
+
+FakePost = collections.namedtuple('FakePost', 'slug title tags raw_content'
+                                               ' publish_timestamp')
+
+
+def make_post(slug, body, title=None, tags=(), day=14):
+    return FakePost(slug, title or slug.title(), list(tags), body,
+                    datetime.datetime(2010, 8, day, 9, 23))
+
+
+def write(path, write_to):
+    with open(path, 'w', encoding='utf-8') as f:
+        write_to(f)
+
+
+def read(directory, name):
+    with open(os.path.join(directory, name + '.json'),
+              encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def directory():
+    with tempfile.TemporaryDirectory() as output_dir:
+        yield os.path.join(output_dir, search.DIRECTORY)
+
+
+def test_terms_should_be_the_lower_cased_words_without_markup():
+    post = make_post('fnord', 'The *Python* [docs](http://example.com/x)'
+                              ' <span class="y">and_more</span> 42 a',
+                     title='Static Sites', tags=['Web'])
+
+    assert search.terms(post) == {'static', 'sites', 'web', 'the', 'python',
+                                  'docs', 'and', 'more', '42'}
+
+
+def test_save_should_write_shards_of_posting_lists_and_the_posts(directory):
+    index = search.SearchIndex(directory)
+    index.add(make_post('one', 'Python static sites'))
+    index.add(make_post('two', 'Python webhooks', day=15))
+    index.save(write)
+
+    assert read(directory, 'py') == {'python': [0, 1]}
+    assert read(directory, 'st') == {'static': [0]}
+    assert read(directory, 'we') == {'webhooks': [1]}
+    assert read(directory, 'posts') == {
+        'version': 1, 'prefix': 2,
+        'posts': [['one', 'One', '2010-08-14'], ['two', 'Two', '2010-08-15']],
+    }
+
+
+def test_load_should_read_back_what_was_saved(directory):
+    index = search.SearchIndex(directory)
+    index.add(make_post('one', 'Python'))
+    index.save(write)
+
+    loaded = search.SearchIndex.load(directory)
+
+    assert loaded.posts == index.posts
+    assert loaded.post_shards == [['on', 'py']]
+    assert 'one' in loaded
+
+
+def test_load_should_return_None_without_an_index(directory):
+    assert search.SearchIndex.load(directory) is None
+
+
+def test_updating_a_post_should_only_touch_its_old_and_new_shards(directory):
+    index = search.SearchIndex(directory)
+    index.add(make_post('one', 'Python static sites'))
+    index.add(make_post('two', 'Draft webhooks'))
+    index.save(write)
+
+    written = []
+    with mock.patch('slipstream.search.terms',
+                    wraps=search.terms) as fake_terms:
+        index = search.SearchIndex.load(directory)
+        index.add(make_post('one', 'Python feeds'))
+        index.save(lambda path, write_to: written.append(
+            os.path.basename(path)) or write(path, write_to))
+
+    # Only the new version of the post was tokenized.
+    assert fake_terms.call_count == 1
+    assert sorted(written) == ['.shards.json', 'fe.json', 'on.json',
+                               'posts.json', 'py.json']
+    assert not os.path.exists(os.path.join(directory, 'st.json'))
+    assert not os.path.exists(os.path.join(directory, 'si.json'))
+    assert read(directory, 'fe') == {'feeds': [0]}
+    assert read(directory, 'dr') == {'draft': [1]}
+
+
+def test_remove_should_free_the_id_for_the_next_post(directory):
+    index = search.SearchIndex(directory)
+    index.add(make_post('one', 'Python'))
+    index.add(make_post('two', 'Python'))
+    index.save(write)
+
+    index = search.SearchIndex.load(directory)
+    assert index.remove('one')
+    assert not index.remove('one')
+    index.add(make_post('three', 'Static'))
+    index.save(write)
+
+    assert [post[0] for post in read(directory, 'posts')['posts']] == \
+        ['three', 'two']
+    assert read(directory, 'py') == {'python': [1]}
+    assert read(directory, 'st') == {'static': [0]}
+
+
+def test_a_new_index_should_replace_the_old_shards(directory):
+    index = search.SearchIndex(directory)
+    index.add(make_post('one', 'Python'))
+    index.save(write)
+
+    index = search.SearchIndex(directory)
+    index.add(make_post('one', 'Static'))
+    index.save(write)
+
+    assert sorted(os.listdir(directory)) == ['.shards.json', 'on.json',
+                                             'posts.json', 'st.json']
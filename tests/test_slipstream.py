@@ -32,6 +32,7 @@ def client():
 
 
 def test_client_should_use_api_key():
+    assert slipstream.api_key() == API_KEY
     assert slipstream.app.config['API_KEY'] == API_KEY
 
 
@@ -60,7 +61,9 @@ def test_post_should_pass_payload_to_core_publish(client):
             'payload': json.dumps(payload),
         })
 
-        assert rv.status_code == 200
+        assert rv.status_code == 202
+        assert fake_publish.call_count == 0
+        slipstream.get_publish_queue().drain()
         fake_publish.assert_called_with(
             id=expected_id,
             title=expected_title,
@@ -82,6 +85,7 @@ def test_publish_should_put_post_in_content_directory(client):
         rv = client.post('/{}'.format(API_KEY), data={
             'payload': json.dumps(SIMPLE_PAYLOAD),
         })
+        slipstream.get_publish_queue().drain()
 
         assert slipstream.core.slugify(SIMPLE_PAYLOAD['name'])+'.md' in os.listdir(content_dir)
 
@@ -99,5 +103,66 @@ def test_publish_should_put_post_in_content_directory(client):
         rv = client.post('/{}'.format(API_KEY), data={
             'payload': json.dumps(SIMPLE_PAYLOAD),
         })
+        slipstream.get_publish_queue().drain()
 
         assert slipstream.core.slugify(SIMPLE_PAYLOAD['name'])+'.md' in os.listdir(content_dir)
+
+
+def test_preview_should_not_regenerate_the_site(client):
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as output_dir,  \
+         mock.patch.dict(slipstream.app.config,
+                         {'OUTPUT_DIR': output_dir,
+                          'CONTENT_DIR': content_dir,
+                         }),                           \
+         mock.patch('slipstream.core.regenerate') as fake_regenerate:
+        with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+            f.write('This is the index')
+
+        rv = client.get('/preview')
+
+        assert rv.status_code == 200
+        assert rv.data == b'This is the index'
+        assert fake_regenerate.call_count == 0
+
+
+def test_preview_should_not_render_outside_of_the_output_dir(client):
+    with tempfile.TemporaryDirectory() as content_dir, \
+         tempfile.TemporaryDirectory() as parent_dir,   \
+         mock.patch.dict(slipstream.app.config,
+                         {'OUTPUT_DIR': os.path.join(parent_dir, 'output'),
+                          'CONTENT_DIR': content_dir,
+                         }),                           \
+         mock.patch('slipstream.core.generate_tag_page') as fake_gen_tag_page:
+        with open(os.path.join(parent_dir, 'victim.html'), 'w') as f:
+            f.write('Not a page')
+        slipstream.get_preview().generation += 1
+
+        rv = client.get('/preview/tag/%2e%2e/%2e%2e/victim.html')
+
+        assert rv.status_code == 404
+        assert fake_gen_tag_page.call_count == 0
+        assert os.path.exists(os.path.join(parent_dir, 'victim.html'))
+
+
+def test_posting_the_same_document_repeatedly_should_publish_it_once(client):
+    with mock.patch('slipstream.core.publish') as fake_publish:
+        for content in ('first', 'second', 'third'):
+            payload = dict(SIMPLE_PAYLOAD, content=content)
+            rv = client.post('/{}'.format(API_KEY), data={
+                'payload': json.dumps(payload),
+            })
+            assert rv.status_code == 202
+
+        slipstream.get_publish_queue().drain()
+
+        assert fake_publish.call_count == 1
+        assert fake_publish.call_args[1]['content'] == 'third'
+
+
+def test_metrics_should_be_served_in_the_prometheus_text_format(client):
+    rv = client.get('/metrics')
+
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/plain'
+    assert b'# TYPE slipstream_pages_written_total counter' in rv.data
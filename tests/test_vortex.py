@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+from unittest import mock
+from urllib.parse import urlencode
+
+from tornado.testing import AsyncHTTPTestCase
+
+API_KEY = 'fnord'
+os.environ['SLIPSTREAM_API_KEY'] = API_KEY
+
+from slipstream import slipstream
+from slipstream import vortex
+
+SIMPLE_PAYLOAD = dict(
+        id=42,
+        name='This is a cool title',
+        content='This is a blog post\nAnd it is *soo* cool',
+        content_html='<html><h2>This is some markdown</h2></html>',
+        user={'id': 42, 'email': 'test@example.com'},
+        created_at='2010-08-14T09:23:12-05:00',
+        updated_at='2010-08-14T09:23:12-05:00',
+)
+
+
+class VortexTest(AsyncHTTPTestCase):
+    def setUp(self):
+        self.content_dir = tempfile.TemporaryDirectory()
+        self.output_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.dict(slipstream.app.config,
+                                  {'CONTENT_DIR': self.content_dir.name,
+                                   'OUTPUT_DIR': self.output_dir.name,
+                                   'API_KEY': API_KEY,
+                                   })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.content_dir.cleanup)
+        self.addCleanup(self.output_dir.cleanup)
+        super().setUp()
+
+    def get_app(self):
+        return vortex.make_app()
+
+    def post_payload(self, api_key, payload):
+        return self.fetch('/{}'.format(api_key), method='POST',
+                          body=urlencode({'payload': json.dumps(payload)}))
+
+    def test_webhook_should_fail_if_api_key_is_wrong(self):
+        response = self.post_payload(API_KEY+'-invalid', SIMPLE_PAYLOAD)
+        assert response.code == 403
+
+    def test_webhook_should_queue_the_post_and_return_202(self):
+        with mock.patch('slipstream.core.publish') as fake_publish:
+            response = self.post_payload(API_KEY, SIMPLE_PAYLOAD)
+
+            assert response.code == 202
+            assert fake_publish.call_count == 0
+            slipstream.get_publish_queue().drain()
+            fake_publish.assert_called_with(
+                id=SIMPLE_PAYLOAD['id'],
+                title=SIMPLE_PAYLOAD['name'],
+                content=SIMPLE_PAYLOAD['content'],
+                author=SIMPLE_PAYLOAD['user']['email'],
+            )
+
+    def test_preview_should_serve_the_index_from_the_output_dir(self):
+        with open(os.path.join(self.output_dir.name, 'index.html'), 'w') as f:
+            f.write('This is the index')
+
+        for url in ('/preview', '/preview/', '/preview/index.html'):
+            response = self.fetch(url)
+            assert response.code == 200
+            assert response.body == b'This is the index'
+
+    def test_preview_should_404_for_missing_files(self):
+        response = self.fetch('/preview/no-such-post.html')
+        assert response.code == 404
+
+    def test_preview_should_not_render_outside_of_the_output_dir(self):
+        with mock.patch('slipstream.core.generate_tag_page') \
+                as fake_gen_tag_page:
+            slipstream.get_preview().generation += 1
+            response = self.fetch('/preview/tag/%2e%2e/%2e%2e/victim.html')
+
+        assert response.code in (403, 404)
+        assert fake_gen_tag_page.call_count == 0
+
+    def test_metrics_should_be_served_natively(self):
+        response = self.fetch('/metrics')
+        assert response.code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert b'slipstream_pages_rendered_total' in response.body
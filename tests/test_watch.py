@@ -0,0 +1,145 @@
+import os
+import tempfile
+import textwrap
+from unittest import mock
+
+import pytest
+
+from slipstream import config
+from slipstream import core
+from slipstream import watch
+
+
+class FakeEvents:
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    def read(self, timeout=None):
+        return set(self.batches.pop(0)) if self.batches else set()
+
+
+@pytest.fixture
+def site():
+    with tempfile.TemporaryDirectory() as content_dir, \
+            tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch.dict(config,
+                            {'CONTENT_DIR': content_dir,
+                             'OUTPUT_DIR': output_dir,
+                             'DEFAULT_AUTHOR': 'fnord@example.com',
+                             'POST_TEMPLATE': core.env.get_template('post.html'),
+                            }, clear=True):
+        yield watch.Watcher(content_dir=content_dir, output_dir=output_dir,
+                            events=FakeEvents())
+
+
+def write_post(content_dir, name, title, tags):
+    path = os.path.join(content_dir, name)
+    with open(path, 'w') as f:
+        f.write(textwrap.dedent('''\
+            Title: {}
+            Date: 2010-08-14 09:23
+            Tags: {}
+
+            The body of {}.
+            ''').format(title, tags, title))
+    return path
+
+
+def test_polling_events_should_report_created_changed_and_removed_files():
+    with tempfile.TemporaryDirectory() as content_dir:
+        path = os.path.join(content_dir, 'post.md')
+        events = watch.PollingEvents([content_dir], interval=0.01)
+
+        with open(path, 'w') as f:
+            f.write('one')
+        assert events.read(timeout=1) == {path}
+
+        with open(path, 'w') as f:
+            f.write('two, longer')
+        assert events.read(timeout=1) == {path}
+
+        os.remove(path)
+        assert events.read(timeout=1) == {path}
+        assert events.read(timeout=0.05) == set()
+
+
+def test_wait_should_collect_a_burst_of_changes_into_one_batch():
+    watcher = watch.Watcher(content_dir='.', output_dir='.',
+                            events=FakeEvents({'a'}, {'b'}, {'a', 'c'}, (),
+                                              {'d'}))
+
+    assert watcher.wait() == {'a', 'b', 'c'}
+    assert watcher.wait() == {'d'}
+
+
+def test_rebuild_should_update_the_changed_post_and_its_tag_pages(site):
+    path = write_post(site.content_dir, 'fnord.md', 'Fnord', 'old')
+    core.regenerate(content_dir=site.content_dir, output_dir=site.output_dir)
+    tag_dir = os.path.join(site.output_dir, 'tag')
+    assert os.path.exists(os.path.join(tag_dir, 'old.html'))
+
+    write_post(site.content_dir, 'fnord.md', 'Fnord', 'new')
+    with mock.patch('slipstream.core.regenerate') as fake_regenerate:
+        site.rebuild({path})
+
+    assert fake_regenerate.call_count == 0
+    assert not os.path.exists(os.path.join(tag_dir, 'old.html'))
+    assert os.path.exists(os.path.join(tag_dir, 'new.html'))
+    index = core.get_index(site.content_dir)
+    assert [post.title for post in index.tagged('new')] == ['Fnord']
+
+
+def test_rebuild_should_remove_the_page_of_a_removed_post(site):
+    path = write_post(site.content_dir, 'fnord.md', 'Fnord', 'gone')
+    write_post(site.content_dir, 'other.md', 'Other', 'kept')
+    core.regenerate(content_dir=site.content_dir, output_dir=site.output_dir)
+
+    os.remove(path)
+    site.rebuild({path})
+
+    assert not os.path.exists(os.path.join(site.output_dir, 'fnord.html'))
+    assert not os.path.exists(os.path.join(site.output_dir, 'tag',
+                                           'gone.html'))
+    with open(os.path.join(site.output_dir, 'index.html')) as f:
+        assert 'Fnord' not in f.read()
+    assert 'fnord' not in core.get_index(site.content_dir)
+
+
+def test_rebuild_should_drop_the_old_feed_entry_of_a_renamed_post(site):
+    path = write_post(site.content_dir, 'fnord.md', 'Fnord', 'x')
+    write_post(site.content_dir, 'other.md', 'Other', 'x')
+    core.regenerate(content_dir=site.content_dir, output_dir=site.output_dir)
+
+    write_post(site.content_dir, 'fnord.md', 'Renamed', 'x')
+    site.rebuild({path})
+
+    assert not os.path.exists(os.path.join(site.output_dir, 'fnord.html'))
+    for feed in ('rss.xml', 'atom.xml'):
+        with open(os.path.join(site.output_dir, feed)) as f:
+            text = f.read()
+        assert '/fnord.html' not in text
+        assert '/renamed.html' in text
+        assert '/other.html' in text
+
+
+def test_rebuild_should_ignore_files_that_are_not_posts(site):
+    core.load_index(site.content_dir)
+    path = os.path.join(site.content_dir, '.fnord.md.swp')
+    open(path, 'w').close()
+
+    assert site.rebuild({path}) == core.BuildReport()
+
+
+def test_rebuild_should_only_render_the_pages_that_use_a_changed_template(site):
+    write_post(site.content_dir, 'fnord.md', 'Fnord', 'x')
+    core.load_index(site.content_dir)
+    pagination = os.path.join(core.THEME_DIR, 'template', 'pagination.html')
+
+    with mock.patch('slipstream.core.generate_post_page') as fake_post_page, \
+            mock.patch('slipstream.core.generate_index') as fake_index, \
+            mock.patch('slipstream.core.generate_tag_page') as fake_tag_page:
+        site.rebuild({pagination})
+
+    assert fake_post_page.call_count == 0
+    assert fake_index.call_count == 1
+    assert [call[1]['tag'] for call in fake_tag_page.call_args_list] == ['x']